@@ -1,5 +1,9 @@
 from fastapi import APIRouter
 from .items import router as items_router
+from .jobs import router as jobs_router
+from .inbox import router as inbox_router
 
 router = APIRouter()
-router.include_router(items_router, prefix="/items", tags=["items"])
\ No newline at end of file
+router.include_router(items_router, prefix="/items", tags=["items"])
+router.include_router(jobs_router, prefix="/jobs", tags=["jobs"])
+router.include_router(inbox_router, prefix="/inbox", tags=["inbox"])
\ No newline at end of file
@@ -0,0 +1,18 @@
+# app/api/routes/inbox.py
+
+import asyncio
+from fastapi import APIRouter
+from app.services.dm_mirror import get_dm_mirror
+
+router = APIRouter()
+
+@router.get("/")
+async def inbox_stats():
+    """Per-account thread/message/reply counts from the local DM mirror"""
+    return await asyncio.to_thread(get_dm_mirror().stats)
+
+
+@router.get("/{account}/threads/{thread_id}")
+async def thread_history(account: str, thread_id: str, limit: int = 50):
+    messages = await asyncio.to_thread(get_dm_mirror().history, account, thread_id, limit)
+    return [{"username": m.username, "text": m.text, "timestamp": m.timestamp} for m in messages]
@@ -1,10 +1,11 @@
 # app/api/routes/items.py
 
-from fastapi import APIRouter, HTTPException
+import asyncio
+from fastapi import APIRouter, HTTPException, Response
 from app.api.schemas.item_schemas import DeleteItemRequest
+from app.core.config import settings
 from app.services.supabase_client import get_all_items, insert_item, delete_item
-
-from pipeline.end_to_end_pipeline import run_instagram_campaign, ProductPayload
+from app.services.job_queue import JobQueue
 
 router = APIRouter()
 
@@ -20,18 +21,26 @@ async def read_items():
     
 
 @router.post("/")
-async def create_item(item: dict):
+async def create_item(item: dict, response: Response):
     # INSERT INTO SUPABASE
     try:
         inserted = insert_item(item)
 
-        # RUN CAMPAIGN FOR THIS PRODUCT
-        payload = ProductPayload(
-            title=item["product"],
-            category=item["category"], 
-            price=str(item["price"]),
-            link=item["product_url"]
-        )
+        payload = {
+            "title": item["product"],
+            "category": item["category"], 
+            "price": str(item["price"]),
+            "link": item["product_url"]
+        }
+
+        if settings.WORKER_MODE:
+            # Hand the campaign to the worker pool so the API event loop stays free
+            job_id = await asyncio.to_thread(JobQueue().enqueue, "campaign", {"product_payload": payload})
+            response.headers["X-Campaign-Job-Id"] = str(job_id)
+            return inserted
+
+        # RUN CAMPAIGN FOR THIS PRODUCT (imported here - the pipeline pulls in langgraph/openai/MCP)
+        from pipeline.end_to_end_pipeline import run_instagram_campaign
 
         await run_instagram_campaign(payload)
 
@@ -0,0 +1,20 @@
+# app/api/routes/jobs.py
+
+import asyncio
+from dataclasses import asdict
+from fastapi import APIRouter, HTTPException
+from app.services.job_queue import JobQueue
+
+router = APIRouter()
+
+@router.get("/")
+async def queue_status():
+    return await asyncio.to_thread(JobQueue().counts)
+
+
+@router.get("/{job_id}")
+async def read_job(job_id: int):
+    job = await asyncio.to_thread(JobQueue().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return asdict(job)
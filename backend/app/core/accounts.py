@@ -0,0 +1,171 @@
+# app/core/accounts.py
+
+import asyncio
+import bisect
+import hashlib
+import sqlite3
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import AsyncIterator, Dict, List, Optional
+
+from app.core.config import settings
+
+VIRTUAL_NODES = 160
+
+
+@dataclass(frozen=True)
+class SenderAccount:
+    username: str
+    mcp_url: str
+    password: Optional[str] = None  # only needed for first instagrapi login (hashtag discovery)
+    daily_send_quota: int = 50
+
+
+class QuotaExceededError(RuntimeError):
+    pass
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class AccountRegistry:
+    """
+    The sender accounts we DM from. Targets are assigned with a consistent-hash ring, so a
+    user always lands on the same account (follow-ups and replies stay in one inbox) and
+    adding/removing an account only moves ~1/N of the targets.
+    """
+
+    def __init__(self, accounts: List[SenderAccount], virtual_nodes: int = VIRTUAL_NODES):
+        if not accounts:
+            raise ValueError("At least one sender account is required")
+        self.accounts: Dict[str, SenderAccount] = {a.username: a for a in accounts}
+        self._ring = sorted(
+            (_hash(f"{a.username}#{i}"), a.username) for a in accounts for i in range(virtual_nodes)
+        )
+        self._keys = [h for h, _ in self._ring]
+
+    @property
+    def default(self) -> SenderAccount:
+        return next(iter(self.accounts.values()))
+
+    def all(self) -> List[SenderAccount]:
+        return list(self.accounts.values())
+
+    def get(self, username: str) -> SenderAccount:
+        return self.accounts[username]
+
+    def account_for(self, target_username: str) -> SenderAccount:
+        i = bisect.bisect(self._keys, _hash(target_username.lstrip("@").lower())) % len(self._ring)
+        return self.accounts[self._ring[i][1]]
+
+
+@lru_cache(maxsize=None)
+def get_registry() -> AccountRegistry:
+    """Build the registry from SENDER_ACCOUNTS, or a single account from INSTAGRAM_USERNAME/MCP_URL"""
+    configured = settings.SENDER_ACCOUNTS or [{"username": settings.INSTAGRAM_USERNAME}]
+    accounts = [
+        SenderAccount(
+            username=a["username"],
+            mcp_url=a.get("mcp_url", settings.mcp_url),
+            password=a.get("password") or (settings.INSTAGRAM_PASSWORD or None),
+            daily_send_quota=a.get("daily_send_quota", settings.DAILY_SEND_QUOTA),
+        )
+        for a in configured
+    ]
+    return AccountRegistry(accounts)
+
+
+class SendQuota:
+    """Per-account daily send counters, kept in SQLite so API and worker processes share them"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or settings.ACCOUNT_STATE_PATH
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS send_counts "
+                "(account TEXT NOT NULL, day TEXT NOT NULL, sent INTEGER NOT NULL, PRIMARY KEY (account, day))"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _today() -> str:
+        return time.strftime("%Y-%m-%d", time.gmtime())
+
+    def try_consume(self, account: SenderAccount) -> Optional[str]:
+        """Reserve one send for today and return the day it was counted on; None if the quota is used up"""
+        day = self._today()
+        with self._connect() as conn:
+            row = conn.execute(
+                """
+                INSERT INTO send_counts (account, day, sent) VALUES (?, ?, 1)
+                ON CONFLICT (account, day) DO UPDATE SET sent = sent + 1 WHERE sent < ?
+                RETURNING sent
+                """,
+                (account.username, day, account.daily_send_quota),
+            ).fetchone()
+        return day if row is not None else None
+
+    def refund(self, account: SenderAccount, day: str):
+        """Give back a send reserved on `day` that never went out"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE send_counts SET sent = sent - 1 WHERE account = ? AND day = ? AND sent > 0",
+                (account.username, day),
+            )
+
+    def remaining(self, account: SenderAccount) -> int:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT sent FROM send_counts WHERE account = ? AND day = ?", (account.username, self._today())
+            ).fetchone()
+        return account.daily_send_quota - (row[0] if row else 0)
+
+
+@lru_cache(maxsize=None)
+def get_send_quota() -> SendQuota:
+    return SendQuota()
+
+
+async def check_send_quota(account: SenderAccount):
+    """Raise QuotaExceededError if the account has no sends left today (nothing is reserved)"""
+    if await asyncio.to_thread(get_send_quota().remaining, account) <= 0:
+        raise QuotaExceededError(f"Daily send quota ({account.daily_send_quota}) reached for @{account.username}")
+
+
+@asynccontextmanager
+async def reserve_send(account: SenderAccount) -> AsyncIterator[None]:
+    """
+    Hold one send of the account's daily quota around an actual send, or raise QuotaExceededError.
+    The send is refunded if the block raises, including on cancellation. The SQLite calls run
+    in a thread so a busy quota database never blocks the event loop.
+    """
+    quota = get_send_quota()
+    claim = asyncio.ensure_future(asyncio.to_thread(quota.try_consume, account))
+    try:
+        day = await asyncio.shield(claim)
+    except asyncio.CancelledError:
+        # The consume may still land in its thread; refund it once it does
+        claim.add_done_callback(
+            lambda f: not f.cancelled() and f.exception() is None and f.result() is not None
+            and asyncio.get_running_loop().run_in_executor(None, quota.refund, account, f.result())
+        )
+        raise
+    if day is None:
+        raise QuotaExceededError(f"Daily send quota ({account.daily_send_quota}) reached for @{account.username}")
+    try:
+        yield
+    except BaseException:
+        # Shielded so a second cancellation can't lose the refund
+        await asyncio.shield(asyncio.to_thread(quota.refund, account, day))
+        raise
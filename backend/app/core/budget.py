@@ -0,0 +1,116 @@
+# app/core/budget.py
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+from app.core.metrics import Counter, extract_token_usage
+
+BRANCH_BUDGET_EXCEEDED = Counter(
+    "dm_branch_budget_exceeded_total", "DM branches cancelled by their deadline or token budget", ["reason"]
+)
+
+
+class BudgetExceeded(Exception):
+    def __init__(self, reason: str, budget: "BranchBudget"):
+        self.reason = reason
+        self.budget = budget
+        if reason == "tokens":
+            detail = f"used {budget.tokens_used} of {budget.token_limit} tokens"
+        else:
+            detail = f"deadline of {budget.seconds:g}s reached"
+        super().__init__(f"Timed out - {detail}")
+
+
+class BranchBudget:
+    """
+    Wall-clock deadline and LLM token budget of one DM branch. Running out of either cancels
+    the branch through its asyncio timeout, so every subagent, LLM and MCP call stops at once.
+    """
+
+    def __init__(self, seconds: float, token_limit: Optional[int]):
+        self.seconds = seconds
+        self.token_limit = token_limit
+        self.tokens_used = 0
+        self.deadline = time.monotonic() + seconds
+        self.exhausted: Optional[str] = None  # "tokens" once the token budget ran out
+        self.results: Dict[str, str] = {}  # per-user results settled before the branch ended (see record_result)
+        self._timeout: Optional[asyncio.Timeout] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    def charge(self, tokens: int):
+        self.tokens_used += tokens
+        if self.token_limit and self.tokens_used >= self.token_limit and self.exhausted is None:
+            self.exhausted = "tokens"
+            # Callbacks may run off the event loop thread
+            self._loop.call_soon_threadsafe(self._expire_now)
+
+    def _expire_now(self):
+        try:
+            self._timeout.reschedule(self._loop.time())
+        except RuntimeError:
+            pass  # the branch already finished
+
+
+class BudgetCallbackHandler(AsyncCallbackHandler):
+    """Charges every LLM call made inside a budgeted branch (installed via the configure hook below)"""
+
+    def __init__(self, budget: BranchBudget):
+        self.budget = budget
+
+    async def on_llm_end(self, response, **kwargs):
+        tokens_in, tokens_out = extract_token_usage(response)
+        self.budget.charge(tokens_in + tokens_out)
+
+
+current_budget: ContextVar[Optional[BranchBudget]] = ContextVar("branch_budget", default=None)
+_budget_handler: ContextVar[Optional[BudgetCallbackHandler]] = ContextVar("branch_budget_handler", default=None)
+# Every callback manager configured while the var is set (i.e. every LLM run inside the branch,
+# however deeply nested in subagents) gets the handler, without threading configs through by hand
+register_configure_hook(_budget_handler, inheritable=True)
+
+
+def record_result(username: str, result: str) -> str:
+    """
+    Keep a user's final dm_results entry on the current branch as soon as it is known, so a
+    branch that later runs out of time only reports its still-pending users as timed out
+    """
+    budget = current_budget.get()
+    if budget is not None:
+        budget.results[username] = result
+    return result
+
+
+def clamp_timeout(seconds: float) -> float:
+    """A call timeout that doesn't outlive the current branch's deadline"""
+    budget = current_budget.get()
+    return seconds if budget is None else min(seconds, budget.remaining())
+
+
+@asynccontextmanager
+async def branch_budget(seconds: float, token_limit: Optional[int] = None):
+    """Run a block under a deadline and token budget; raises BudgetExceeded if either runs out"""
+    budget = BranchBudget(seconds, token_limit)
+    budget_token = current_budget.set(budget)
+    handler_token = _budget_handler.set(BudgetCallbackHandler(budget))
+    try:
+        async with asyncio.timeout(seconds) as timeout:
+            budget._timeout, budget._loop = timeout, asyncio.get_running_loop()
+            yield budget
+    except TimeoutError:
+        if not timeout.expired():
+            raise  # a timeout from inside the branch (e.g. an MCP call), not the budget
+        reason = budget.exhausted or "deadline"
+        BRANCH_BUDGET_EXCEEDED.inc(reason=reason)
+        raise BudgetExceeded(reason, budget) from None
+    finally:
+        _budget_handler.reset(handler_token)
+        current_budget.reset(budget_token)
@@ -1,14 +1,83 @@
 # app/core/config.py
 
+from functools import lru_cache
+from typing import Any, Dict, List
 from pydantic_settings import BaseSettings
-from supabase import create_client
 
 class Settings(BaseSettings):
     ENV: str = "local"
     MCP_URL: str = "http://localhost:8000/mcp"
     LOG_LEVEL: str = "INFO"
+    INSTAGRAM_USERNAME: str = "instamcp2"
+    INSTAGRAM_PASSWORD: str = ""
+    SENDER_ACCOUNTS: List[Dict[str, Any]] = []  # [{"username", "mcp_url", "password", "daily_send_quota"}]
+    DAILY_SEND_QUOTA: int = 50
+    ACCOUNT_STATE_PATH: str = "accounts.sqlite3"
     SUPABASE_URL: str = ""
     SUPABASE_KEY: str = ""
+    TRACING_ENABLED: bool = True
+    TRACE_FILE: str = "traces.jsonl"
+    DM_CONTEXT_TOKEN_CEILING: int = 6000
+    DM_COMPACTION_KEEP_LAST: int = 6
+    DM_MODE: str = "supervisor"  # "supervisor", "speculative" (parallel drafts), "fast" (batched) or "template" (no LLM)
+    FAST_MODE_BATCH_SIZE: int = 10
+    TEMPLATE_BATCH_SIZE: int = 200  # users per template-mode branch
+    CAMPAIGN_PIPELINED: bool = False  # start DM creation for confirmed users while discovery is still running
+    PIPELINE_DM_WORKERS: int = 5
+    DM_BRANCH_DEADLINE_SECONDS: float = 240.0  # per DM branch (one user, or one fast-mode batch); campaigns can override
+    DM_BRANCH_TOKEN_BUDGET: int = 60000  # LLM tokens (in + out) per DM branch; 0 disables the token budget
+    PIPELINE_CONFIRM_SCORE: float = 0.6  # candidates ranked at least this high are DMed before discovery ends
+    SPECULATIVE_DRAFTS: int = 3
+    SPECULATIVE_MAX_ROUNDS: int = 2
+    DM_PREVERIFY_RULES: List[str] = ["length", "riddle", "promo", "links", "banned", "profile"]
+    DM_PREVERIFY_SKIP_CONFIDENCE: float = 0.9  # rule-compliant drafts this certain skip the LLM verifier; >1 never skips
+    DM_BANNED_PHRASES: List[str] = [
+        "limited time", "act now", "buy now", "click here", "guaranteed", "risk-free", "100% free",
+        "don't miss out", "last chance", "dm me for price",
+    ]
+    MODEL_DEFAULT: str = "o4-mini"
+    MODEL_ROUTES: Dict[str, Dict[str, Any]] = {}  # per-role model/reasoning_effort/timeout/max_tokens overrides
+    LLM_RPM_LIMIT: int = 500  # per model; 0 = unlimited
+    LLM_TPM_LIMIT: int = 200000
+    LLM_RATE_LIMITS: Dict[str, Dict[str, int]] = {}  # per-model {"rpm": ..., "tpm": ...} overrides
+    LLM_GOVERNOR_PATH: str = ""  # SQLite file to share the RPM/TPM budget across processes; empty = per process
+    LLM_EXPECTED_OUTPUT_TOKENS: int = 800  # completion size assumed when a route sets no max_tokens
+    LLM_RATE_LIMIT_COOLDOWN: float = 5.0  # hold all requests to a model this long after a 429
+    LLM_HEDGING: bool = True  # fire a backup request when a call is slower than its role's usual latency
+    LLM_HEDGE_PERCENTILE: float = 0.95  # per-role latency percentile after which the backup request is sent
+    WORKER_MODE: bool = False  # enqueue campaigns for `python -m app.worker` instead of running them in the API
+    JOB_QUEUE_PATH: str = "jobs.sqlite3"
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_LEASE_SECONDS: int = 300  # a running job without a heartbeat for this long is re-queued
+    JOB_HEARTBEAT_SECONDS: int = 60
+    WORKER_PROCESSES: int = 0  # 0 = one per CPU core
+    WORKER_CONCURRENCY: int = 4
+    THROTTLE_INITIAL_RATE: float = 0.5  # Instagram requests/second per account, adapted with AIMD
+    THROTTLE_MIN_RATE: float = 0.02
+    THROTTLE_MAX_RATE: float = 2.0
+    THROTTLE_INCREASE: float = 0.05  # added to the rate after each successful call
+    THROTTLE_DECREASE: float = 0.5  # rate multiplier on a throttle signal
+    THROTTLE_MAX_WAIT: float = 30.0  # paused longer than this -> park the work instead of sleeping
+    MCP_CALL_TIMEOUT: float = 20.0  # deadline for MCP tools without their own entry in TOOL_TIMEOUTS
+    MCP_READ_RETRIES: int = 2
+    MCP_RETRY_BASE_DELAY: float = 0.5
+    MCP_RETRY_MAX_DELAY: float = 8.0
+    MCP_BREAKER_FAILURES: int = 5  # consecutive failures before the circuit opens
+    MCP_BREAKER_COOLDOWN: float = 30.0
+    DM_MIRROR_PATH: str = "dm_mirror.sqlite3"
+    MIRROR_FETCH_MESSAGES: int = 10  # list_messages page for a changed thread
+    MIRROR_BACKFILL_MESSAGES: int = 50  # wider page when the small one doesn't reach messages we already have
+    USER_FINDER_TOP_K: int = 5
+    USER_FINDER_TARGET_CANDIDATES: int = 25  # a hashtag search stops fetching once it found this many users
+    USER_FINDER_FOLLOWER_LOOKUPS: int = 15  # user_info calls per discovery round for the follower-band feature
+    HASHTAG_INDEX_PATH: str = "hashtags.sqlite3"
+    PRODUCT_INDEX_PATH: str = "product_hashtags.sqlite3"
+    USER_FINDER_REUSE_SIMILARITY: float = 0.8  # past product this close: reuse its hashtags and skip the agent
+    USER_FINDER_SEED_SIMILARITY: float = 0.35  # past product this close: seed the agent with its hashtags
+    RIDDLE_BANK_PATH: str = "riddle_bank.sqlite3"
+    RIDDLE_DIFFICULTY: str = "easy"  # "easy", "medium" or "hard" - riddles DMs get from the bank
+    RIDDLE_GENERATION_BATCH: int = 40  # riddles per LLM call when filling the bank offline
+    MEDIA_DIGEST_MIN_POSTS: int = 2  # fewer captioned posts from discovery than this: the analyzer fetches more over MCP
 
     @property
     def mcp_url(self):
@@ -20,5 +89,10 @@ class Settings(BaseSettings):
 
 settings = Settings()
 
-# Create Supabase client instance here
-supabase = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+
+@lru_cache(maxsize=None)
+def get_supabase():
+    """Create the Supabase client on first use (importing supabase is slow and needs credentials)"""
+    from supabase import create_client
+
+    return create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
@@ -0,0 +1,235 @@
+# app/core/llm_governor.py
+
+import asyncio
+import heapq
+import itertools
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackHandler
+
+from app.core.config import settings
+from app.core.metrics import Counter, Gauge, Histogram, extract_token_usage
+
+# Every routed model call waits here for room in its model's requests-per-minute and
+# tokens-per-minute budget. While any interactive request is waiting no bulk request is let
+# through, so riddle checks and replies to users overtake bulk campaign drafting under load.
+INTERACTIVE_ROLES = {"riddle_analyzer", "reply_agent", "username_extractor"}
+PRIORITY_RANK = {"interactive": 0, "bulk": 1}
+WINDOW_SECONDS = 60.0
+CHARS_PER_TOKEN = 4
+MAX_POLL_SECONDS = 0.5
+
+QUEUE_WAIT = Histogram(
+    "llm_governor_queue_wait_seconds", "Time LLM requests waited for rate-limit budget", ["model", "priority"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+QUEUE_DEPTH = Gauge("llm_governor_queue_depth", "LLM requests currently waiting for budget", ["model", "priority"])
+RATE_LIMITED = Counter("llm_rate_limited_total", "429 responses from the LLM provider", ["model"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_grants (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    ts REAL NOT NULL,
+    tokens INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS llm_grants_by_model ON llm_grants (model, ts);
+"""
+
+
+def role_priority(role: str) -> str:
+    return "interactive" if role in INTERACTIVE_ROLES else "bulk"
+
+
+def estimate_tokens(messages, max_output: int) -> int:
+    """Rough request size: prompt characters / 4 plus the expected completion"""
+    chars = sum(len(str(getattr(m, "content", m))) for batch in messages for m in batch)
+    return chars // CHARS_PER_TOKEN + max_output
+
+
+def limits_for(model: str) -> tuple:
+    """(rpm, tpm) for a model; 0 means unlimited"""
+    override = settings.LLM_RATE_LIMITS.get(model, {})
+    return override.get("rpm", settings.LLM_RPM_LIMIT), override.get("tpm", settings.LLM_TPM_LIMIT)
+
+
+def _wait_for(requests: int, tokens: int, oldest: Optional[float], wanted: int, rpm: int, tpm: int, now: float) -> float:
+    """0 if a request of `wanted` tokens fits the last minute's usage, else how long until the oldest grant expires"""
+    wanted = min(wanted, tpm) if tpm else wanted  # a request bigger than the whole budget must still fit eventually
+    if (not rpm or requests < rpm) and (not tpm or tokens + wanted <= tpm):
+        return 0.0
+    return max((oldest or now) + WINDOW_SECONDS - now, 0.01)
+
+
+class MemoryLedger:
+    """Grants of the last minute for this process only"""
+
+    blocking = False
+
+    def __init__(self):
+        self._grants: Dict[str, Deque[list]] = {}
+        self._lock = threading.Lock()
+
+    def try_grant(self, model: str, key: str, tokens: int, rpm: int, tpm: int) -> float:
+        with self._lock:
+            now = time.time()
+            grants = self._grants.setdefault(model, deque())
+            while grants and grants[0][0] < now - WINDOW_SECONDS:
+                grants.popleft()
+            wait = _wait_for(len(grants), sum(g[1] for g in grants), grants[0][0] if grants else None, tokens, rpm, tpm, now)
+            if wait == 0:
+                grants.append([now, tokens, key])
+            return wait
+
+    def settle(self, model: str, key: str, tokens: int):
+        with self._lock:
+            for grant in self._grants.get(model, ()):
+                if grant[2] == key:
+                    grant[1] = tokens
+
+
+class SQLiteLedger:
+    """Grants of the last minute shared by every process pointing at the same file"""
+
+    blocking = True  # may wait up to 30s for the write lock: callers on an event loop use a thread
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def try_grant(self, model: str, key: str, tokens: int, rpm: int, tpm: int) -> float:
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")  # check and insert atomically across processes
+            now = time.time()
+            conn.execute("DELETE FROM llm_grants WHERE ts < ?", (now - WINDOW_SECONDS,))
+            requests, used, oldest = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tokens), 0), MIN(ts) FROM llm_grants WHERE model = ?", (model,)
+            ).fetchone()
+            wait = _wait_for(requests, used, oldest, tokens, rpm, tpm, now)
+            if wait == 0:
+                conn.execute("INSERT OR REPLACE INTO llm_grants VALUES (?, ?, ?, ?)", (key, model, now, tokens))
+            conn.execute("COMMIT")
+        return wait
+
+    def settle(self, model: str, key: str, tokens: int):
+        with self._connect() as conn:
+            conn.execute("UPDATE llm_grants SET tokens = ? WHERE key = ?", (tokens, key))
+
+
+class ModelGovernor:
+    """Priority queue in front of one model's RPM/TPM budget"""
+
+    def __init__(self, model: str, ledger):
+        self.model = model
+        self.ledger = ledger
+        self.paused_until = 0.0
+        self._waiting: List[tuple] = []  # heap of (priority rank, arrival) - the most urgent waiter first
+        self._arrivals = itertools.count()
+        self._lock = threading.Lock()
+
+    def _enqueue(self, priority: str) -> tuple:
+        ticket = (PRIORITY_RANK[priority], next(self._arrivals))
+        with self._lock:
+            heapq.heappush(self._waiting, ticket)
+        QUEUE_DEPTH.inc(model=self.model, priority=priority)
+        return ticket
+
+    def _dequeue(self, ticket: tuple, priority: str):
+        with self._lock:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+        QUEUE_DEPTH.inc(-1, model=self.model, priority=priority)
+
+    def _held_back(self, ticket: tuple) -> float:
+        """How long to wait before asking the ledger at all (0 if this request may ask now)"""
+        with self._lock:
+            if self._waiting[0][0] < ticket[0]:
+                return MAX_POLL_SECONDS  # more urgent requests are waiting - they go first
+            return min(max(self.paused_until - time.time(), 0.0), MAX_POLL_SECONDS)
+
+    async def _try_grant(self, ticket: tuple, key: str, tokens: int) -> float:
+        """0 once the request may go, else how long to wait before asking again"""
+        if (held := self._held_back(ticket)) > 0:
+            return held
+        # The ledger is asked outside self._lock, and a SQLite ledger off the event loop
+        rpm, tpm = limits_for(self.model)
+        if self.ledger.blocking:
+            wait = await asyncio.to_thread(self.ledger.try_grant, self.model, key, tokens, rpm, tpm)
+        else:
+            wait = self.ledger.try_grant(self.model, key, tokens, rpm, tpm)
+        return min(wait, MAX_POLL_SECONDS)
+
+    async def acquire(self, priority: str, tokens: int, key: str):
+        ticket, start = self._enqueue(priority), time.monotonic()
+        try:
+            while (delay := await self._try_grant(ticket, key, tokens)) > 0:
+                await asyncio.sleep(delay)
+        finally:
+            self._dequeue(ticket, priority)
+        QUEUE_WAIT.observe(time.monotonic() - start, model=self.model, priority=priority)
+
+    async def settle(self, key: str, tokens: int):
+        """Replace a request's estimate with the tokens it actually used"""
+        if self.ledger.blocking:
+            await asyncio.to_thread(self.ledger.settle, self.model, key, tokens)
+        else:
+            self.ledger.settle(self.model, key, tokens)
+
+    def on_rate_limited(self):
+        """The provider answered 429 anyway (e.g. another client shares the key): hold everyone back briefly"""
+        self.paused_until = max(self.paused_until, time.time() + settings.LLM_RATE_LIMIT_COOLDOWN)
+        RATE_LIMITED.inc(model=self.model)
+        print(f"🚦 {self.model} rate limited - holding LLM requests for {settings.LLM_RATE_LIMIT_COOLDOWN:.0f}s")
+
+
+_ledger = None
+_governors: Dict[str, ModelGovernor] = {}
+_governors_lock = threading.Lock()
+
+
+def get_governor(model: str) -> ModelGovernor:
+    global _ledger
+    with _governors_lock:
+        if _ledger is None:
+            _ledger = SQLiteLedger(settings.LLM_GOVERNOR_PATH) if settings.LLM_GOVERNOR_PATH else MemoryLedger()
+        if model not in _governors:
+            _governors[model] = ModelGovernor(model, _ledger)
+        return _governors[model]
+
+
+class GovernorCallbackHandler(AsyncCallbackHandler):
+    """Attached to every routed model: each request waits for budget before it is sent"""
+
+    def __init__(self, role: str, model: str, max_output: Optional[int]):
+        self.priority = role_priority(role)
+        self.max_output = max_output or settings.LLM_EXPECTED_OUTPUT_TOKENS
+        self.governor = get_governor(model)
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        await self.governor.acquire(self.priority, estimate_tokens(messages, self.max_output), str(run_id))
+
+    async def on_llm_end(self, response, *, run_id, **kwargs):
+        tokens_in, tokens_out = extract_token_usage(response)
+        if tokens_in or tokens_out:
+            await self.governor.settle(str(run_id), tokens_in + tokens_out)
+
+    async def on_llm_error(self, error, *, run_id, **kwargs):
+        if type(error).__name__ == "RateLimitError" or getattr(error, "status_code", None) == 429:
+            self.governor.on_rate_limited()
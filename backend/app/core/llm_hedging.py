@@ -0,0 +1,94 @@
+# app/core/llm_hedging.py
+
+import asyncio
+import time
+from typing import Any, Optional
+
+from langchain_core.callbacks import AsyncCallbackManager
+from langchain_core.outputs import ChatResult
+from langchain_openai import ChatOpenAI
+
+from app.core.config import settings
+from app.core.metrics import Counter
+from app.services.mcp_resilience import LatencyTracker
+
+LLM_HEDGES = Counter(
+    "llm_hedges_total", "Backup LLM requests fired for slow calls, by which request answered first", ["role", "model", "winner"]
+)
+
+# Per role; the same tracker MCP reads use, so hedging stays off until a role has enough samples
+llm_latencies = LatencyTracker()
+
+
+class HedgedChatOpenAI(ChatOpenAI):
+    """
+    ChatOpenAI that hedges its long tail: if a request hasn't answered by the role's
+    LLM_HEDGE_PERCENTILE latency, a backup request goes to hedge_fallback (the same or a
+    cheaper model) and whichever answers first wins; the other is cancelled. The backup runs as
+    a child run, so its tokens are charged to the branch budget, role metrics and governor.
+    """
+
+    hedge_role: str = ""
+    hedge_fallback: Optional[Any] = None
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        start = time.perf_counter()
+        primary = asyncio.ensure_future(super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs))
+        delay = llm_latencies.percentile(self.hedge_role, settings.LLM_HEDGE_PERCENTILE)
+        if delay is None or self.hedge_fallback is None:
+            result = await primary
+        else:
+            result = await self._race(primary, delay, messages, stop, run_manager, kwargs)
+        # Record what the caller experienced, hedged or not, so slow calls keep the percentile honest
+        llm_latencies.observe(self.hedge_role, time.perf_counter() - start)
+        return result
+
+    async def _race(self, primary: asyncio.Future, delay: float, messages, stop, run_manager, kwargs):
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result()
+
+            hedge = asyncio.ensure_future(self._hedge(messages, stop, run_manager, kwargs))
+            pending = {primary, hedge}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = "hedge" if task is hedge else "primary"
+                        LLM_HEDGES.inc(role=self.hedge_role, model=self.hedge_fallback.model_name, winner=winner)
+                        return uncharged(task.result()) if task is hedge else task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Also when the caller is cancelled (e.g. a branch deadline): no request outlives it
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    async def _hedge(self, messages, stop, run_manager, kwargs) -> ChatResult:
+        """
+        The backup request, as a child run of the primary: the fallback's own callbacks wait for
+        rate-limit budget and record role metrics, the inherited ones charge the branch budget
+        """
+        callbacks = None
+        if run_manager is not None:
+            # LLM run managers have no get_child(); this is what it does for chains
+            callbacks = AsyncCallbackManager(handlers=[], parent_run_id=run_manager.run_id)
+            callbacks.set_handlers(run_manager.inheritable_handlers)
+            callbacks.add_tags(run_manager.inheritable_tags)
+            callbacks.add_metadata(run_manager.inheritable_metadata)
+        result = await self.hedge_fallback.agenerate([messages], stop=stop, callbacks=callbacks, **kwargs)
+        return ChatResult(generations=result.generations[0], llm_output=result.llm_output)
+
+
+def uncharged(result: ChatResult) -> ChatResult:
+    """A winning hedge's result without its token usage: the hedge run already charged it"""
+    generations = [
+        g.model_copy(update={"message": g.message.model_copy(update={"usage_metadata": None})})
+        for g in result.generations
+    ]
+    llm_output = {k: v for k, v in (result.llm_output or {}).items() if k != "token_usage"}
+    return ChatResult(generations=generations, llm_output=llm_output)
@@ -0,0 +1,265 @@
+# app/core/metrics.py
+
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+DEFAULT_TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000)
+
+# Nodes that every create_react_agent graph has - LLM/tool runs inside them
+# are attributed to the enclosing agent (e.g. "profile_analyzer") instead.
+REACT_INTERNAL_NODES = {"agent", "tools", "pre_model_hook", "post_model_hook", "generate_structured_response"}
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, description: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, description, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labelnames: Iterable[str] = (), buckets=DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # bucket counts + [sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for upper, count in zip(self.buckets, series):
+                    le = 'le="%s"' % upper
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+
+
+def render_prometheus() -> str:
+    """Render every registered metric in the Prometheus text exposition format"""
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# GRAPH METRICS
+
+NODE_DURATION = Histogram(
+    "graph_node_duration_seconds", "Wall time spent in a graph node or subagent", ["graph", "node"]
+)
+NODE_ERRORS = Counter("graph_node_errors_total", "Errors raised inside a graph node or subagent", ["graph", "node"])
+LLM_DURATION = Histogram("llm_call_duration_seconds", "Wall time of a single LLM request", ["graph", "node"])
+LLM_TOKENS = Histogram(
+    "llm_call_tokens", "Tokens per LLM request", ["graph", "node", "direction"], buckets=DEFAULT_TOKEN_BUCKETS
+)
+LLM_TOKENS_TOTAL = Counter("llm_tokens_total", "Total LLM tokens", ["graph", "node", "direction"])
+TOOL_CALLS = Counter("tool_calls_total", "Tool calls made by agents", ["graph", "node", "tool"])
+TOOL_DURATION = Histogram("tool_call_duration_seconds", "Wall time of a single tool call", ["graph", "node", "tool"])
+MCP_CALL_DURATION = Histogram("mcp_call_duration_seconds", "Wall time of direct MCP tool calls", ["tool"])
+MCP_CALL_ERRORS = Counter("mcp_call_errors_total", "Direct MCP tool calls that raised", ["tool"])
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain callback handler that records per-node wall time, LLM tokens, tool calls
+    and errors. Attach it once at the top-level run; nested subgraphs inherit it.
+    """
+
+    run_inline = True
+
+    def __init__(self, graph: str):
+        self.graph = graph
+        self._runs: Dict[UUID, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID, parent_run_id: Optional[UUID], kind: str, name: str, is_node: bool):
+        with self._lock:
+            self._runs[run_id] = {
+                "parent": parent_run_id,
+                "kind": kind,
+                "name": name,
+                "is_node": is_node,
+                "start": time.perf_counter(),
+            }
+
+    def _finish(self, run_id: UUID) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is not None:
+            run["elapsed"] = time.perf_counter() - run["start"]
+        return run
+
+    def _owner(self, run_id: Optional[UUID]) -> str:
+        """Walk up the run tree to the nearest node that isn't a react-agent internal node"""
+        with self._lock:
+            while run_id is not None:
+                run = self._runs.get(run_id)
+                if run is None:
+                    break
+                if run["is_node"] and run["name"] not in REACT_INTERNAL_NODES:
+                    return run["name"]
+                run_id = run["parent"]
+        return "root"
+
+    # CHAINS / NODES
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name", "chain")
+        is_node = bool(metadata) and metadata.get("langgraph_node") == name
+        self._start(run_id, parent_run_id, "chain", name, is_node)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        run = self._finish(run_id)
+        if run and run["is_node"] and run["name"] not in REACT_INTERNAL_NODES:
+            NODE_DURATION.observe(run["elapsed"], graph=self.graph, node=run["name"])
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        node = self._owner(run_id)
+        run = self._finish(run_id)
+        if run and run["is_node"] and run["name"] not in REACT_INTERNAL_NODES:
+            NODE_DURATION.observe(run["elapsed"], graph=self.graph, node=run["name"])
+            NODE_ERRORS.inc(graph=self.graph, node=node)
+
+    # LLMS
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, "llm", "llm", False)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, "llm", "llm", False)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        node = self._owner(run_id)
+        run = self._finish(run_id)
+        if run:
+            LLM_DURATION.observe(run["elapsed"], graph=self.graph, node=node)
+        tokens_in, tokens_out = extract_token_usage(response)
+        for direction, count in (("in", tokens_in), ("out", tokens_out)):
+            LLM_TOKENS.observe(count, graph=self.graph, node=node, direction=direction)
+            LLM_TOKENS_TOTAL.inc(count, graph=self.graph, node=node, direction=direction)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        node = self._owner(run_id)
+        self._finish(run_id)
+        NODE_ERRORS.inc(graph=self.graph, node=node)
+
+    # TOOLS
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name", "tool")
+        self._start(run_id, parent_run_id, "tool", name, False)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        node = self._owner(run_id)
+        run = self._finish(run_id)
+        if run:
+            TOOL_CALLS.inc(graph=self.graph, node=node, tool=run["name"])
+            TOOL_DURATION.observe(run["elapsed"], graph=self.graph, node=node, tool=run["name"])
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        node = self._owner(run_id)
+        run = self._finish(run_id)
+        if run:
+            TOOL_CALLS.inc(graph=self.graph, node=node, tool=run["name"])
+        NODE_ERRORS.inc(graph=self.graph, node=node)
+
+
+def extract_token_usage(response) -> Tuple[int, int]:
+    """Pull (input_tokens, output_tokens) out of an LLMResult, whichever way the provider reported it"""
+    tokens_in = tokens_out = 0
+    for generations in getattr(response, "generations", None) or []:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                tokens_in += usage.get("input_tokens", 0)
+                tokens_out += usage.get("output_tokens", 0)
+    if not tokens_in and not tokens_out:
+        usage = (getattr(response, "llm_output", None) or {}).get("token_usage") or {}
+        tokens_in = usage.get("prompt_tokens", 0)
+        tokens_out = usage.get("completion_tokens", 0)
+    return tokens_in, tokens_out
+
+
+def metrics_config(graph: str, **config) -> Dict[str, Any]:
+    """Build a runnable config with a metrics handler attached, for top-level ainvoke/astream calls"""
+    callbacks = list(config.pop("callbacks", None) or [])
+    callbacks.append(MetricsCallbackHandler(graph))
+    return {**config, "callbacks": callbacks}
@@ -0,0 +1,121 @@
+# app/core/model_router.py
+
+import threading
+import time
+from typing import Any, Dict, TYPE_CHECKING
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from app.core.config import settings
+from app.core.llm_governor import GovernorCallbackHandler
+from app.core.metrics import Counter, Histogram, DEFAULT_TOKEN_BUCKETS, extract_token_usage
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
+
+# Built-in routing table. Writing roles stay on the reasoning model; classification-style
+# roles (verify, extract, format, analyze) default to a fast non-reasoning model.
+# Slow calls are hedged with a backup request on hedge_model (default: the role's own model);
+# research/orchestration roles fall back to the fast model, writing roles stay on theirs.
+# Any field can be overridden per role with the MODEL_ROUTES setting, e.g.
+#   MODEL_ROUTES='{"verifier": {"model": "o4-mini", "reasoning_effort": "low"}}'
+DEFAULT_ROUTES: Dict[str, Dict[str, Any]] = {
+    "product_formatter": {"model": "gpt-4.1-mini", "timeout": 30},
+    "hashtag_extractor": {"model": "gpt-4.1-mini", "timeout": 20},
+    "user_finder": {"model": "o4-mini", "reasoning_effort": "low", "hedge_model": "gpt-4.1-mini"},
+    "dm_supervisor": {"model": "o4-mini", "reasoning_effort": "low", "hedge_model": "gpt-4.1-mini"},
+    "profile_analyzer": {"model": "o4-mini", "reasoning_effort": "low", "hedge_model": "gpt-4.1-mini"},
+    "message_writer": {"model": "o4-mini", "reasoning_effort": "medium"},
+    "verifier": {"model": "gpt-4.1-mini", "timeout": 30},
+    "batch_writer": {"model": "o4-mini", "reasoning_effort": "medium"},
+    "username_extractor": {"model": "gpt-4.1-mini"},
+    "reply_agent": {"model": "o4-mini", "reasoning_effort": "low"},
+    "riddle_analyzer": {"model": "gpt-4.1-mini", "timeout": 20},
+    "riddle_writer": {"model": "o4-mini", "reasoning_effort": "medium"},
+}
+
+ROUTE_FIELDS = ("model", "reasoning_effort", "timeout", "max_tokens", "hedge_model")
+
+ROLE_LLM_DURATION = Histogram("llm_role_duration_seconds", "LLM request wall time per routed role", ["role", "model"])
+ROLE_LLM_TOKENS = Histogram(
+    "llm_role_tokens", "Tokens per LLM request per routed role", ["role", "model", "direction"],
+    buckets=DEFAULT_TOKEN_BUCKETS,
+)
+ROLE_LLM_ERRORS = Counter("llm_role_errors_total", "Failed LLM requests per routed role", ["role", "model"])
+
+
+def resolve_route(role: str) -> Dict[str, Any]:
+    """Merge the built-in route for a role with any MODEL_ROUTES override, falling back to MODEL_DEFAULT"""
+    route = {"model": settings.MODEL_DEFAULT, "reasoning_effort": None, "timeout": None, "max_tokens": None, "hedge_model": None}
+    route.update(DEFAULT_ROUTES.get(role, {}))
+    route.update({k: v for k, v in settings.MODEL_ROUTES.get(role, {}).items() if k in ROUTE_FIELDS})
+    if not route["model"].startswith("o"):
+        # reasoning_effort is only accepted by o-series models
+        route["reasoning_effort"] = None
+    return route
+
+
+class RoleStatsCallbackHandler(BaseCallbackHandler):
+    """Records latency and token usage of every request made through a routed model"""
+
+    run_inline = True
+
+    def __init__(self, role: str, model: str):
+        self.role = role
+        self.model = model
+        self._starts: Dict[Any, float] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        with self._lock:
+            self._starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            start = self._starts.pop(run_id, None)
+        if start is not None:
+            ROLE_LLM_DURATION.observe(time.perf_counter() - start, role=self.role, model=self.model)
+        tokens_in, tokens_out = extract_token_usage(response)
+        if not tokens_in and not tokens_out:
+            return  # no usage reported (e.g. a won hedge, whose own run recorded it)
+        ROLE_LLM_TOKENS.observe(tokens_in, role=self.role, model=self.model, direction="in")
+        ROLE_LLM_TOKENS.observe(tokens_out, role=self.role, model=self.model, direction="out")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            self._starts.pop(run_id, None)
+        ROLE_LLM_ERRORS.inc(role=self.role, model=self.model)
+
+
+_models: Dict[str, "ChatOpenAI"] = {}
+
+
+def get_chat_model(role: str) -> "ChatOpenAI":
+    """Return the (cached) chat model configured for a role, constructed on first use"""
+    if role not in _models:
+        from langchain_openai import ChatOpenAI
+        from app.core.llm_hedging import HedgedChatOpenAI
+
+        route = resolve_route(role)
+        kwargs: Dict[str, Any] = {"model": route["model"]}
+        for field in ("reasoning_effort", "timeout", "max_tokens"):
+            if route[field] is not None:
+                kwargs[field] = route[field]
+        if settings.LLM_HEDGING:
+            hedge_model = route["hedge_model"] or route["model"]
+            hedge_kwargs = {k: v for k, v in kwargs.items() if k != "reasoning_effort" or hedge_model.startswith("o")}
+            kwargs["hedge_fallback"] = ChatOpenAI(**{**hedge_kwargs, "model": hedge_model}, callbacks=[
+                RoleStatsCallbackHandler(role, hedge_model),
+                GovernorCallbackHandler(role, hedge_model, route["max_tokens"]),
+            ])
+        kwargs["hedge_role"] = role
+        kwargs["callbacks"] = [
+            RoleStatsCallbackHandler(role, route["model"]),
+            GovernorCallbackHandler(role, route["model"], route["max_tokens"]),  # waits for RPM/TPM budget
+        ]
+        _models[role] = HedgedChatOpenAI(**kwargs)
+    return _models[role]
+
+
+def get_model_name(role: str) -> str:
+    return resolve_route(role)["model"]
@@ -0,0 +1,342 @@
+# app/core/tracing.py
+
+import atexit
+import contextvars
+import json
+import os
+import queue
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from app.core.config import settings
+from app.core.metrics import REACT_INTERNAL_NODES
+
+SERVICE_NAME = "instagram-mcp-backend"
+
+# Attributes copied from a span onto all of its descendants, so every MCP/OpenAI
+# span of a DM branch can be filtered by campaign and username.
+PROPAGATED_ATTRIBUTES = ("campaign.id", "user.username")
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# Most spans the exporter thread writes with one open/append
+EXPORT_BATCH_SIZE = 512
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_span_id", "name", "kind", "attributes",
+                 "start_ns", "end_ns", "status_code", "status_message")
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, attributes: Optional[Dict[str, Any]] = None,
+                 kind: int = SPAN_KIND_INTERNAL):
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent.span_id if parent else ""
+        self.name = name
+        self.kind = kind
+        self.attributes: Dict[str, Any] = {}
+        if parent:
+            self.attributes.update({k: v for k, v in parent.attributes.items() if k in PROPAGATED_ATTRIBUTES})
+        self.attributes.update(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.status_code = STATUS_OK
+        self.status_message = ""
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException):
+        self.status_code = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        self.end_ns = time.time_ns()
+        exporter.export(self)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in self.attributes.items()],
+            "status": {"code": self.status_code, "message": self.status_message},
+        }
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class FileSpanExporter:
+    """
+    Appends finished spans to a local file, one OTLP/JSON ExportTraceServiceRequest per line.
+    export() only queues the span; a background thread serializes and writes queued spans in
+    batches, so file I/O never runs on the event loop.
+    """
+
+    def __init__(self, path: str, enabled: bool = True):
+        self.path = path
+        self.enabled = enabled
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+
+    def export(self, span: Span):
+        if not self.enabled:
+            return
+        self._queue.put(span.to_otlp())
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name="span-exporter", daemon=True)
+                    self._writer.start()
+                    atexit.register(self.flush)
+
+    def flush(self):
+        """Block until every span exported so far is on disk"""
+        if self._writer is not None:
+            self._queue.join()
+
+    def _write_loop(self):
+        while True:
+            spans = [self._queue.get()]
+            while len(spans) < EXPORT_BATCH_SIZE:
+                try:
+                    spans.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                lines = "".join(json.dumps(_export_request(s), default=str) + "\n" for s in spans)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(lines)
+            except Exception as e:
+                print(f"⚠️ Failed to write {len(spans)} span(s) to {self.path}: {e}")
+            finally:
+                for _ in spans:
+                    self._queue.task_done()
+
+
+def _export_request(span: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": [span]}],
+        }]
+    }
+
+
+exporter = FileSpanExporter(settings.TRACE_FILE, enabled=settings.TRACING_ENABLED)
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    """The innermost active span: an explicit span() block, else the LangChain run we're executing inside"""
+    span = _current_span.get()
+    langchain_span = _langchain_parent_span()
+    if langchain_span is not None and (span is None or langchain_span.start_ns >= span.start_ns):
+        return langchain_span
+    return span
+
+
+def _langchain_parent_span() -> Optional[Span]:
+    from langchain_core.runnables.config import var_child_runnable_config
+
+    config = var_child_runnable_config.get() or {}
+    manager = config.get("callbacks")
+    parent_run_id = getattr(manager, "parent_run_id", None)
+    if parent_run_id is None:
+        return None
+    for handler in getattr(manager, "handlers", []):
+        if isinstance(handler, TracingCallbackHandler):
+            return handler.span_for(parent_run_id)
+    return None
+
+
+@contextmanager
+def span(name: str, attributes: Optional[Dict[str, Any]] = None, kind: int = SPAN_KIND_INTERNAL) -> Iterator[Span]:
+    """Open a child span of the current span for the duration of the block (works in sync and async code)"""
+    s = Span(name, parent=current_span(), attributes=attributes, kind=kind)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.record_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        s.end()
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    Turns LangGraph node runs, LLM requests and tool calls into spans. Attach it once at the
+    top-level run; the first run is parented to whatever span() is active at that point.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self._spans: Dict[UUID, Span] = {}
+        self._lock = threading.Lock()
+
+    def span_for(self, run_id: UUID) -> Optional[Span]:
+        return self._spans.get(run_id)
+
+    def _start(self, run_id: UUID, parent_run_id: Optional[UUID], name: str, attributes: Dict[str, Any],
+               kind: int = SPAN_KIND_INTERNAL, metadata: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            parent = self._spans.get(parent_run_id) if parent_run_id else None
+        if parent is None:
+            parent = _current_span.get()
+        if metadata and metadata.get("campaign_id"):
+            attributes.setdefault("campaign.id", metadata["campaign_id"])
+        s = Span(name, parent=parent, attributes=attributes, kind=kind)
+        with self._lock:
+            self._spans[run_id] = s
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None) -> Optional[Span]:
+        with self._lock:
+            s = self._spans.pop(run_id, None)
+        if s is not None:
+            if error is not None:
+                s.record_error(error)
+            s.end()
+        return s
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name", "chain")
+        attributes: Dict[str, Any] = {"langchain.run_type": "chain"}
+        if metadata and metadata.get("langgraph_node") == name:
+            attributes["langgraph.node"] = name
+            if name not in REACT_INTERNAL_NODES:
+                attributes["agent.turn"] = metadata.get("langgraph_step", 0)
+        if isinstance(inputs, dict) and isinstance(inputs.get("username"), str):
+            attributes["user.username"] = inputs["username"]
+        self._start(run_id, parent_run_id, name, attributes, metadata=metadata)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        model = (kwargs.get("invocation_params") or {}).get("model") or (metadata or {}).get("ls_model_name", "")
+        self._start(run_id, parent_run_id, "openai.chat", {"llm.model": model}, SPAN_KIND_CLIENT, metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        model = (kwargs.get("invocation_params") or {}).get("model") or (metadata or {}).get("ls_model_name", "")
+        self._start(run_id, parent_run_id, "openai.completion", {"llm.model": model}, SPAN_KIND_CLIENT, metadata)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        from app.core.metrics import extract_token_usage
+
+        s = self._spans.get(run_id)
+        if s is not None:
+            tokens_in, tokens_out = extract_token_usage(response)
+            s.set_attribute("llm.tokens.input", tokens_in)
+            s.set_attribute("llm.tokens.output", tokens_out)
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name", "tool")
+        self._start(run_id, parent_run_id, f"tool.{name}", {"tool.name": name}, SPAN_KIND_CLIENT, metadata)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+
+def traced_config(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Add a TracingCallbackHandler to a runnable config (e.g. the output of metrics_config)"""
+    callbacks = list(config.get("callbacks") or [])
+    callbacks.append(TracingCallbackHandler())
+    return {**config, "callbacks": callbacks}
+
+
+# TRACE ANALYSIS
+
+def load_spans(path: str) -> List[Dict[str, Any]]:
+    spans = []
+    if not os.path.exists(path):
+        return spans
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            for resource_spans in json.loads(line)["resourceSpans"]:
+                for scope_spans in resource_spans["scopeSpans"]:
+                    spans.extend(scope_spans["spans"])
+    return spans
+
+
+def critical_path(path: str, trace_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Return the chain of spans that determined a trace's end time: starting at the root,
+    repeatedly step into the child that finished last. For a campaign this walks down
+    through the slowest dm_creation branch to the subagent turn / MCP / OpenAI call that held it up.
+    Defaults to the most recent trace in the file.
+    """
+    spans = load_spans(path)
+    if not spans:
+        return []
+    if trace_id is None:
+        trace_id = max(spans, key=lambda s: int(s["endTimeUnixNano"]))["traceId"]
+    spans = [s for s in spans if s["traceId"] == trace_id]
+
+    children: Dict[str, List[Dict[str, Any]]] = {}
+    ids = {s["spanId"] for s in spans}
+    roots = []
+    for s in spans:
+        if s["parentSpanId"] and s["parentSpanId"] in ids:
+            children.setdefault(s["parentSpanId"], []).append(s)
+        else:
+            roots.append(s)
+
+    node = max(roots, key=lambda s: int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"]))
+    chain = []
+    while node is not None:
+        attributes = {a["key"]: next(iter(a["value"].values())) for a in node["attributes"]}
+        chain.append({
+            "name": node["name"],
+            "duration_ms": (int(node["endTimeUnixNano"]) - int(node["startTimeUnixNano"])) / 1e6,
+            "attributes": attributes,
+        })
+        kids = children.get(node["spanId"])
+        node = max(kids, key=lambda s: int(s["endTimeUnixNano"])) if kids else None
+    return chain
+
+
+if __name__ == "__main__":
+    # python -m app.core.tracing [traces.jsonl] [trace_id]
+    trace_path = sys.argv[1] if len(sys.argv) > 1 else settings.TRACE_FILE
+    for depth, step in enumerate(critical_path(trace_path, sys.argv[2] if len(sys.argv) > 2 else None)):
+        who = step["attributes"].get("user.username", "")
+        print(f"{'  ' * depth}{step['name']} {step['duration_ms']:.1f}ms {'@' + who if who else ''}")
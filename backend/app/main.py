@@ -1,8 +1,9 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from app.api.routes import router as api_router
 from fastapi.middleware.cors import CORSMiddleware
 import asyncio
-from app.utils.check_pending_chats import run_periodic_check
+from app.core.metrics import render_prometheus, PROMETHEUS_CONTENT_TYPE
 
 app = FastAPI(title="Instagram MCP Backend")
 
@@ -24,7 +25,12 @@ app.include_router(api_router, prefix="/api")
 async def root():
     return {"message": "Welcome to the Instagram MCP Hackathon backend!"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 # @app.on_event("startup")
 # async def startup_event():
-#     # start your periodic check as a background task
+#     # start your periodic check as a background task (imported lazily, it pulls in MCP + langgraph)
+#     from app.utils.check_pending_chats import run_periodic_check
 #     asyncio.create_task(run_periodic_check())
@@ -0,0 +1,230 @@
+# app/services/dm_mirror.py
+
+import asyncio
+import hashlib
+import itertools
+import sqlite3
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import Counter
+from app.services.mcp_models import ChatThread, DirectMessage
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS threads (
+    account TEXT NOT NULL,
+    thread_id TEXT NOT NULL,
+    username TEXT,
+    cursor TEXT,
+    handled TEXT,
+    last_sender TEXT,
+    last_text TEXT,
+    synced_at REAL NOT NULL,
+    PRIMARY KEY (account, thread_id)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    account TEXT NOT NULL,
+    thread_id TEXT NOT NULL,
+    message_key TEXT NOT NULL,
+    username TEXT,
+    text TEXT NOT NULL,
+    timestamp TEXT,
+    item_type TEXT,
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (account, thread_id, message_key)
+);
+CREATE INDEX IF NOT EXISTS messages_by_thread ON messages (account, thread_id, seq);
+"""
+
+MIRROR_SYNCS = Counter("dm_mirror_thread_syncs_total", "Threads seen by inbox syncs, by whether messages had to be fetched", ["result"])
+MIRROR_MESSAGES = Counter("dm_mirror_messages_stored_total", "New messages written to the local DM mirror", ["account"])
+
+
+def message_key(message: DirectMessage) -> str:
+    """Stable id for a message: the Instagram item id, or a hash when the server doesn't send one"""
+    if message.item_id:
+        return str(message.item_id)
+    raw = f"{message.timestamp}|{message.username}|{message.text}"
+    return "h:" + hashlib.md5(raw.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class ThreadChange:
+    thread_id: str
+    username: str
+    last_sender: Optional[str]
+    new_messages: int
+    cursor: str  # pass to mark_handled once the change has been dealt with
+
+
+class DMMirror:
+    """
+    Local SQLite copy of every sender account's DM threads and messages. Each thread keeps a
+    cursor (the newest message key seen), so an inbox poll only fetches threads whose newest
+    message changed, and only writes messages it hasn't stored yet. A second cursor, `handled`,
+    only moves once the reply checker dealt with the thread, so a failed check is retried.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or settings.DM_MIRROR_PATH
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(threads)")}
+            if "handled" not in columns:
+                # Mirrors written before the handled cursor: everything stored so far was handled
+                conn.execute("ALTER TABLE threads ADD COLUMN handled TEXT")
+                conn.execute("UPDATE threads SET handled = cursor")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def cursors(self, account: str) -> Dict[str, tuple]:
+        """(cursor, handled) per thread"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT thread_id, cursor, handled FROM threads WHERE account = ?", (account,)).fetchall()
+        return {row["thread_id"]: (row["cursor"], row["handled"]) for row in rows}
+
+    def mark_handled(self, account: str, thread_id: str, cursor: str):
+        with self._connect() as conn:
+            conn.execute("UPDATE threads SET handled = ? WHERE account = ? AND thread_id = ?", (cursor, account, thread_id))
+
+    def known_keys(self, account: str, thread_id: str) -> set:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT message_key FROM messages WHERE account = ? AND thread_id = ?", (account, thread_id)
+            ).fetchall()
+        return {row["message_key"] for row in rows}
+
+    def apply(self, account: str, thread: ChatThread, messages: List[DirectMessage]) -> int:
+        """Store a thread's new messages (newest first, as the server returns them) and move its cursor"""
+        last = thread.last_message
+        with self._connect() as conn:
+            conn.execute("BEGIN")
+            seq = conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM messages WHERE account = ? AND thread_id = ?",
+                (account, thread.thread_id),
+            ).fetchone()[0]
+            inserted = 0
+            for offset, message in enumerate(reversed(messages), start=1):
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO messages (account, thread_id, message_key, username, text, timestamp, item_type, seq) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (account, thread.thread_id, message_key(message), message.username, message.text,
+                     None if message.timestamp is None else str(message.timestamp), message.item_type, seq + offset),
+                )
+                inserted += cur.rowcount
+            conn.execute(
+                """
+                INSERT INTO threads (account, thread_id, username, cursor, last_sender, last_text, synced_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (account, thread_id) DO UPDATE SET
+                    username = excluded.username, cursor = excluded.cursor, last_sender = excluded.last_sender,
+                    last_text = excluded.last_text, synced_at = excluded.synced_at
+                """,
+                (account, thread.thread_id, thread.username, message_key(last) if last else None,
+                 last.username if last else None, last.text if last else None, time.time()),
+            )
+            conn.execute("COMMIT")
+        return inserted
+
+    def history(self, account: str, thread_id: str, limit: int = 20) -> List[DirectMessage]:
+        """The last `limit` messages of a thread, oldest first - ready for prompt construction"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT username, text, timestamp, item_type, message_key FROM messages "
+                "WHERE account = ? AND thread_id = ? ORDER BY seq DESC LIMIT ?",
+                (account, thread_id, limit),
+            ).fetchall()
+        return [
+            DirectMessage(text=r["text"], username=r["username"], timestamp=r["timestamp"], item_type=r["item_type"],
+                          item_id=None if r["message_key"].startswith("h:") else r["message_key"])
+            for r in reversed(rows)
+        ]
+
+    def stats(self, account: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+        """Per-account inbox analytics computed from the mirror (no MCP calls)"""
+        where, params = ("WHERE t.account = ?", (account,)) if account else ("", ())
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT t.account AS account,
+                       COUNT(DISTINCT t.thread_id) AS threads,
+                       SUM(CASE WHEN t.last_sender IS NOT NULL AND t.last_sender != t.account THEN 1 ELSE 0 END) AS awaiting_reply,
+                       (SELECT COUNT(*) FROM messages m WHERE m.account = t.account) AS messages,
+                       (SELECT COUNT(*) FROM messages m WHERE m.account = t.account AND m.username = t.account) AS sent,
+                       (SELECT COUNT(DISTINCT m.thread_id) FROM messages m
+                         WHERE m.account = t.account AND m.username IS NOT NULL AND m.username != t.account) AS threads_with_replies
+                FROM threads t {where} GROUP BY t.account
+                """,
+                params,
+            ).fetchall()
+        return {row["account"]: {k: row[k] for k in row.keys() if k != "account"} for row in rows}
+
+
+@lru_cache(maxsize=None)
+def get_dm_mirror() -> DMMirror:
+    return DMMirror()
+
+
+async def sync_inbox(insta, amount: int = 20) -> List[ThreadChange]:
+    """
+    Delta-sync one account's inbox into the mirror: one list_chats call, then list_messages only
+    for threads whose newest message differs from the stored cursor. Returns the changed threads,
+    plus threads synced earlier whose change was never marked handled.
+    """
+    mirror = get_dm_mirror()
+    account = insta.account.username
+    chats = await insta.list_chats(amount=amount)
+    if not chats.success:
+        raise RuntimeError(f"list_chats failed for @{account}: {chats.message}")
+
+    cursors = await asyncio.to_thread(mirror.cursors, account)
+    changes = []
+    for thread in chats.threads:
+        last = thread.last_message
+        if not thread.username or last is None:
+            continue
+        cursor, handled = cursors.get(thread.thread_id, (None, None))
+        if cursor == message_key(last):
+            MIRROR_SYNCS.inc(result="unchanged")
+            if handled != cursor:
+                changes.append(ThreadChange(thread.thread_id, thread.username, last.username, 0, cursor))
+            continue
+        MIRROR_SYNCS.inc(result="fetched")
+
+        messages = await _fetch_new_messages(insta, mirror, account, thread.thread_id)
+        if messages is None:
+            continue
+        inserted = await asyncio.to_thread(mirror.apply, account, thread, messages)
+        MIRROR_MESSAGES.inc(inserted, account=account)
+        changes.append(ThreadChange(thread.thread_id, thread.username, last.username, inserted, message_key(last)))
+    return changes
+
+
+async def _fetch_new_messages(insta, mirror: DMMirror, account: str, thread_id: str) -> Optional[List[DirectMessage]]:
+    """Fetch a small page; only if it doesn't reach a message we already have, widen to a backfill page"""
+    known = await asyncio.to_thread(mirror.known_keys, account, thread_id)
+    page = settings.MIRROR_FETCH_MESSAGES
+    while True:
+        resp = await insta.list_messages(thread_id=thread_id, amount=page)
+        if not resp.success:
+            print(f"❌ Failed to fetch messages for thread {thread_id}: {resp.message}")
+            return None
+        # Messages come newest first: everything before the first one we know is new
+        new = list(itertools.takewhile(lambda m: message_key(m) not in known, resp.messages))
+        reached_known = len(new) < len(resp.messages)
+        if reached_known or not known or len(resp.messages) < page or page >= settings.MIRROR_BACKFILL_MESSAGES:
+            return new
+        page = settings.MIRROR_BACKFILL_MESSAGES
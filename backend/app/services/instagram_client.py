@@ -2,26 +2,39 @@
 
 import asyncio
 import os
+import time
 from typing import Dict, Any, List, Optional
 from dotenv import load_dotenv
 from app.core.config import settings
-from langchain_mcp_adapters.client import MultiServerMCPClient
-import json
+from app.core.accounts import SenderAccount, get_registry, reserve_send
+from app.core.metrics import MCP_CALL_DURATION, MCP_CALL_ERRORS
+from app.core.tracing import span, SPAN_KIND_CLIENT
+from app.services.mcp_models import (
+    ChatList, MessageList, UserPosts, decode_chat_list, decode_message_list, decode_user_posts,
+)
+from app.services.mcp_resilience import MCP_RETRIES, READ_TOOLS, backoff_delay, get_breaker, hedged, with_deadline
+from app.services.throttle import classify_throttle, get_throttle
 
 load_dotenv()
 
 class InstagramClient:
-    def __init__(self):
-        self.client = MultiServerMCPClient({
-            "instagram_dm": {
-                "url": settings.mcp_url,
-                "transport": "streamable_http",
-            }
-        })
+    def __init__(self, account: Optional[SenderAccount] = None):
+        # One client per sender account; MCP client/session is created on first tool use
+        self.account = account or get_registry().default
+        self.client = None
         self.tools = None
 
     async def initialize_tools(self):
         if self.tools is None:
+            if self.client is None:
+                from langchain_mcp_adapters.client import MultiServerMCPClient
+
+                self.client = MultiServerMCPClient({
+                    "instagram_dm": {
+                        "url": self.account.mcp_url,
+                        "transport": "streamable_http",
+                    }
+                })
             self.tools = await self.client.get_tools()
 
     def _get_tool(self, tool_name: str):
@@ -32,72 +45,99 @@ class InstagramClient:
             raise ValueError(f"Tool '{tool_name}' not found among MCP tools.")
         return tool
 
-    async def send_message(self, username: str, message: str) -> str:
+    async def _call_tool(self, tool_name: str, args: Dict[str, Any]) -> Any:
+        """Run an MCP tool inside its own span, recording its latency and errors.
+        Calls are paced by the account's AIMD throttle; throttle responses raise ThrottledError.
+        Every attempt has a deadline; reads are retried with jittered backoff and hedged after
+        their p95 latency, and the account's circuit breaker fails fast while its server is down."""
         await self.initialize_tools()
-        tool = self._get_tool("send_message")
-        resp = await tool.arun({
-            "username": username,
-            "message": message
-        })
-        return resp
-
-    async def list_chats(self, amount: int = 5) -> Dict[str, Any]:
-        await self.initialize_tools()
-        tool = self._get_tool("list_chats")
-        resp = await tool.arun({"amount": amount})
-
-        # If resp is a string, try parsing as JSON
-        if isinstance(resp, str):
+        tool = self._get_tool(tool_name)
+        throttle = get_throttle(self.account.username)
+        breaker = get_breaker(self.account.username)
+        is_read = tool_name in READ_TOOLS
+        attempts = 1 + (settings.MCP_READ_RETRIES if is_read else 0)
+        attributes = {"mcp.tool": tool_name, "instagram.account": self.account.username}
+        if "username" in args:
+            attributes["user.username"] = args["username"]
+        start = time.perf_counter()
+        with span(f"mcp.{tool_name}", attributes, kind=SPAN_KIND_CLIENT):
             try:
-                resp = json.loads(resp)
-            except Exception:
-                resp = {"success": False, "message": "Failed to parse JSON response", "raw_response": resp}
+                for attempt in range(attempts):
+                    # Throttle first: waiting (or ThrottledError) must not hold the breaker's trial slot
+                    await throttle.acquire()
+                    trial = breaker.before_call()
+                    settled = False
+                    try:
+                        call = lambda: tool.arun(args)
+                        resp = await (hedged(tool_name, call) if is_read else with_deadline(tool_name, call))
+                    except Exception as e:
+                        settled = True
+                        MCP_CALL_ERRORS.inc(tool=tool_name)
+                        if classify_throttle(e):
+                            # Instagram answered (with a rate limit) - the MCP server itself is healthy
+                            breaker.on_success()
+                            await throttle.acheck(e)
+                        breaker.on_failure()
+                        if attempt == attempts - 1:
+                            raise
+                    else:
+                        settled = True
+                        breaker.on_success()
+                        await throttle.acheck(resp)
+                        return resp
+                    finally:
+                        if trial and not settled:
+                            # Cancelled (branch deadline, lost hedge) before the server answered
+                            breaker.abandon_trial()
+                    MCP_RETRIES.inc(tool=tool_name)
+                    await asyncio.sleep(backoff_delay(attempt))
+            finally:
+                MCP_CALL_DURATION.observe(time.perf_counter() - start, tool=tool_name)
 
+    async def send_message(self, username: str, message: str) -> str:
+        # Quota is only held for the send itself: throttled, rejected or timed-out sends give it back
+        async with reserve_send(self.account):
+            resp = await self._call_tool("send_message", {
+                "username": username,
+                "message": message
+            })
         return resp
 
-    async def list_pending_chats(self, amount: int = 20) -> Dict[str, Any]:
-        await self.initialize_tools()
-        tool = self._get_tool("list_pending_chats")
-        resp = await tool.arun({"amount": amount})
+    async def list_chats(self, amount: int = 5) -> ChatList:
+        return decode_chat_list(await self._call_tool("list_chats", {"amount": amount}))
 
-        # Try to parse response if it's string
-        if isinstance(resp, str):
-            try:
-                resp_dict = json.loads(resp)
-            except Exception:
-                # If can't parse JSON, wrap the response in an error dict
-                resp_dict = {"success": False, "message": "Failed to parse response JSON", "raw_response": resp}
-        elif isinstance(resp, dict):
-            resp_dict = resp
-        else:
-            # Unexpected type, wrap in dict
-            resp_dict = {"success": False, "message": "Unexpected response type", "raw_response": str(resp)}
-
-        # Provide default keys to avoid AttributeErrors
-        if "success" not in resp_dict:
-            resp_dict["success"] = False
-        if "threads" not in resp_dict:
-            resp_dict["threads"] = []
-
-        return resp_dict
-
-    async def list_messages(self, thread_id: str, amount: int = 20) -> Dict[str, Any]:
-        await self.initialize_tools()
-        tool = self._get_tool("list_messages")
-        resp = await tool.arun({
+    async def list_pending_chats(self, amount: int = 20) -> ChatList:
+        return decode_chat_list(await self._call_tool("list_pending_chats", {"amount": amount}))
+
+    async def list_messages(self, thread_id: str, amount: int = 20) -> MessageList:
+        resp = await self._call_tool("list_messages", {
             "thread_id": thread_id,
             "amount": amount
         })
-        return resp
+        return decode_message_list(resp)
 
-    async def get_user_posts(self, username: str, count: int = 12) -> Dict[str, Any]:
-        await self.initialize_tools()
-        tool = self._get_tool("get_user_posts")
-        resp = await tool.arun({
+    async def get_user_posts(self, username: str, count: int = 12) -> UserPosts:
+        resp = await self._call_tool("get_user_posts", {
             "username": username,
             "count": count
         })
-        return resp
+        return decode_user_posts(resp)
+
+
+_clients: Dict[str, InstagramClient] = {}
+
+
+def get_instagram_client(account: Optional[SenderAccount] = None) -> InstagramClient:
+    """Shared client (and MCP session) per sender account, per process"""
+    account = account or get_registry().default
+    if account.username not in _clients:
+        _clients[account.username] = InstagramClient(account)
+    return _clients[account.username]
+
+
+def client_for_target(target_username: str) -> InstagramClient:
+    """The client for the account that owns this target (consistent hashing)"""
+    return get_instagram_client(get_registry().account_for(target_username))
 
 
 async def main():
@@ -116,11 +156,10 @@ async def main():
     print("list_pending_chats ->", pending_resp)
 
     # List messages in a specific thread (example thread id)
-    if pending_resp.get("success") and pending_resp.get("threads"):
-        thread_id = pending_resp["threads"][0].get("thread_id") or pending_resp["threads"][0].get("id")
-        if thread_id:
-            messages_resp = await insta.list_messages(thread_id, 15)
-            print(f"list_messages for thread {thread_id} ->", messages_resp)
+    if pending_resp.success and pending_resp.threads:
+        thread_id = pending_resp.threads[0].thread_id
+        messages_resp = await insta.list_messages(thread_id, 15)
+        print(f"list_messages for thread {thread_id} ->", messages_resp)
 
     # Get user posts
     posts_resp = await insta.get_user_posts("willzz._", 5)
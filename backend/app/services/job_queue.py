@@ -0,0 +1,181 @@
+# app/services/job_queue.py
+
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    locked_by TEXT,
+    locked_at REAL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at);
+"""
+
+
+@dataclass
+class Job:
+    id: int
+    kind: str
+    payload: Dict[str, Any]
+    status: str
+    attempts: int
+    result: Optional[Any] = None
+    error: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Job":
+        return cls(
+            id=row["id"],
+            kind=row["kind"],
+            payload=json.loads(row["payload"]),
+            status=row["status"],
+            attempts=row["attempts"],
+            result=json.loads(row["result"]) if row["result"] else None,
+            error=row["error"],
+        )
+
+
+class JobQueue:
+    """
+    Durable local job queue on SQLite (WAL mode), shared by the API process and worker processes.
+    Jobs are claimed atomically, retried with a delay on failure, and re-queued if the worker
+    holding them dies (lease expiry; running jobs renew their lease with heartbeat()).
+    """
+
+    def __init__(self, path: Optional[str] = None, max_attempts: Optional[int] = None):
+        self.path = path or settings.JOB_QUEUE_PATH
+        self.max_attempts = max_attempts or settings.JOB_MAX_ATTEMPTS
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # Autocommit: every statement below is a single atomic write
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], delay: float = 0) -> int:
+        now = time.time()
+        with self._connect() as conn:
+            cur = conn.execute(
+                "INSERT INTO jobs (kind, payload, available_at, created_at) VALUES (?, ?, ?, ?)",
+                (kind, json.dumps(payload), now + delay, now),
+            )
+            return cur.lastrowid
+
+    def enqueue_unique(self, kind: str, payload: Dict[str, Any], delay: float = 0) -> Optional[int]:
+        """Enqueue unless a job of this kind is already queued or running (then None)"""
+        now = time.time()
+        with self._connect() as conn:
+            cur = conn.execute(
+                """
+                INSERT INTO jobs (kind, payload, available_at, created_at)
+                SELECT ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM jobs WHERE kind = ? AND status IN (?, ?))
+                """,
+                (kind, json.dumps(payload), now + delay, now, kind, QUEUED, RUNNING),
+            )
+            return cur.lastrowid if cur.rowcount else None
+
+    def claim(self, worker_id: str) -> Optional[Job]:
+        """Atomically take the oldest ready job, or None if the queue is empty"""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                """
+                UPDATE jobs SET status = ?, locked_by = ?, locked_at = ?, attempts = attempts + 1
+                WHERE id = (
+                    SELECT id FROM jobs WHERE status = ? AND available_at <= ?
+                    ORDER BY available_at, id LIMIT 1
+                )
+                RETURNING *
+                """,
+                (RUNNING, worker_id, now, QUEUED, now),
+            ).fetchone()
+        return Job.from_row(row) if row else None
+
+    def complete(self, job_id: int, result: Any = None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, finished_at = ?, locked_by = NULL WHERE id = ?",
+                (DONE, json.dumps(result, default=str), time.time(), job_id),
+            )
+
+    def fail(self, job_id: int, error: str, retry_delay: float = 30):
+        """Record a failure; the job is retried after retry_delay until max_attempts is reached"""
+        with self._connect() as conn:
+            conn.execute(
+                """
+                UPDATE jobs SET
+                    status = CASE WHEN attempts >= ? THEN ? ELSE ? END,
+                    available_at = ?, error = ?, locked_by = NULL,
+                    finished_at = CASE WHEN attempts >= ? THEN ? ELSE NULL END
+                WHERE id = ?
+                """,
+                (self.max_attempts, FAILED, QUEUED, time.time() + retry_delay, error,
+                 self.max_attempts, time.time(), job_id),
+            )
+
+    def heartbeat(self, job_id: int, worker_id: str) -> bool:
+        """Renew a running job's lease; False if the job is no longer held by this worker"""
+        with self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET locked_at = ? WHERE id = ? AND status = ? AND locked_by = ?",
+                (time.time(), job_id, RUNNING, worker_id),
+            )
+            return cur.rowcount > 0
+
+    def requeue_stale(self, lease_seconds: float) -> int:
+        """
+        Put back jobs whose worker stopped responding (crashed or was killed mid-job); a job
+        that already used max_attempts fails instead, so a job that kills its worker can't loop
+        """
+        now = time.time()
+        with self._connect() as conn:
+            cur = conn.execute(
+                """
+                UPDATE jobs SET
+                    status = CASE WHEN attempts >= ? THEN ? ELSE ? END,
+                    error = 'Lease expired - the worker stopped responding', locked_by = NULL,
+                    finished_at = CASE WHEN attempts >= ? THEN ? ELSE NULL END
+                WHERE status = ? AND locked_at < ?
+                """,
+                (self.max_attempts, FAILED, QUEUED, self.max_attempts, now, RUNNING, now - lease_seconds),
+            )
+            return cur.rowcount
+
+    def get(self, job_id: int) -> Optional[Job]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job.from_row(row) if row else None
+
+    def counts(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
@@ -0,0 +1,150 @@
+# app/services/mcp_models.py
+
+from typing import Any, List, Optional, Union
+
+import msgspec
+
+# Typed views of the Instagram MCP server responses. Responses are decoded straight into these
+# structs by msgspec in one pass (unknown fields are skipped without being materialised) and
+# validated once; malformed payloads become success=False instead of raising in the callers.
+# gc=False: these never form reference cycles, so the garbage collector doesn't need to track them.
+
+Id = Union[str, int, None]
+Raw = Union[str, bytes, dict, list, None]
+
+
+class ChatUser(msgspec.Struct, gc=False):
+    username: Optional[str] = None
+    full_name: Optional[str] = None
+    pk: Id = None
+
+
+class DirectMessage(msgspec.Struct, gc=False):
+    text: Optional[str] = None
+    username: Optional[str] = None  # sender; filled from user.username when the server nests it
+    user: Optional[ChatUser] = None
+    user_id: Id = None
+    item_id: Id = None
+    timestamp: Union[str, int, float, None] = None
+    item_type: Optional[str] = None
+
+    def __post_init__(self):
+        if self.user is not None and self.user.username:
+            self.username = self.user.username
+        if self.text is None:
+            self.text = ""
+
+
+class ChatThread(msgspec.Struct, gc=False):
+    thread_id: Id = None
+    id: Id = None
+    users: List[ChatUser] = []
+    last_message: Optional[DirectMessage] = None
+    messages: List[DirectMessage] = []  # full thread dumps carry the newest message first
+    thread_title: Optional[str] = None
+
+    def __post_init__(self):
+        self.thread_id = str(self.thread_id or self.id or "")
+        if self.last_message is None and self.messages:
+            self.last_message = self.messages[0]
+
+    @property
+    def username(self) -> Optional[str]:
+        """The other participant (first user) of the thread"""
+        return self.users[0].username if self.users else None
+
+
+class UserPost(msgspec.Struct, gc=False):
+    caption: Optional[str] = None
+    caption_text: Optional[str] = None
+    id: Id = None
+    pk: Id = None
+    like_count: Optional[int] = None
+    comment_count: Optional[int] = None
+    taken_at: Union[str, int, float, None] = None
+
+    def __post_init__(self):
+        self.caption = self.caption or self.caption_text or ""
+
+
+class ChatList(msgspec.Struct, gc=False):
+    success: bool = False
+    threads: List[ChatThread] = []
+    message: Optional[str] = None
+
+
+class _RawChatList(msgspec.Struct, gc=False):
+    """ChatList with its threads left undecoded, so each one is validated on its own"""
+    success: bool = False
+    threads: List[msgspec.Raw] = []
+    message: Optional[str] = None
+
+
+class _ParsedChatList(msgspec.Struct, gc=False):
+    success: bool = False
+    threads: List[Any] = []
+    message: Optional[str] = None
+
+
+class MessageList(msgspec.Struct, gc=False):
+    success: bool = False
+    messages: List[DirectMessage] = []
+    message: Optional[str] = None
+
+
+class UserPosts(msgspec.Struct, gc=False):
+    success: bool = True
+    posts: List[UserPost] = []
+    message: Optional[str] = None
+
+
+_decoders = {
+    _RawChatList: msgspec.json.Decoder(_RawChatList),
+    ChatThread: msgspec.json.Decoder(ChatThread),
+    MessageList: msgspec.json.Decoder(MessageList),
+    UserPosts: msgspec.json.Decoder(Union[UserPosts, List[UserPost]]),
+}
+
+
+def _decode(raw: Raw, model: type) -> Any:
+    """Decode a raw tool result (JSON text, or already-parsed JSON) into model; failures return None + reason"""
+    try:
+        if isinstance(raw, (str, bytes, msgspec.Raw)):
+            return _decoders[model].decode(raw), None
+        return msgspec.convert(raw, Union[model, List[UserPost]] if model is UserPosts else model), None
+    except msgspec.ValidationError as e:
+        return None, f"Unexpected response: {e}"
+    except msgspec.DecodeError:
+        return None, "Failed to parse response JSON"
+
+
+def decode_chat_list(raw: Raw) -> ChatList:
+    """list_chats / list_pending_chats response; a malformed thread is skipped, not the whole list"""
+    resp, error = _decode(raw, _RawChatList if isinstance(raw, (str, bytes)) else _ParsedChatList)
+    if resp is None:
+        return ChatList(success=False, message=error)
+    threads = []
+    for item in resp.threads:
+        thread, _ = _decode(item, ChatThread)
+        if thread is not None and thread.thread_id:
+            threads.append(thread)
+    if len(threads) < len(resp.threads):
+        print(f"⚠️ Skipped {len(resp.threads) - len(threads)} malformed chat threads")
+    return ChatList(success=resp.success, threads=threads, message=resp.message)
+
+
+def decode_message_list(raw: Raw) -> MessageList:
+    """list_messages response"""
+    resp, error = _decode(raw, MessageList)
+    return resp if resp is not None else MessageList(success=False, message=error)
+
+
+def decode_user_posts(raw: Raw) -> UserPosts:
+    """get_user_posts response (a bare list of posts is accepted too); non-JSON text, e.g. an MCP error, is a failure"""
+    resp, error = _decode(raw, UserPosts)
+    if isinstance(resp, list):
+        return UserPosts(posts=resp)
+    if resp is None and isinstance(raw, (str, bytes)) and raw.strip():
+        text = raw.decode(errors="replace") if isinstance(raw, bytes) else raw
+        return UserPosts(success=False, message=f"{error}: {text[:200]}")
+    return resp if resp is not None else UserPosts(success=False, message=error)
@@ -0,0 +1,176 @@
+# app/services/mcp_resilience.py
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from app.core.budget import clamp_timeout
+from app.core.config import settings
+from app.core.metrics import Counter, Gauge
+
+# Reads are idempotent: they get retries and hedging. send_message only ever gets a deadline.
+READ_TOOLS = {"list_chats", "list_pending_chats", "list_messages", "get_user_posts", "get_user_info"}
+TOOL_TIMEOUTS = {
+    "send_message": 30.0,
+    "list_chats": 20.0,
+    "list_pending_chats": 20.0,
+    "list_messages": 15.0,
+    "get_user_posts": 20.0,
+    "get_user_info": 15.0,
+}
+
+HEDGE_PERCENTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+STATE_NAMES = {CLOSED: "closed", HALF_OPEN: "half_open", OPEN: "open"}
+
+CIRCUIT_STATE = Gauge("mcp_circuit_state", "MCP circuit breaker state per account (0 closed, 1 half-open, 2 open)", ["account"])
+MCP_RETRIES = Counter("mcp_call_retries_total", "Retried MCP read calls", ["tool"])
+MCP_TIMEOUTS = Counter("mcp_call_timeouts_total", "MCP calls that hit their deadline", ["tool"])
+MCP_HEDGES = Counter("mcp_call_hedges_total", "Hedged duplicate MCP reads, by which request answered first", ["tool", "winner"])
+MCP_FAST_FAILS = Counter("mcp_circuit_rejections_total", "MCP calls rejected while the circuit was open", ["account"])
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+def tool_timeout(tool_name: str) -> float:
+    """The tool's deadline, cut short if the DM branch making the call has less time left"""
+    return clamp_timeout(TOOL_TIMEOUTS.get(tool_name, settings.MCP_CALL_TIMEOUT))
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff: uniform in [0, base * 2^attempt], capped"""
+    return random.uniform(0, min(settings.MCP_RETRY_BASE_DELAY * 2 ** attempt, settings.MCP_RETRY_MAX_DELAY))
+
+
+class CircuitBreaker:
+    """
+    Per MCP server: after MCP_BREAKER_FAILURES consecutive failures the circuit opens and calls
+    fail fast for MCP_BREAKER_COOLDOWN seconds, then a single trial call decides whether it closes.
+    """
+
+    def __init__(self, account: str):
+        self.account = account
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(CLOSED, account=account)
+
+    def _set_state(self, state: int):
+        if state != self.state:
+            print(f"🔌 MCP circuit for @{self.account}: {STATE_NAMES[self.state]} -> {STATE_NAMES[state]}")
+        self.state = state
+        CIRCUIT_STATE.set(state, account=self.account)
+
+    def before_call(self) -> bool:
+        """Raises CircuitOpenError while open; True if this call is the half-open trial"""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= settings.MCP_BREAKER_COOLDOWN:
+                self._set_state(HALF_OPEN)
+            if self.state == CLOSED:
+                return False
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+        MCP_FAST_FAILS.inc(account=self.account)
+        raise CircuitOpenError(f"MCP server for @{self.account} is unhealthy, failing fast")
+
+    def abandon_trial(self):
+        """The trial call ended without a verdict (e.g. cancelled): free the slot for the next call"""
+        with self._lock:
+            self._trial_running = False
+
+    def on_success(self):
+        with self._lock:
+            self.failures = 0
+            self._trial_running = False
+            self._set_state(CLOSED)
+
+    def on_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == HALF_OPEN or self.failures >= settings.MCP_BREAKER_FAILURES:
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies per tool, used to pick the hedge delay"""
+
+    def __init__(self):
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def observe(self, tool_name: str, seconds: float):
+        self._samples.setdefault(tool_name, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    def percentile(self, tool_name: str, q: float) -> Optional[float]:
+        samples = self._samples.get(tool_name)
+        if not samples or len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+latencies = LatencyTracker()
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(account: str) -> CircuitBreaker:
+    if account not in _breakers:
+        _breakers[account] = CircuitBreaker(account)
+    return _breakers[account]
+
+
+async def with_deadline(tool_name: str, call: Callable[[], Awaitable[Any]]) -> Any:
+    """Run one attempt under the tool's deadline, feeding successful latencies to the hedge tracker"""
+    start = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(call(), tool_timeout(tool_name))
+    except asyncio.TimeoutError:
+        MCP_TIMEOUTS.inc(tool=tool_name)
+        raise TimeoutError(f"MCP {tool_name} timed out after {tool_timeout(tool_name):.0f}s")
+    latencies.observe(tool_name, time.perf_counter() - start)
+    return result
+
+
+async def hedged(tool_name: str, call: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Start a read; if it hasn't answered by the tool's p95 latency, fire one duplicate and
+    take whichever succeeds first. Hedging is off until enough latency samples exist.
+    """
+    delay = latencies.percentile(tool_name, HEDGE_PERCENTILE)
+    primary = asyncio.ensure_future(with_deadline(tool_name, call))
+    if delay is None:
+        return await primary
+    hedge = None
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        hedge = asyncio.ensure_future(with_deadline(tool_name, call))
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    MCP_HEDGES.inc(tool=tool_name, winner="hedge" if task is hedge else "primary")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        # Also on cancellation while waiting out the hedge delay, so no attempt outlives the caller
+        for task in (primary, hedge):
+            if task is not None and not task.done():
+                task.cancel()
@@ -0,0 +1,334 @@
+# app/services/throttle.py
+
+import asyncio
+import json
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from langchain_core.callbacks import AsyncCallbackHandler
+
+from app.core.config import settings
+from app.core.metrics import Counter, Gauge
+from app.services.job_queue import JobQueue
+
+# Signals Instagram uses to tell us to slow down, and how long to back off for each
+THROTTLE_PATTERNS = [
+    ("challenge", re.compile(r"challenge_required|checkpoint_required|challenge required", re.IGNORECASE)),
+    ("feedback_required", re.compile(r"feedback_required|feedback required", re.IGNORECASE)),
+    ("please_wait", re.compile(r"please wait a few minutes|wait a few minutes before", re.IGNORECASE)),
+    ("rate_limited", re.compile(r"\b429\b|too many requests|rate.?limit", re.IGNORECASE)),
+]
+ANY_THROTTLE_PATTERN = re.compile("|".join(p.pattern for _, p in THROTTLE_PATTERNS), re.IGNORECASE)
+EXCEPTION_SIGNALS = {
+    "ChallengeRequired": "challenge",
+    "ChallengeError": "challenge",
+    "FeedbackRequired": "feedback_required",
+    "PleaseWaitFewMinutes": "please_wait",
+    "RateLimitError": "rate_limited",
+    "ClientThrottledError": "rate_limited",
+}
+COOLDOWN_SECONDS = {
+    "rate_limited": 60,
+    "please_wait": 300,
+    "feedback_required": 1800,
+    "challenge": 3600,
+}
+CLASSIFY_MAX_CHARS = 2000
+
+TOOL_ERROR_TEMPLATE = "Error: {error}\n Please fix your mistakes."
+
+THROTTLE_RATE = Gauge("instagram_throttle_rate", "Current allowed Instagram requests per second", ["account"])
+THROTTLE_SIGNALS = Counter("instagram_throttle_signals_total", "Throttle responses seen from Instagram", ["account", "signal"])
+DM_PARKED = Counter("dm_branches_parked_total", "DM branches parked because their account was throttled", ["signal"])
+
+
+class ThrottledError(RuntimeError):
+    def __init__(self, account: str, signal: str, retry_after: float):
+        super().__init__(f"Instagram throttled @{account} ({signal}), retry in {retry_after:.0f}s")
+        self.account = account
+        self.signal = signal
+        self.retry_after = retry_after
+
+
+def _failure_text(value: Any) -> Optional[str]:
+    """The part of an MCP response worth scanning - only failures, so DM texts can't cause false positives"""
+    if isinstance(value, str):
+        # Cheap scan first so large successful payloads (1,000-thread inboxes) are never parsed twice
+        if not ANY_THROTTLE_PATTERN.search(value):
+            return None
+        try:
+            value = json.loads(value)
+        except Exception:
+            return value[:CLASSIFY_MAX_CHARS]
+    if isinstance(value, dict):
+        if value.get("success") is True:
+            return None
+        return " ".join(str(value.get(k, "")) for k in ("message", "error", "status", "raw_response"))[:CLASSIFY_MAX_CHARS]
+    return None
+
+
+def classify_throttle(value: Any) -> Optional[str]:
+    """Return the throttle signal in an MCP response or instagrapi exception, or None"""
+    if isinstance(value, BaseException):
+        for cls in type(value).__mro__:
+            if cls.__name__ in EXCEPTION_SIGNALS:
+                return EXCEPTION_SIGNALS[cls.__name__]
+        text = str(value)[:CLASSIFY_MAX_CHARS]
+    else:
+        text = _failure_text(value)
+    if not text:
+        return None
+    for signal, pattern in THROTTLE_PATTERNS:
+        if pattern.search(text):
+            return signal
+    return None
+
+
+def _initial_state() -> Dict[str, Any]:
+    return {"rate": settings.THROTTLE_INITIAL_RATE, "paused_until": 0.0, "next_slot": 0.0, "last_signal": None}
+
+
+class ThrottleStore:
+    """
+    AIMD state of every account in SQLite (ACCOUNT_STATE_PATH, next to the send quotas), so the
+    API and all worker processes pace one shared rate per account and see each other's pauses.
+    Times are wall-clock (time.time()) because they are compared across processes.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or settings.ACCOUNT_STATE_PATH
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS throttle_state (account TEXT PRIMARY KEY, rate REAL NOT NULL, "
+                "paused_until REAL NOT NULL DEFAULT 0, next_slot REAL NOT NULL DEFAULT 0, last_signal TEXT)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def read(self, account: str) -> Dict[str, Any]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM throttle_state WHERE account = ?", (account,)).fetchone()
+        return dict(row) if row else _initial_state()
+
+    def update(self, account: str, change: Callable[[Dict[str, Any]], Any]) -> Any:
+        """Read-modify-write one account's state atomically; change edits the dict and returns the result"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT * FROM throttle_state WHERE account = ?", (account,)).fetchone()
+                state = dict(row) if row else _initial_state()
+                result = change(state)
+                conn.execute(
+                    "INSERT OR REPLACE INTO throttle_state (account, rate, paused_until, next_slot, last_signal) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (account, state["rate"], state["paused_until"], state["next_slot"], state["last_signal"]),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        THROTTLE_RATE.set(state["rate"], account=account)
+        return result
+
+
+@lru_cache(maxsize=None)
+def get_throttle_store() -> ThrottleStore:
+    return ThrottleStore()
+
+
+class AIMDThrottle:
+    """
+    Per-account request pacing with additive-increase / multiplicative-decrease:
+    every success nudges the allowed rate up, every throttle signal cuts it and
+    pauses the account for the signal's cooldown. The state is shared by all
+    processes through ThrottleStore; the async methods keep its SQLite I/O off the event loop.
+    """
+
+    def __init__(self, account: str):
+        self.account = account
+        self.store = get_throttle_store()
+
+    @property
+    def rate(self) -> float:
+        return self.store.read(self.account)["rate"]
+
+    @property
+    def last_signal(self) -> Optional[str]:
+        return self.store.read(self.account)["last_signal"]
+
+    def _reserve(self) -> Tuple[float, float]:
+        """Claim the next request slot; returns when it starts and where the next one begins"""
+        def claim(state):
+            # Don't hold a worker slot for minutes - the caller parks the work instead
+            self._check_pause(state)
+            start = max(time.time(), state["next_slot"], state["paused_until"])
+            state["next_slot"] = start + 1 / state["rate"]
+            return start, state["next_slot"]
+
+        return self.store.update(self.account, claim)
+
+    def _release(self, start: float, end: float):
+        """Give back a claimed slot whose request never went out"""
+        def release(state):
+            # Only the latest claim can be rolled back; later claimants already sleep towards theirs
+            if state["next_slot"] == end:
+                state["next_slot"] = start
+
+        self.store.update(self.account, release)
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        claim = asyncio.ensure_future(asyncio.to_thread(self._reserve))
+        try:
+            start, end = await asyncio.shield(claim)
+            delay = start - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            def release(f):
+                if not f.cancelled() and f.exception() is None:
+                    loop.run_in_executor(None, self._release, *f.result())
+
+            # The claim may still be running in its thread; release once it lands, off the loop
+            claim.add_done_callback(release)
+            raise
+
+    def acquire_sync(self):
+        start, end = self._reserve()
+        try:
+            delay = start - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        except BaseException:
+            self._release(start, end)
+            raise
+
+    def paused_for(self) -> float:
+        return max(self.store.read(self.account)["paused_until"] - time.time(), 0.0)
+
+    def raise_if_paused(self):
+        """Raise ThrottledError if the account is paused for longer than THROTTLE_MAX_WAIT"""
+        self._check_pause(self.store.read(self.account))
+
+    def _check_pause(self, state: Dict[str, Any]):
+        paused = state["paused_until"] - time.time()
+        if paused > settings.THROTTLE_MAX_WAIT:
+            raise ThrottledError(self.account, state["last_signal"] or "paused", paused)
+
+    def on_success(self):
+        def increase(state):
+            state["rate"] = min(state["rate"] + settings.THROTTLE_INCREASE, settings.THROTTLE_MAX_RATE)
+
+        self.store.update(self.account, increase)
+
+    def on_throttle(self, signal: str) -> float:
+        """Cut the rate, pause the account and return the pause length"""
+        cooldown = COOLDOWN_SECONDS.get(signal, 60)
+
+        def decrease(state):
+            state["rate"] = max(state["rate"] * settings.THROTTLE_DECREASE, settings.THROTTLE_MIN_RATE)
+            state["paused_until"] = max(state["paused_until"], time.time() + cooldown)
+            state["next_slot"] = state["paused_until"]
+            state["last_signal"] = signal
+            return state["rate"]
+
+        rate = self.store.update(self.account, decrease)
+        THROTTLE_SIGNALS.inc(account=self.account, signal=signal)
+        print(f"🐢 @{self.account} throttled ({signal}): rate -> {rate:.3f}/s, paused {cooldown}s")
+        return cooldown
+
+    def check(self, value: Any):
+        """Feed back a response/exception: raises ThrottledError on a throttle signal, otherwise counts a success"""
+        signal = classify_throttle(value)
+        if signal:
+            raise ThrottledError(self.account, signal, self.on_throttle(signal))
+        if not isinstance(value, BaseException):
+            self.on_success()
+
+    async def acheck(self, value: Any):
+        """check() for async callers"""
+        await asyncio.to_thread(self.check, value)
+
+
+_throttles: Dict[str, AIMDThrottle] = {}
+
+
+def get_throttle(account: str) -> AIMDThrottle:
+    if account not in _throttles:
+        _throttles[account] = AIMDThrottle(account)
+    return _throttles[account]
+
+
+class ThrottleCallbackHandler(AsyncCallbackHandler):
+    """
+    Attached to MCP tools handed to agents: paces each call through the account's throttle
+    and raises ThrottledError when a tool result is a throttle signal.
+    """
+
+    raise_error = True
+
+    def __init__(self, account: str):
+        self.throttle = get_throttle(account)
+
+    async def on_tool_start(self, serialized, input_str, **kwargs):
+        await self.throttle.acquire()
+
+    async def on_tool_end(self, output, **kwargs):
+        await self.throttle.acheck(getattr(output, "content", output))
+
+    async def on_tool_error(self, error, **kwargs):
+        if not isinstance(error, ThrottledError):
+            await self.throttle.acheck(error)
+
+
+def throttle_aware_tool_errors(e: Exception) -> str:
+    """ToolNode handle_tool_errors: let ThrottledError abort the agent so the branch gets parked"""
+    if isinstance(e, ThrottledError):
+        raise e
+    return TOOL_ERROR_TEMPLATE.format(error=repr(e))
+
+
+async def park_job(kind: str, payload: Dict[str, Any], username: str, error: ThrottledError) -> str:
+    """
+    Re-queue throttled work for a worker to pick up once the account's pause is over. Without a
+    worker pool (WORKER_MODE off) nothing would ever claim the job, so it is retried in-process instead.
+    """
+    DM_PARKED.inc(signal=error.signal)
+    if not settings.WORKER_MODE:
+        task = asyncio.create_task(_retry_in_process(kind, payload, username, error.retry_after))
+        _local_retries.add(task)
+        task.add_done_callback(_local_retries.discard)
+        print(f"🅿️ Parked {kind} for @{username} in-process, retrying in {error.retry_after:.0f}s ({error})")
+        return f"PARKED: @{username}: {error} (retrying in {error.retry_after:.0f}s)"
+    job_id = await asyncio.to_thread(JobQueue().enqueue, kind, payload, error.retry_after)
+    print(f"🅿️ Parked {kind} for @{username} as job {job_id} ({error})")
+    return f"PARKED: @{username}: {error} (job {job_id})"
+
+
+# In-process retries of parked work, kept referenced until they finish (lost on restart)
+_local_retries: Set[asyncio.Task] = set()
+
+
+async def _retry_in_process(kind: str, payload: Dict[str, Any], username: str, delay: float):
+    from app.worker import JOB_HANDLERS
+
+    await asyncio.sleep(delay)
+    try:
+        result = await JOB_HANDLERS[kind](payload)
+        print(f"✅ Parked {kind} for @{username} done: {result}")
+    except ThrottledError as e:
+        await park_job(kind, payload, username, e)
+    except Exception as e:
+        print(f"❌ Parked {kind} for @{username} failed: {e}")
@@ -1,56 +1,59 @@
 import asyncio
-from app.services.instagram_client import InstagramClient
+from app.core.accounts import get_registry
+from app.services.dm_mirror import ThreadChange, get_dm_mirror, sync_inbox
+from app.services.instagram_client import InstagramClient, get_instagram_client
 from app.utils.riddles import handle_riddle_conversation
 
 CHECK_INTERVAL_SECONDS = 10 * 60  # 10 minutes
 
 async def check_and_process_unread_chats(insta: InstagramClient):
-    print("🔍 Checking for unread chats...")
-    chats_resp = await insta.list_chats(amount=20)
-    
-    if not chats_resp.get("success") or not chats_resp.get("threads"):
-        print("⚠️ No chats found or error occurred.")
+    my_username = insta.account.username
+    print(f"🔍 Checking for unread chats on @{my_username}...")
+    # Delta sync: only threads with a new newest message (or an unhandled one) are returned
+    changes = await sync_inbox(insta, amount=20)
+    if not changes:
+        print("⚠️ No new messages.")
         return
 
-    for thread in chats_resp["threads"]:
-        thread_id = thread.get("thread_id")
-        users = thread.get("users", [])
-        username = None
-        if users:
-            username = users[0].get("username")
-
-        if not thread_id or not username:
+    mirror = get_dm_mirror()
+    for change in changes:
+        try:
+            await handle_thread_change(insta, change)
+        except Exception as e:
+            # Not marked handled, so the next poll retries this thread; the others still get handled
+            print(f"❌ Failed to handle thread {change.thread_id} with @{change.username}: {e}")
             continue
+        await asyncio.to_thread(mirror.mark_handled, my_username, change.thread_id, change.cursor)
 
-        last_message = thread.get("last_message") or {}
-        last_sender = last_message.get("user", {}).get("username") or last_message.get("username")
-
-        my_username = "instamcp2"  # insta name
-
-        if last_sender and last_sender.lower() == my_username.lower():
-            # We sent the last message, skip
-            continue
+async def handle_thread_change(insta: InstagramClient, change: ThreadChange):
+    my_username = insta.account.username
+    if change.last_sender and change.last_sender.lower() == my_username.lower():
+        # We sent the last message, skip
+        return
 
-        print(f"📥 Unread chat from @{username} in thread {thread_id}, last sender: {last_sender}")
+    print(f"📥 Unread chat from @{change.username} in thread {change.thread_id}, last sender: {change.last_sender}")
 
-        messages_resp = await insta.list_messages(thread_id=thread_id, amount=10)
-        if not messages_resp.get("success"):
-            print(f"❌ Failed to fetch messages for thread {thread_id}")
-            continue
+    # Conversation history comes from the local mirror - no extra MCP round trip
+    messages = await asyncio.to_thread(get_dm_mirror().history, my_username, change.thread_id, 10)
+    if not messages:
+        return
 
-        messages = messages_resp.get("messages", [])
-        if not messages:
-            continue
+    await handle_riddle_conversation(insta, change.username, messages)
 
-        await handle_riddle_conversation(insta, username, messages)
+async def check_all_accounts():
+    """Poll every sender account's inbox concurrently; one failing account doesn't stop the others"""
+    accounts = get_registry().all()
+    results = await asyncio.gather(
+        *(check_and_process_unread_chats(get_instagram_client(a)) for a in accounts),
+        return_exceptions=True,
+    )
+    for account, result in zip(accounts, results):
+        if isinstance(result, Exception):
+            print(f"❌ Error during unread chat check for @{account.username}: {result}")
 
 async def run_periodic_check():
-    insta = InstagramClient()
     while True:
-        try:
-            await check_and_process_unread_chats(insta)
-        except Exception as e:
-            print(f"❌ Error during unread chat check: {e}")
+        await check_all_accounts()
         print(f"⏳ Sleeping {CHECK_INTERVAL_SECONDS // 60} minutes...\n")
         await asyncio.sleep(CHECK_INTERVAL_SECONDS)
 
@@ -2,65 +2,27 @@ import asyncio
 from typing import List, Optional, Union
 from pydantic import BaseModel
 
-# Simple imports first
-from langchain_openai import ChatOpenAI
 from langchain_mcp_adapters.client import MultiServerMCPClient
 from langgraph.prebuilt import create_react_agent
 
 # Import the exact components from the documentation
 from langgraph.graph import StateGraph, START, END, MessagesState
 
-import asyncio
-from typing import List, Optional, Union
-from pydantic import BaseModel
-
-# Check LangGraph version first
-try:
-    import langgraph
-    print(f"📦 LangGraph version: {langgraph.__version__}")
-except:
-    print("📦 LangGraph version: unknown")
-
-# Simple imports first
-from langchain_openai import ChatOpenAI
-from langchain_mcp_adapters.client import MultiServerMCPClient
-from langgraph.prebuilt import create_react_agent
-
-# Import the exact components from the documentation
-from langgraph.graph import StateGraph, START, END, MessagesState
-
-# Try different import locations for Send
-HAS_SEND = False
-Send = None
-
-# Based on the documentation, Send is in langgraph.types!
+# Send lives in langgraph.types on current versions, langgraph.graph on older ones
 try:
     from langgraph.types import Send
-    print("✅ Send import successful from langgraph.types")
     HAS_SEND = True
 except ImportError:
     try:
         from langgraph.graph import Send
-        print("✅ Send import successful from langgraph.graph")
         HAS_SEND = True
     except ImportError:
-        print("❌ Send not found in any location")
-        print("💡 Let's check what's available...")
-        
-        # Debug: show what's available
-        try:
-            import langgraph.types
-            types_available = [attr for attr in dir(langgraph.types) if not attr.startswith('_')]
-            print(f"Available in langgraph.types: {types_available}")
-        except ImportError:
-            print("langgraph.types module not available")
-            
-        try:
-            import langgraph.graph
-            graph_available = [attr for attr in dir(langgraph.graph) if not attr.startswith('_')]
-            print(f"Available in langgraph.graph: {graph_available}")
-        except ImportError:
-            print("langgraph.graph module not available")
+        Send = None
+        HAS_SEND = False
+
+from app.core.metrics import metrics_config
+from app.core.tracing import traced_config
+from app.core.model_router import get_chat_model
 
 # Import prompts
 from app.utils.reply_agent_prompts import (
@@ -68,9 +30,6 @@ from app.utils.reply_agent_prompts import (
     individual_reply_agent_prompt
 )
 
-MODEL = "o4-mini"
-PROVIDER = "openai"
-
 class ChatContext(BaseModel):
     username: str
     chat_history: Union[str, List[str]]
@@ -97,7 +56,7 @@ async def create_username_extractor_agent():
     extractor_tools = [tool for tool in tools if tool.name in ["list_chats", "list_messages"]]
     
     return create_react_agent(
-        model=f"{PROVIDER}:{MODEL}",
+        model=get_chat_model("username_extractor"),
         tools=extractor_tools,
         name="username_extractor",
         prompt=username_extractor_prompt
@@ -194,7 +153,7 @@ async def reply_to_dm_node(state):
     reply_tools = [tool for tool in tools if tool.name in ["get_user_info", "send_message"]]
     
     individual_reply_agent = create_react_agent(
-        model=f"{PROVIDER}:{MODEL}",
+        model=get_chat_model("reply_agent"),
         tools=reply_tools,
         name=f"reply_agent_{chat_context.username}",
         prompt=individual_reply_agent_prompt
@@ -263,7 +222,7 @@ async def test_send_pattern():
         
         # Stream the execution
         results = []
-        async for chunk in graph.astream(initial_state, stream_mode="updates"):
+        async for chunk in graph.astream(initial_state, config=traced_config(metrics_config("reply")), stream_mode="updates"):
             print(f"\n🔍 Step: {list(chunk.keys())}")
             
             # Collect results from concurrent reply nodes
@@ -296,7 +255,7 @@ async def test_asyncio_concurrent_approach():
         }]
     }
     
-    extractor_result = await username_extractor.ainvoke(initial_state)
+    extractor_result = await username_extractor.ainvoke(initial_state, config=traced_config(metrics_config("reply")))
     last_message = extractor_result["messages"][-1].content
     
     # Step 2: Parse users
@@ -317,7 +276,7 @@ async def test_asyncio_concurrent_approach():
         reply_tools = [tool for tool in tools if tool.name in ["get_user_info", "send_message"]]
         
         individual_reply_agent = create_react_agent(
-            model=f"{PROVIDER}:{MODEL}",
+            model=get_chat_model("reply_agent"),
             tools=reply_tools,
             name=f"reply_agent_{chat_context.username}",
             prompt=individual_reply_agent_prompt
@@ -330,7 +289,7 @@ async def test_asyncio_concurrent_approach():
             }]
         }
         
-        result = await individual_reply_agent.ainvoke(agent_state)
+        result = await individual_reply_agent.ainvoke(agent_state, config=traced_config(metrics_config("reply")))
         return {"username": chat_context.username, "status": "reply_sent"}
     
     print(f"\n⚡ Processing {len(users_waiting_for_reply)} replies concurrently with asyncio.gather...")
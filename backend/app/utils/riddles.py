@@ -1,9 +1,9 @@
-from typing import List, Dict
+import asyncio
+from typing import List
 from langgraph.prebuilt import create_react_agent
-from langchain_openai import ChatOpenAI
-
-MODEL = "o4-mini"
-PROVIDER = "openai"
+from app.core.model_router import get_chat_model
+from app.services.mcp_models import DirectMessage
+from pipeline.riddle_bank import answer_matches, get_riddle_bank
 
 async def create_riddle_agent(tools):
     prompt = """You are an assistant that analyzes Instagram DM chat histories to detect if:
@@ -21,14 +21,14 @@ async def create_riddle_agent(tools):
     """
 
     agent = create_react_agent(
-        model=f"{PROVIDER}:{MODEL}",
+        model=get_chat_model("riddle_analyzer"),
         tools=tools,
         name="riddle_analyzer",
         prompt=prompt
     )
     return agent
 
-async def handle_riddle_conversation(insta_client, username: str, messages: List[Dict]):
+async def handle_riddle_conversation(insta_client, username: str, messages: List[DirectMessage]):
     # Ensure tools are loaded on InstagramClient
     if insta_client.tools is None:
         await insta_client.initialize_tools()
@@ -36,7 +36,22 @@ async def handle_riddle_conversation(insta_client, username: str, messages: List
     tools = insta_client.tools
     agent = await create_riddle_agent(tools)
 
-    chat_history_text = "\n".join(f"{msg.get('username', 'user')}: {msg.get('text', '')}" for msg in messages)
+    chat_history_text = "\n".join(f"{msg.username or 'user'}: {msg.text}" for msg in messages)
+
+    # DMs from the riddle bank have a stored canonical answer, so solved/unsolved is decided
+    # locally and the agent only writes the reply
+    riddle = await asyncio.to_thread(get_riddle_bank().last_sent, username)
+    solved = None
+    if riddle is not None:
+        replies = [msg.text for msg in messages if msg.text and (msg.username or "").lower() == username.lower()]
+        solved = any(answer_matches(riddle.answer, reply) for reply in replies)
+        if not solved:
+            print(f"ℹ️ @{username} hasn't solved the riddle yet, no reply needed")
+            return
+        chat_history_text += (
+            f"\n\nThe riddle we asked was: {riddle.riddle}\nIts canonical answer: {riddle.answer}\n"
+            "The user has answered it correctly; write the response message."
+        )
 
     input_state = {
         "messages": [{
@@ -45,7 +60,8 @@ async def handle_riddle_conversation(insta_client, username: str, messages: List
         }]
     }
 
-    response = await agent.arun(input_state)
+    final_state = await agent.ainvoke(input_state)
+    response = final_state["messages"][-1].content
 
     import json
     try:
@@ -54,6 +70,9 @@ async def handle_riddle_conversation(insta_client, username: str, messages: List
         print(f"⚠️ Failed to parse agent response as JSON: {response}")
         return
 
+    if solved is not None:
+        result["riddle_asked"], result["answered_correctly"] = True, solved
+
     if result.get("riddle_asked") and result.get("answered_correctly") and result.get("response_message"):
         reply = result["response_message"]
         print(f"📩 Sending riddle reply to @{username}: {reply}")
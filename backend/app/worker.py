@@ -0,0 +1,166 @@
+# app/worker.py
+"""
+Campaign/reply worker pool, separate from the API process.
+
+    python -m app.worker --processes 4 --concurrency 4 --poll-inbox
+
+The API enqueues jobs on the local SQLite queue (WORKER_MODE=true); each worker process
+claims and runs them with its own event loop, MCP session and model clients.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import time
+import traceback
+
+from app.core.config import settings
+from app.services.job_queue import JobQueue
+
+IDLE_POLL_SECONDS = 1.0
+RETRY_DELAY_SECONDS = 60
+SUPERVISE_SECONDS = 5
+
+
+async def handle_campaign(payload):
+    from pipeline.end_to_end_pipeline import run_instagram_campaign
+
+    return await run_instagram_campaign(
+        payload["product_payload"], dm_mode=payload.get("dm_mode"), pipelined=payload.get("pipelined"),
+        branch_deadline=payload.get("branch_deadline"), branch_token_budget=payload.get("branch_token_budget"),
+    )
+
+
+async def handle_reply_check(payload):
+    from app.utils.check_pending_chats import check_all_accounts
+
+    await check_all_accounts()
+
+
+async def handle_dm(payload):
+    """A single DM branch parked by a throttled campaign"""
+    from pipeline.end_to_end_pipeline import dm_creation_node
+
+    return await dm_creation_node(payload)
+
+
+async def handle_send_dm(payload):
+    """An already written and approved DM whose send was throttled"""
+    from app.services.instagram_client import client_for_target
+    from pipeline.riddle_bank import get_riddle_bank
+
+    result = await client_for_target(payload["username"]).send_message(payload["username"], payload["message"])
+    if payload.get("riddle_id") is not None:
+        await asyncio.to_thread(get_riddle_bank().mark_sent, payload["username"], payload["riddle_id"])
+    return result
+
+
+JOB_HANDLERS = {
+    "campaign": handle_campaign,
+    "reply_check": handle_reply_check,
+    "dm": handle_dm,
+    "send_dm": handle_send_dm,
+}
+
+
+async def heartbeat(queue: JobQueue, job, worker_id: str):
+    """Renew the job's lease while it runs, so long campaigns aren't taken for dead workers"""
+    while True:
+        await asyncio.sleep(settings.JOB_HEARTBEAT_SECONDS)
+        if not await asyncio.to_thread(queue.heartbeat, job.id, worker_id):
+            print(f"⚠️ [{os.getpid()}] job {job.id} lost its lease")
+            return
+
+
+async def run_job(queue: JobQueue, job, slots: asyncio.Semaphore, worker_id: str):
+    lease = asyncio.create_task(heartbeat(queue, job, worker_id))
+    try:
+        print(f"▶️ [{os.getpid()}] job {job.id} ({job.kind}), attempt {job.attempts}")
+        result = await JOB_HANDLERS[job.kind](job.payload)
+        await asyncio.to_thread(queue.complete, job.id, result)
+        print(f"✅ [{os.getpid()}] job {job.id} done")
+    except Exception as e:
+        traceback.print_exc()
+        # Throttled jobs come back once the account's pause is over
+        retry_delay = getattr(e, "retry_after", RETRY_DELAY_SECONDS)
+        await asyncio.to_thread(queue.fail, job.id, f"{type(e).__name__}: {e}", retry_delay)
+    finally:
+        lease.cancel()
+        slots.release()
+
+
+async def worker_loop(worker_id: str, concurrency: int):
+    """Claim jobs while there are free slots; each job runs as its own task on this process's loop"""
+    queue = JobQueue()
+    slots = asyncio.Semaphore(concurrency)
+    running = set()
+    while True:
+        await slots.acquire()
+        job = await asyncio.to_thread(queue.claim, worker_id)
+        if job is None:
+            slots.release()
+            await asyncio.sleep(IDLE_POLL_SECONDS)
+            continue
+        if job.kind not in JOB_HANDLERS:
+            await asyncio.to_thread(queue.fail, job.id, f"Unknown job kind '{job.kind}'", 0)
+            slots.release()
+            continue
+        task = asyncio.create_task(run_job(queue, job, slots, worker_id))
+        running.add(task)
+        task.add_done_callback(running.discard)
+
+
+def worker_main(index: int, concurrency: int):
+    worker_id = f"worker-{index}-{os.getpid()}"
+    # Work parked from inside a job goes back on the queue this pool serves
+    settings.WORKER_MODE = True
+    print(f"👷 {worker_id} started (concurrency {concurrency})")
+    asyncio.run(worker_loop(worker_id, concurrency))
+
+
+def requeue_stale(queue: JobQueue):
+    requeued = queue.requeue_stale(settings.JOB_LEASE_SECONDS)
+    if requeued:
+        print(f"♻️ Re-queued {requeued} jobs left running by a dead worker")
+
+
+def run_pool(processes: int, concurrency: int, poll_inbox: bool):
+    queue = JobQueue()
+    requeue_stale(queue)
+
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=worker_main, args=(i, concurrency), daemon=True) for i in range(processes)]
+    for w in workers:
+        w.start()
+
+    if poll_inbox:
+        from app.utils.check_pending_chats import CHECK_INTERVAL_SECONDS
+
+    next_poll = time.time()
+    try:
+        while True:
+            if poll_inbox and time.time() >= next_poll:
+                # One inbox check at a time: a slow check isn't stacked up behind new ones
+                queue.enqueue_unique("reply_check", {})
+                next_poll = time.time() + CHECK_INTERVAL_SECONDS
+            for i, w in enumerate(workers):
+                if not w.is_alive():
+                    print(f"⚠️ worker {i} exited ({w.exitcode}), restarting")
+                    workers[i] = ctx.Process(target=worker_main, args=(i, concurrency), daemon=True)
+                    workers[i].start()
+            # Jobs of a worker that died (or hung) go back to the queue once their lease runs out
+            requeue_stale(queue)
+            time.sleep(SUPERVISE_SECONDS)
+    except KeyboardInterrupt:
+        for w in workers:
+            w.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run campaign/reply workers")
+    parser.add_argument("--processes", type=int, default=settings.WORKER_PROCESSES or os.cpu_count())
+    parser.add_argument("--concurrency", type=int, default=settings.WORKER_CONCURRENCY)
+    parser.add_argument("--poll-inbox", action="store_true", help="Enqueue a reply_check job every check interval")
+    args = parser.parse_args()
+    run_pool(args.processes, args.concurrency, args.poll_inbox)
@@ -0,0 +1,53 @@
+"""
+Measure prompt-token savings of DM supervisor compaction on a synthetic transcript.
+
+    python -m benchmarks.compaction_savings [iterations]
+
+Each iteration is one writer -> verifier round trip with hand-offs, as produced by
+create_dm_supervisor with add_handoff_back_messages=True.
+"""
+import sys
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from pipeline.dm_compaction import compact_messages, count_message_tokens
+
+PROFILE = "Posts mostly Dragon Ball figure unboxings, shelf tours and con photos from MCM London. " * 20
+DRAFT = "Hey! Loved your Vegeta shelf tour - the lighting is unreal. We just got the S.H. Figuarts Goku in... " * 6
+REVIEW = "Personalization is good but the CTA is too pushy and the riddle is missing the promo line. Revise. " * 8
+
+
+def _handoff(agent: str, i: int):
+    call_id = f"call_{agent}_{i}"
+    return [
+        AIMessage(content="", name="supervisor", tool_calls=[{"name": f"transfer_to_{agent}", "args": {}, "id": call_id}]),
+        ToolMessage(content=f"Successfully transferred to {agent}", tool_call_id=call_id),
+    ]
+
+
+def _handback(agent: str, i: int):
+    call_id = f"back_{agent}_{i}"
+    return [
+        AIMessage(content="Transferring back to supervisor", name=agent,
+                  tool_calls=[{"name": "transfer_back_to_supervisor", "args": {}, "id": call_id}]),
+        ToolMessage(content="Successfully transferred back to supervisor", tool_call_id=call_id),
+    ]
+
+
+def build_transcript(iterations: int):
+    messages = [HumanMessage(content="Research @goku_collector and create a personalized sales DM about the S.H. Figuarts Goku.")]
+    messages += _handoff("profile_analyzer", 0) + [AIMessage(content=PROFILE, name="profile_analyzer")] + _handback("profile_analyzer", 0)
+    for i in range(iterations):
+        messages += _handoff("message_writer", i) + [AIMessage(content=DRAFT, name="message_writer")] + _handback("message_writer", i)
+        messages += _handoff("verifier", i) + [AIMessage(content=REVIEW, name="verifier")] + _handback("verifier", i)
+    return messages
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"{'iter':>4} {'msgs':>5} {'before':>8} {'after':>7} {'saved':>6}")
+    for i in range(1, iterations + 1):
+        messages = build_transcript(i)
+        before = count_message_tokens(messages)
+        after = count_message_tokens(compact_messages(messages))
+        print(f"{i:>4} {len(messages):>5} {before:>8} {after:>7} {100 * (before - after) / before:>5.1f}%")
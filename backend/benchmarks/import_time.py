@@ -0,0 +1,66 @@
+"""
+Import-time budget check, based on `python -X importtime`.
+
+    python -m benchmarks.import_time [module] [budget_ms]
+
+Imports the module in a fresh interpreter, prints the slowest imports and exits
+non-zero if the cumulative import time exceeds the budget. Defaults to app.main
+with a 1000ms budget (API/worker cold start).
+"""
+import os
+import subprocess
+import sys
+
+DEFAULT_MODULE = "app.main"
+DEFAULT_BUDGET_MS = 1000
+TOP_N = 15
+
+# Modules that must never be imported just by loading the API
+LAZY_MODULES = (
+    "langchain_openai",
+    "langgraph_supervisor",
+    "langchain_community",
+    "langchain_mcp_adapters",
+    "instagrapi",
+    "supabase",
+    "pipeline.end_to_end_pipeline",
+)
+
+
+def measure(module: str):
+    """Return [(cumulative_us, self_us, name)] for every import made by `import module`"""
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        rows.append((int(cumulative_us), int(self_us), name))
+    return rows
+
+
+if __name__ == "__main__":
+    module = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_MODULE
+    budget_ms = float(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_BUDGET_MS
+
+    rows = measure(module)
+    total_ms = next(cum for cum, _, name in rows if name == module) / 1000
+
+    print(f"Slowest imports for {module}:")
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:TOP_N]:
+        print(f"  {cumulative_us / 1000:8.1f}ms  (self {self_us / 1000:6.1f}ms)  {name.strip()}")
+
+    eager = sorted({name.strip() for _, _, name in rows if name.strip() in LAZY_MODULES})
+    if eager:
+        print(f"\n❌ Eagerly imported (should be lazy): {', '.join(eager)}")
+    print(f"\nTotal: {total_ms:.1f}ms (budget {budget_ms:.0f}ms)")
+    if total_ms > budget_ms or eager:
+        sys.exit(1)
+    print("✅ Within budget")
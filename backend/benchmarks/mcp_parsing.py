@@ -0,0 +1,121 @@
+"""
+Compare loose dict parsing with the typed MCP response models on a large list_chats payload.
+
+    python -m benchmarks.mcp_parsing [threads] [repeats]
+
+The "loose" path is the old polling loop: json.loads plus nested .get() chains per thread.
+The "typed" path is decode_chat_list (msgspec structs, one pass) plus attribute access.
+"""
+import json
+import sys
+import time
+import tracemalloc
+
+from app.services.mcp_models import decode_chat_list
+
+MY_USERNAME = "instamcp2"
+
+
+def build_payload(threads: int) -> str:
+    """Threads shaped like the MCP server's list_chats output (instagrapi thread dumps)"""
+    def user(i: int):
+        return {
+            "pk": str(10_000 + i), "username": f"user_{i}", "full_name": f"User {i}",
+            "profile_pic_url": "https://scontent.cdninstagram.com/v/t51.2885-19/" + "p" * 80,
+            "profile_pic_id": f"{i}_1", "is_private": False, "is_verified": False,
+            "follower_count": 1000 + i, "following_count": 300, "media_count": 42,
+        }
+
+    def thread(i: int):
+        them = user(i)
+        sender = MY_USERNAME if i % 3 == 0 else them["username"]
+        return {
+            "thread_id": str(340282366841710300949128 + i),
+            "thread_title": them["full_name"],
+            "users": [them],
+            "inviter": user(0),
+            "last_activity_at": 1718000000 + i,
+            "muted": False, "is_pin": False, "named": False, "canonical": True, "pending": False,
+            "archived": False, "thread_type": "private", "is_group": False,
+            "last_message": {
+                "item_id": str(3100000 + i), "user_id": them["pk"], "user": {"username": sender},
+                "timestamp": "2025-06-10T12:00:00", "item_type": "text", "is_shh_mode": False,
+                "reactions": {"likes_count": 0, "emojis": []},
+                "text": "Is the answer a shadow? I think it's a shadow! " * 3,
+            },
+        }
+    return json.dumps({"success": True, "threads": [thread(i) for i in range(threads)]})
+
+
+def loose(payload: str):
+    resp = json.loads(payload)
+    unread = []
+    if not resp.get("success") or not resp.get("threads"):
+        return unread
+    for thread in resp["threads"]:
+        thread_id = thread.get("thread_id")
+        users = thread.get("users", [])
+        username = users[0].get("username") if users else None
+        if not thread_id or not username:
+            continue
+        last_message = thread.get("last_message") or {}
+        last_sender = last_message.get("user", {}).get("username") or last_message.get("username")
+        if last_sender and last_sender.lower() == MY_USERNAME:
+            continue
+        unread.append((thread_id, username))
+    return unread
+
+
+def typed(payload: str):
+    resp = decode_chat_list(payload)
+    unread = []
+    for thread in resp.threads:
+        username = thread.username
+        if not username:
+            continue
+        last_sender = thread.last_message.username if thread.last_message else None
+        if last_sender and last_sender.lower() == MY_USERNAME:
+            continue
+        unread.append((thread.thread_id, username))
+    return unread
+
+
+def bench(fn, payload: str, repeats: int):
+    best = min(_timed(fn, payload) for _ in range(repeats))
+    tracemalloc.start()
+    fn(payload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def _timed(fn, payload: str) -> float:
+    start = time.perf_counter()
+    fn(payload)
+    return time.perf_counter() - start
+
+
+def retained_bytes(payload: str):
+    """Memory still held by the decoded response the caller keeps around"""
+    results = {}
+    for name, decode in (("loose", json.loads), ("typed", decode_chat_list)):
+        tracemalloc.start()
+        kept = decode(payload)
+        results[name] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del kept
+    return results
+
+
+if __name__ == "__main__":
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    payload = build_payload(threads)
+    assert loose(payload) == typed(payload)
+
+    print(f"list_chats payload: {threads} threads, {len(payload) / 1024:.0f} KiB")
+    print(f"{'path':>6} {'best ms':>8} {'us/thread':>10} {'peak KiB':>9} {'kept KiB':>9}")
+    kept = retained_bytes(payload)
+    for name, fn in (("loose", loose), ("typed", typed)):
+        best, peak = bench(fn, payload, repeats)
+        print(f"{name:>6} {best * 1000:>8.2f} {best * 1e6 / threads:>10.2f} {peak / 1024:>9.0f} {kept[name] / 1024:>9.0f}")
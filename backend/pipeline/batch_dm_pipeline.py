@@ -0,0 +1,130 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from app.core.config import settings
+from app.core.budget import record_result
+from app.core.model_router import get_chat_model
+from app.services.instagram_client import InstagramClient, client_for_target, get_instagram_client
+from app.services.mcp_models import UserPosts
+from app.services.throttle import ThrottledError, park_job
+from pipeline.candidate_ranking import DIGEST_POSTS, digest_line
+from pipeline.dm_creation_prompts import batch_writer_prompt
+from pipeline.dm_preverifier import DraftContext, preverify
+from pipeline.riddle_bank import Riddle, assign_riddles, record_riddle_sent
+
+
+class BatchDM(BaseModel):
+    username: str = Field(description="Target username exactly as given, without @")
+    dm: str = Field(description="Full DM text, ending with the riddle and promocode offer")
+    riddle: str = Field(description="The riddle asked at the end of the DM")
+    riddle_answer: str = Field(description="Canonical answer to the riddle")
+
+
+class BatchDMs(BaseModel):
+    messages: List[BatchDM]
+
+
+def build_profile_digest(posts: UserPosts) -> List[str]:
+    """Squash a get_user_posts response down to a few short captions"""
+    return [digest_line(post.caption) for post in posts.posts[:DIGEST_POSTS] if post.caption.strip()]
+
+
+async def fetch_profile_digests(insta: InstagramClient, usernames: List[str],
+                                known: Optional[Dict[str, List[str]]] = None) -> Dict[str, List[str]]:
+    """
+    A digest per user: the posts already seen during discovery, fetched concurrently over MCP
+    only for users whose known digest is too thin. A failed fetch keeps what was known.
+    """
+    known = known or {}
+
+    async def fetch(username: str) -> List[str]:
+        lines = known.get(username) or []
+        if len(lines) >= settings.MEDIA_DIGEST_MIN_POSTS:
+            return lines
+        try:
+            return build_profile_digest(await insta.get_user_posts(username, count=DIGEST_POSTS)) or lines
+        except Exception as e:
+            print(f"⚠️ Could not fetch posts for @{username}: {e}")
+            return lines
+
+    digests = await asyncio.gather(*(fetch(u) for u in usernames))
+    return dict(zip(usernames, digests))
+
+
+def validate_batch_dm(dm: BatchDM) -> List[str]:
+    """
+    Deterministic checks on one generated DM - returns a list of problems (empty if valid).
+    The pre-verifier's rules, minus the profile check: batched and template DMs have no verifier after them.
+    """
+    if not dm.riddle.strip():
+        return ["riddle missing from DM"]
+    rules = [r for r in settings.DM_PREVERIFY_RULES if r != "profile"]
+    problems = preverify(dm.dm, DraftContext(riddle=dm.riddle), rules).problems()
+    if not dm.riddle_answer.strip():
+        problems.append("riddle answer missing")
+    return problems
+
+
+def validate_batch(usernames: List[str], batch: BatchDMs, riddles: Optional[Dict[str, Riddle]] = None) -> Dict[str, Any]:
+    """
+    Match generated DMs back to requested users; each user gets either a BatchDM or a list of problems.
+    Users given a riddle from the bank keep its canonical text and answer, whatever the model returned.
+    """
+    riddles = riddles or {}
+    results: Dict[str, Any] = {u: ["no DM generated"] for u in usernames}
+    wanted = {u.lower(): u for u in usernames}
+    seen = set()
+    for dm in batch.messages:
+        key = dm.username.lstrip("@").strip().lower()
+        if key not in wanted or key in seen:
+            continue
+        seen.add(key)
+        if wanted[key] in riddles:
+            dm = dm.model_copy(update={"riddle": riddles[wanted[key]].riddle, "riddle_answer": riddles[wanted[key]].answer})
+        problems = validate_batch_dm(dm)
+        results[wanted[key]] = problems or dm
+    return results
+
+
+async def batch_dm_creation(usernames: List[str], product_info: str,
+                            media_digests: Optional[Dict[str, List[str]]] = None, product_category: str = "") -> List[str]:
+    """
+    Fast mode: one structured-output LLM call writes DMs + riddles for a whole batch of users.
+    Returns dm_results entries in the same format as the supervisor branch.
+    """
+    digests, riddles = await asyncio.gather(
+        fetch_profile_digests(get_instagram_client(), usernames, media_digests), assign_riddles(usernames, product_info, product_category)
+    )
+
+    users_block = "\n\n".join(
+        f"USERNAME: {u}\n" + (f"RIDDLE: {riddles[u].riddle}\n" if u in riddles else "")
+        + f"RECENT POSTS:\n{chr(10).join(digests[u]) or '(none)'}"
+        for u in usernames
+    )
+    llm = get_chat_model("batch_writer").with_structured_output(BatchDMs)
+    batch = await llm.ainvoke([
+        {"role": "system", "content": batch_writer_prompt},
+        {"role": "user", "content": f"PRODUCT:\n{product_info}\n\nUSERS:\n{users_block}"},
+    ])
+
+    dm_results = []
+    for username, outcome in validate_batch(usernames, batch, riddles).items():
+        dm_results.append(record_result(username, await send_batch_dm(username, outcome, riddles.get(username))))
+    return dm_results
+
+
+async def send_batch_dm(username: str, outcome, riddle: Optional[Riddle]) -> str:
+    """Send one validated DM of the batch (outcome is the DM, or its list of problems); returns its dm_results entry"""
+    if isinstance(outcome, list):
+        return f"FAIL: @{username}: Failed - {'; '.join(outcome)}"
+    try:
+        await client_for_target(username).send_message(username, outcome.dm)
+        await record_riddle_sent(username, riddle)
+        return f"SUCCESS: @{username}: {outcome.dm[:100]}..."
+    except ThrottledError as e:
+        payload = {"username": username, "message": outcome.dm, "riddle_id": riddle.id if riddle else None}
+        return await park_job("send_dm", payload, username, e)
+    except Exception as e:
+        return f"FAIL: @{username}: Failed - {str(e)}"
@@ -0,0 +1,242 @@
+import asyncio
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Score = FEATURE_WEIGHTS · normalised features. Follower bands favour micro-creators, who
+# answer DMs far more often than large accounts; unknown follower counts score as neutral.
+FEATURES = ("tag_coverage", "post_count", "recency", "engagement", "follower_band")
+FEATURE_WEIGHTS = np.array([0.35, 0.10, 0.20, 0.20, 0.15])
+FOLLOWER_BAND_EDGES = np.array([1_000, 10_000, 100_000])
+FOLLOWER_BAND_SCORES = np.array([0.6, 1.0, 0.7, 0.2])  # <1k, 1k-10k, 10k-100k, 100k+
+UNKNOWN_FOLLOWER_SCORE = 0.5
+RECENCY_HALF_LIFE_DAYS = 14.0
+# Fixed scales for absolute scores (rank(absolute=True)), which don't depend on who else is in the pool
+ABSOLUTE_MIN_TAGS = 3  # coverage counts against at least this many hashtags, however few were searched yet
+ABSOLUTE_POST_COUNT = 3.0
+ABSOLUTE_ENGAGEMENT = float(np.log1p(200))  # ~200 likes-equivalent per post scores full marks
+DIGEST_POSTS = 3
+DIGEST_CAPTION_CHARS = 200
+
+
+def digest_line(caption: str, taken_at: Optional[float] = None) -> str:
+    """One post squashed to a short prompt line"""
+    caption = " ".join((caption or "").split())[:DIGEST_CAPTION_CHARS]
+    if taken_at:
+        return f"- {time.strftime('%Y-%m-%d', time.gmtime(taken_at))}: {caption}"
+    return f"- {caption}"
+
+
+@dataclass(slots=True)
+class MediaRecord:
+    username: str
+    user_pk: str
+    hashtag: str
+    taken_at: float  # unix seconds
+    like_count: int = 0
+    comment_count: int = 0
+    media_pk: str = ""
+    caption: str = ""
+    full_name: str = ""
+
+
+@dataclass
+class RankedCandidate:
+    username: str
+    score: float
+    features: Dict[str, float]
+
+
+class CandidatePool:
+    """
+    Every media fetched for a campaign's hashtags, stored column-wise so all candidates can be
+    scored in one vectorized pass. Ranking is deterministic: ties are broken by username.
+    """
+
+    def __init__(self):
+        self.usernames: List[str] = []
+        self.media_hashtags: List[str] = []
+        self.taken_at: List[float] = []
+        self.likes: List[int] = []
+        self.comments: List[int] = []
+        self.media_pks: List[str] = []
+        self.captions: List[str] = []
+        self.user_pks: Dict[str, str] = {}
+        self.full_names: Dict[str, str] = {}
+        self.followers: Dict[str, int] = {}
+        self.hashtags: set = set()
+
+    def add(self, records: List[MediaRecord], hashtags: List[str]):
+        for r in records:
+            self.usernames.append(r.username)
+            self.media_hashtags.append(r.hashtag.lower())
+            self.taken_at.append(r.taken_at)
+            self.likes.append(r.like_count)
+            self.comments.append(r.comment_count)
+            self.media_pks.append(r.media_pk)
+            self.captions.append(r.caption)
+            self.user_pks[r.username] = r.user_pk
+            if r.full_name:
+                self.full_names[r.username] = r.full_name
+        self.hashtags.update(h.lower() for h in hashtags)
+
+    def set_followers(self, username: str, follower_count: int):
+        self.followers[username] = follower_count
+
+    def hashtag_yields(self) -> Dict[str, int]:
+        """Distinct candidates found per searched hashtag"""
+        users: Dict[str, set] = {}
+        for name, tag in zip(self.usernames, self.media_hashtags):
+            users.setdefault(tag, set()).add(name)
+        return {tag: len(names) for tag, names in users.items()}
+
+    def media_digests(self, usernames: List[str], limit: int = DIGEST_POSTS) -> Dict[str, List[str]]:
+        """Each user's newest captioned posts seen during discovery, as digest lines (newest first)"""
+        digests: Dict[str, List[str]] = {u: [] for u in usernames}
+        rows = sorted((i for i, u in enumerate(self.usernames) if u in digests), key=lambda i: -self.taken_at[i])
+        seen = set()
+        for i in rows:
+            lines = digests[self.usernames[i]]
+            key = self.media_pks[i] or (self.usernames[i], self.captions[i])
+            if len(lines) >= limit or not self.captions[i].strip() or key in seen:
+                continue
+            seen.add(key)  # the same post is fetched once per matching hashtag
+            lines.append(digest_line(self.captions[i], self.taken_at[i]))
+        return digests
+
+    def __len__(self) -> int:
+        return len(set(self.usernames))
+
+    def rank(self, k: Optional[int] = None, now: Optional[float] = None, absolute: bool = False) -> List[RankedCandidate]:
+        """
+        The top k candidates (all if k is None), best first. Scores are min-max normalised within the
+        pool, so they only compare candidates of the same pool; absolute=True scores every feature on a
+        fixed scale instead, so a score means the same in a pool of 2 as in a pool of 200.
+        """
+        if not self.usernames:
+            return []
+        now = now or time.time()
+
+        names, user_idx = np.unique(self.usernames, return_inverse=True)
+        tags, tag_idx = np.unique(self.media_hashtags, return_inverse=True)
+        taken_at = np.asarray(self.taken_at, dtype=float)
+        likes = np.asarray(self.likes, dtype=float)
+        comments = np.asarray(self.comments, dtype=float)
+        n_users = len(names)
+
+        # Distinct target hashtags per user (a user posting twice under one tag counts once)
+        pairs = np.unique(user_idx * len(tags) + tag_idx)
+        user_tags = np.bincount(pairs // len(tags), minlength=n_users)
+        tag_coverage = user_tags / max(len(self.hashtags), len(tags))
+
+        post_count = np.bincount(user_idx, minlength=n_users).astype(float)
+
+        age_days = np.clip(now - taken_at, 0, None) / 86_400
+        recency = np.zeros(n_users)
+        np.maximum.at(recency, user_idx, np.exp2(-age_days / RECENCY_HALF_LIFE_DAYS))
+
+        engagement = np.bincount(user_idx, weights=np.log1p(likes + 2 * comments), minlength=n_users) / post_count
+
+        follower_counts = np.array([self.followers.get(n, -1) for n in names], dtype=float)
+        follower_band = np.where(
+            follower_counts < 0,
+            UNKNOWN_FOLLOWER_SCORE,
+            FOLLOWER_BAND_SCORES[np.searchsorted(FOLLOWER_BAND_EDGES, follower_counts, side="right")],
+        )
+
+        matrix = np.column_stack([tag_coverage, post_count, recency, engagement, follower_band])
+        if absolute:
+            normalised = np.column_stack([
+                user_tags / max(len(self.hashtags), len(tags), ABSOLUTE_MIN_TAGS),
+                np.minimum(post_count / ABSOLUTE_POST_COUNT, 1.0),
+                recency,
+                np.minimum(engagement / ABSOLUTE_ENGAGEMENT, 1.0),
+                follower_band,
+            ])
+        else:
+            span = matrix.max(axis=0) - matrix.min(axis=0)
+            normalised = np.divide(matrix - matrix.min(axis=0), span, out=np.ones_like(matrix), where=span > 0)
+            normalised[:, FEATURES.index("tag_coverage")] = tag_coverage  # already 0-1 and comparable across pools
+            normalised[:, FEATURES.index("follower_band")] = follower_band
+        scores = normalised @ FEATURE_WEIGHTS
+
+        # np.unique sorted the names, so a stable sort on -score breaks ties alphabetically.
+        # For large pools only the top k (plus anything tied with the k-th score) gets sorted.
+        candidates = np.arange(n_users)
+        if k is not None and k < n_users:
+            kth = np.partition(-scores, k - 1)[k - 1]
+            candidates = np.flatnonzero(-scores <= kth)
+        order = candidates[np.argsort(-scores[candidates], kind="stable")][:k]
+        return [
+            RankedCandidate(str(names[i]), float(scores[i]), dict(zip(FEATURES, matrix[i].round(3).tolist())))
+            for i in order
+        ]
+
+    def top_k(self, k: int) -> List[str]:
+        return [c.username for c in self.rank(k)]
+
+
+# The user finder tools add to the pool of the campaign that is currently running
+current_pool: ContextVar[Optional[CandidatePool]] = ContextVar("candidate_pool", default=None)
+
+
+class DiscoveryFeed:
+    """
+    Pipelined campaigns: hands confirmed candidates to the DM workers while discovery is still
+    running. After every search, candidates in the pool's current top `limit` are confirmed if
+    their absolute score (fixed scales, not relative to the pool) is at least min_score, so a
+    tiny early pool can't make a weak candidate look strong. When discovery ends the final
+    ranking fills whatever is left of the limit. A candidate is dispatched at most once, and a
+    None per worker marks the end of the feed.
+    """
+
+    def __init__(self, limit: int, min_score: float, workers: int):
+        self.limit = limit
+        self.min_score = min_score
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.dispatched: List[str] = []
+        self.media_digests: Dict[str, List[str]] = {}
+        self.full_names: Dict[str, str] = {}
+        self.closed = False
+
+    def _dispatch(self, username: str, media_digest: List[str], full_name: Optional[str]):
+        self.dispatched.append(username)
+        if full_name:
+            self.full_names[username] = full_name
+        self.media_digests[username] = media_digest
+        self.queue.put_nowait((username, media_digest))
+
+    def offer(self, pool: CandidatePool):
+        """Confirm the strongest candidates found so far"""
+        if self.closed:
+            return
+        absolute = {c.username: c.score for c in pool.rank(absolute=True)}
+        for c in pool.rank(self.limit):
+            if len(self.dispatched) >= self.limit:
+                return
+            if absolute[c.username] >= self.min_score and c.username not in self.dispatched:
+                print(f"📤 Confirmed @{c.username} (score {absolute[c.username]:.2f}) - DM creation starts now")
+                self._dispatch(c.username, pool.media_digests([c.username])[c.username], pool.full_names.get(c.username))
+
+    def finish(self, final_users: List[str], media_digests: Dict[str, List[str]], full_names: Dict[str, str]):
+        """Discovery is over: fill the remaining slots from the final ranking and close the feed"""
+        for username in final_users:
+            if len(self.dispatched) >= self.limit:
+                break
+            if username not in self.dispatched:
+                self._dispatch(username, media_digests.get(username, []), full_names.get(username))
+        self.close()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            for _ in range(self.workers):
+                self.queue.put_nowait(None)
+
+
+# Set only while a pipelined campaign's user finder runs
+current_feed: ContextVar[Optional[DiscoveryFeed]] = ContextVar("discovery_feed", default=None)
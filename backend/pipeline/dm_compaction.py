@@ -0,0 +1,185 @@
+import re
+from typing import Dict, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+from app.core.config import settings
+from app.core.metrics import Counter, Histogram, DEFAULT_TOKEN_BUCKETS
+
+
+# Which subagent output becomes which section of the structured summary
+SUMMARY_SECTIONS = {
+    "profile_analyzer": "PROFILE FACTS",
+    "message_writer": "CURRENT DRAFT",
+    "verifier": "VERIFIER VERDICT",
+}
+
+MIN_SECTION_TOKENS = 64
+
+# Supervisor hand-offs carry no facts; every other tool result (get_user_info, ...) is kept
+HANDOFF_TOOL_PREFIXES = ("transfer_to_", "transfer_back_to_")
+
+COMPACTION_TOKENS_BEFORE = Histogram(
+    "dm_compaction_tokens_before", "Prompt tokens per turn before compaction", ["agent"], buckets=DEFAULT_TOKEN_BUCKETS
+)
+COMPACTION_TOKENS_AFTER = Histogram(
+    "dm_compaction_tokens_after", "Prompt tokens per turn after compaction", ["agent"], buckets=DEFAULT_TOKEN_BUCKETS
+)
+COMPACTION_TOKENS_SAVED = Counter("dm_compaction_tokens_saved_total", "Prompt tokens removed by compaction", ["agent"])
+
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with tiktoken's o200k encoding (o4-mini family), or ~4 chars/token if unavailable"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def _content_text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return str(content)
+
+
+def count_message_tokens(messages: List[BaseMessage]) -> int:
+    total = 0
+    for m in messages:
+        total += 4 + count_tokens(_content_text(m))  # ~4 tokens of per-message framing
+        for call in getattr(m, "tool_calls", None) or []:
+            total += count_tokens(call["name"]) + count_tokens(str(call.get("args", "")))
+    return total
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if count_tokens(text) <= max_tokens:
+        return text
+    # Chars-per-token ratio of this text, so we only need one re-encode
+    ratio = len(text) / max(count_tokens(text), 1)
+    return text[: int(max_tokens * ratio)].rstrip() + " …[truncated]"
+
+
+def extract_verdict(text: str) -> str:
+    """Pull a one-word verdict out of free-form verifier output"""
+    matches = re.findall(r"\b(approved?|revise|revisions?|reject(?:ed)?)\b", text, flags=re.IGNORECASE)
+    if not matches:
+        return "UNKNOWN"
+    return "APPROVED" if matches[-1].lower().startswith("approve") else "REVISE"
+
+
+def summarize_transcript(messages: List[BaseMessage], section_tokens: int) -> Optional[HumanMessage]:
+    """
+    Replace subagent transcripts with the latest output of each subagent and the latest result
+    of each tool, as a structured summary. Hand-off tool calls and their tool messages are dropped.
+    """
+    latest: Dict[str, str] = {}
+    tool_results: Dict[str, str] = {}
+    call_names: Dict[str, str] = {}
+    drafts = 0
+    for m in messages:
+        for call in getattr(m, "tool_calls", None) or []:
+            call_names[call["id"]] = call["name"]
+        if isinstance(m, AIMessage) and m.name in SUMMARY_SECTIONS and _content_text(m).strip():
+            latest[m.name] = _content_text(m).strip()
+            drafts += m.name == "message_writer"
+        elif isinstance(m, ToolMessage) and _content_text(m).strip():
+            tool = m.name or call_names.get(m.tool_call_id, "tool")
+            if not tool.startswith(HANDOFF_TOOL_PREFIXES):
+                tool_results[tool] = _content_text(m).strip()
+
+    if not latest and not tool_results:
+        return None
+
+    lines = ["CONTEXT SUMMARY (earlier turns compacted):"]
+    for agent, section in SUMMARY_SECTIONS.items():
+        if agent not in latest:
+            continue
+        text = latest[agent]
+        if agent == "verifier":
+            text = f"{extract_verdict(text)} - {text}"
+        lines.append(f"{section}: {truncate_to_tokens(text, section_tokens)}")
+    if tool_results:
+        lines.append("TOOL RESULTS:")
+        lines.extend(f"- {name}: {truncate_to_tokens(text, section_tokens)}" for name, text in tool_results.items())
+    if drafts > 1:
+        lines.append(f"DRAFTS SO FAR: {drafts}")
+    return HumanMessage(content="\n".join(lines), name="compaction")
+
+
+def _tail_start(messages: List[BaseMessage], keep_last: int) -> int:
+    """Index where the verbatim tail begins - never splitting a tool call from its tool messages"""
+    start = max(1, len(messages) - keep_last)
+    while start > 1 and isinstance(messages[start], ToolMessage):
+        start -= 1
+    return start
+
+
+def compact_messages(
+    messages: List[BaseMessage],
+    token_ceiling: Optional[int] = None,
+    keep_last: Optional[int] = None,
+) -> List[BaseMessage]:
+    """
+    Build the message list actually sent to the model: the original task, a structured summary
+    of everything older than the last `keep_last` messages, then those messages verbatim.
+    The result is squeezed until it fits under `token_ceiling`.
+    """
+    token_ceiling = token_ceiling or settings.DM_CONTEXT_TOKEN_CEILING
+    keep_last = keep_last or settings.DM_COMPACTION_KEEP_LAST
+    if count_message_tokens(messages) <= token_ceiling:
+        return list(messages)
+
+    task = messages[:1]
+    start = _tail_start(messages, keep_last)
+    head, tail = messages[1:start], list(messages[start:])
+
+    section_tokens = max(token_ceiling // 4, MIN_SECTION_TOKENS)
+    while True:
+        summary = summarize_transcript(head, section_tokens)
+        compacted = task + ([summary] if summary else []) + tail
+        if count_message_tokens(compacted) <= token_ceiling:
+            return compacted
+        if section_tokens > MIN_SECTION_TOKENS:
+            section_tokens = max(section_tokens // 2, MIN_SECTION_TOKENS)
+            continue
+        if len(tail) > 1:
+            # Fold the oldest tail message into the summary, keeping tool call/result pairs intact
+            cut = 1
+            while cut < len(tail) and isinstance(tail[cut], ToolMessage):
+                cut += 1
+            head, tail = head + tail[:cut], tail[cut:]
+            continue
+        break
+
+    # Last resort: hard-truncate every message body to share the ceiling
+    per_message = max(token_ceiling // max(len(compacted), 1) - 8, 16)
+    return [
+        m.model_copy(update={"content": truncate_to_tokens(_content_text(m), per_message)})
+        for m in compacted
+    ]
+
+
+def make_compaction_hook(agent_name: str, token_ceiling: Optional[int] = None, keep_last: Optional[int] = None):
+    """pre_model_hook for create_react_agent/create_supervisor: compacts what the model sees, not the stored state"""
+
+    def compaction_hook(state):
+        messages = state["messages"]
+        compacted = compact_messages(messages, token_ceiling, keep_last)
+        before = count_message_tokens(messages)
+        after = count_message_tokens(compacted)
+        COMPACTION_TOKENS_BEFORE.observe(before, agent=agent_name)
+        COMPACTION_TOKENS_AFTER.observe(after, agent=agent_name)
+        COMPACTION_TOKENS_SAVED.inc(max(before - after, 0), agent=agent_name)
+        return {"llm_input_messages": compacted}
+
+    return compaction_hook
@@ -1,19 +1,27 @@
 import asyncio
 import os
-from typing import Dict, Any, List
+from dataclasses import replace
+from typing import Dict, Any, List, Optional
 from langgraph_supervisor import create_supervisor
-from langgraph.prebuilt import create_react_agent
-from langgraph.graph import MessagesState
+from langgraph.prebuilt import create_react_agent, ToolNode
+from langgraph.graph import MessagesState, StateGraph, START, END
+from langgraph.types import Command
 from langchain_mcp_adapters.client import MultiServerMCPClient
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import convert_to_messages
+from langchain_core.messages import AIMessage, convert_to_messages
 from pydantic import BaseModel
 
 from pipeline.dm_creation_prompts import profile_analyzer_prompt, verifier_prompt, message_writer_prompt, supervisor_prompt
+from pipeline.dm_compaction import _content_text, make_compaction_hook
+from pipeline.dm_preverifier import DraftContext, preverify, record_outcome
+from app.core.metrics import metrics_config
+from app.core.budget import record_result
+from app.core.tracing import traced_config
+from app.core.model_router import get_chat_model
+from app.core.config import settings
+from app.core.accounts import get_registry
+from app.services.throttle import ThrottleCallbackHandler, throttle_aware_tool_errors
 
 
-MODEL = "o4-mini"
-PROVIDER = "openai"
 
 # class CampaignState(MessagesState):
 #     product: Dict[str, Any] = {}
@@ -33,12 +41,13 @@ class DMResult(BaseModel):
 
 
 
-async def setup_instagram_tools(filter_tools=None):
-    """Setup MCP client to get Instagram tools via HTTP"""
-    
+async def setup_instagram_tools(filter_tools=None, account=None):
+    """Setup MCP client to get Instagram tools via HTTP for a sender account (default account if None)"""
+
+    account = account or get_registry().default
     client = MultiServerMCPClient({
         "instagram_dm": {
-            "url": "http://localhost:8000/mcp",
+            "url": account.mcp_url,
             "transport": "streamable_http",
         }
     })
@@ -53,6 +62,10 @@ async def setup_instagram_tools(filter_tools=None):
         elif isinstance(filter_tools, list):
             # List of tool names
             tools = [tool for tool in tools if tool.name in filter_tools]
+
+    # Every call goes through the account's AIMD throttle
+    for tool in tools:
+        tool.callbacks = [ThrottleCallbackHandler(account.username)]
     
     print(f"MCP TOOLS: Loaded {len(tools)} Instagram MCP tools via HTTP")
     return tools
@@ -83,52 +96,135 @@ async def setup_mock_tools():
     return [get_user_info, get_user_posts, send_message]
 
 
+def has_enough_posts(media_digest: Optional[List[str]]) -> bool:
+    """Whether the posts carried over from discovery are enough for the analyzer without get_user_posts"""
+    return len(media_digest or []) >= settings.MEDIA_DIGEST_MIN_POSTS
+
+
+def known_posts_note(username: str, media_digest: Optional[List[str]]) -> str:
+    """Prompt section with the posts discovery already fetched for this user (empty if none)"""
+    if not media_digest:
+        return ""
+    hint = "Use these instead of fetching posts again." if has_enough_posts(media_digest) else \
+        "That is not much - fetch more posts if you need them."
+    return f"\n\nRecent posts by @{username}, already fetched during discovery:\n" + "\n".join(media_digest) + f"\n{hint}"
+
+
+def latest_output(messages, agent_name: str) -> str:
+    """The most recent non-empty message a subagent returned to the supervisor"""
+    for m in reversed(messages):
+        if isinstance(m, AIMessage) and m.name == agent_name and _content_text(m).strip():
+            return _content_text(m).strip()
+    return ""
+
+
+def create_preverified_verifier(llm_verifier, context: DraftContext):
+    """
+    The verifier as the supervisor sees it: the rule-based pre-verifier checks the writer's latest
+    draft first and answers by itself when the draft clearly fails or clearly passes; only the
+    drafts in between reach the LLM verifier
+    """
+
+    def preverify_draft(state: MessagesState):
+        draft = latest_output(state["messages"], "message_writer")
+        if not draft:
+            return Command(goto="llm_verifier")
+        analysis = latest_output(state["messages"], "profile_analyzer")
+        verdict = preverify(draft, replace(context, profile=f"{context.profile}\n{analysis}"))
+        if record_outcome(verdict) == "llm":
+            return Command(goto="llm_verifier")
+        print(f"🧾 Pre-verifier settled the draft without the LLM verifier: {verdict.feedback().splitlines()[0]}")
+        return {"messages": [AIMessage(content=verdict.feedback(), name="verifier")]}
+
+    graph = StateGraph(MessagesState)
+    graph.add_node("preverify", preverify_draft, destinations=("llm_verifier",))
+    graph.add_node("llm_verifier", llm_verifier)
+    graph.add_edge(START, "preverify")
+    graph.add_edge("llm_verifier", END)
+    return graph.compile(name="verifier")
+
+
 # Create the three specialized agents
-async def create_dm_agents():
-    """Create all DM creation agents"""
+async def create_dm_agents(account=None, skip_tools=(), draft_context: Optional[DraftContext] = None):
+    """Create all DM creation agents; skip_tools are withheld from the profile analyzer"""
     
-    instagram_tools = await setup_instagram_tools()
-    tools = instagram_tools
+    instagram_tools = await setup_instagram_tools(account=account)
+    # ThrottledError escapes the tool node (other tool errors go back to the model as usual)
+    tools = ToolNode([t for t in instagram_tools if t.name not in skip_tools], handle_tool_errors=throttle_aware_tool_errors)
     
     profile_analyzer = create_react_agent(
-        model=f"{PROVIDER}:{MODEL}",
+        model=get_chat_model("profile_analyzer"),
         tools=tools,  # get_user_info, get_user_posts, etc.
         name="profile_analyzer",
+        pre_model_hook=make_compaction_hook("profile_analyzer"),
         prompt=profile_analyzer_prompt
     )
     
     message_writer = create_react_agent(
-        model=f"{PROVIDER}:{MODEL}", 
+        model=get_chat_model("message_writer"),
         tools=[],  # send_message, plus analysis tools
         name="message_writer", 
+        pre_model_hook=make_compaction_hook("message_writer"),
         prompt=message_writer_prompt
     )
     
-    verifier = create_react_agent(
-        model=f"{PROVIDER}:{MODEL}",
+    llm_verifier = create_react_agent(
+        model=get_chat_model("verifier"),
         tools=[],  # No Instagram tools, just verification
         name="verifier",
+        pre_model_hook=make_compaction_hook("verifier"),
         prompt=verifier_prompt
     )
+    verifier = create_preverified_verifier(llm_verifier, draft_context or DraftContext())
     
     return profile_analyzer, message_writer, verifier
 
 
-async def create_dm_supervisor():
-    """Create the DM creation supervisor"""
-    
-    profile_analyzer, message_writer, verifier = await create_dm_agents()
+async def setup_send_tool(account=None, riddles: Optional[Dict[str, Any]] = None):
+    """
+    send_message for the supervisor, sent through the account's InstagramClient: the daily quota is
+    reserved only around the actual send (and refunded if it fails), with the client's throttle,
+    circuit breaker and deadline. A riddle from `riddles` (by username) is recorded once its DM is sent.
+    """
+    from langchain_core.tools import StructuredTool
+    from app.services.instagram_client import get_instagram_client
+    from pipeline.riddle_bank import record_riddle_sent
+
+    client = get_instagram_client(account)
+    await client.initialize_tools()
+    riddles = riddles or {}
+
+    async def send_message(username: str, message: str) -> str:
+        resp = await client.send_message(username, message)
+        target = username.lstrip("@")
+        await record_riddle_sent(target, riddles.get(target))
+        # Sent: the branch reports success even if the supervisor runs out of time afterwards
+        record_result(target, f"SUCCESS: @{target}: {message[:100]}...")
+        return resp
+
+    return [StructuredTool.from_function(
+        coroutine=send_message, name="send_message", description=client._get_tool("send_message").description
+    )]
+
+
+async def create_dm_supervisor(account=None, skip_tools=(), draft_context: Optional[DraftContext] = None,
+                               riddles: Optional[Dict[str, Any]] = None):
+    """Create the DM creation supervisor, sending from the given SenderAccount (default account if None)"""
+
+    profile_analyzer, message_writer, verifier = await create_dm_agents(account, skip_tools, draft_context)
 
-    send_tool = await setup_instagram_tools("send_message")
+    send_tool = await setup_send_tool(account, riddles)
     
     dm_supervisor = create_supervisor(
         agents=[profile_analyzer, message_writer, verifier],
-        tools=send_tool,
-        model=ChatOpenAI(model=MODEL),
+        tools=ToolNode(send_tool, handle_tool_errors=throttle_aware_tool_errors),
+        model=get_chat_model("dm_supervisor"),
         #state_schema=CampaignState,
         prompt=supervisor_prompt,
         add_handoff_back_messages=True,
         output_mode="last_message",
+        # Subagent transcripts are compacted into a structured summary before each supervisor turn
+        pre_model_hook=make_compaction_hook("supervisor"),
     ).compile()
     
     return dm_supervisor
@@ -196,7 +292,7 @@ async def test_dm_supervisor():
     print("\nStarting DM supervisor workflow...\n")
     
     # Use the pretty print function with updates mode
-    async for chunk in supervisor.astream(initial_state, stream_mode="updates", subgraphs=True):
+    async for chunk in supervisor.astream(initial_state, config=traced_config(metrics_config("dm_supervisor")), stream_mode="updates", subgraphs=True):
         pretty_print_messages(chunk)
     
     print("\nDM Creation Complete!\n")
@@ -22,6 +22,7 @@ IMPORTANT:
 - Focus on finding genuine connection points between the user and the product
 - Be thorough but concise in your analysis
 - Do NOT use any messaging or sending tools - only research tools
+- If the request already lists the user's recent posts, analyze those instead of fetching posts again
 - Provide clear insights that the message writer can use for personalization
 """
 
@@ -35,7 +36,7 @@ TASKS:
 3. Ensure the message feels authentic and not overly sales-focused
 4. Include specific details from their profile to show genuine interest
 5. Write in a tone that matches their communication style
-6. Add a fun, easy riddle at the end with a promocode reward offer
+6. Add a fun, easy riddle at the end with a promocode reward offer (the riddle given to you, if there is one)
 
 DM WRITING GUIDELINES:
 - Keep the message concise but personal (2-4 sentences)
@@ -47,6 +48,8 @@ DM WRITING GUIDELINES:
 - End with a simple, fun riddle and promocode offer
 
 RIDDLE GUIDELINES:
+- If you were given a RIDDLE from the riddle bank, use it word for word - do not write your own
+- Otherwise:
 - Keep riddles short and sweet (1 sentence)
 - Make them easy - not too specific or difficult
 - Can be loosely tied to the product if natural, but don't force it
@@ -115,6 +118,8 @@ QUALITY STANDARDS:
 COORDINATION RULES:
 - Only call one agent at a time
 - Always remember to PASS RELEVANT CONTEXT between agents
+- If the request includes a RIDDLE, pass it to the message writer unchanged
+- The verifier may answer instantly with a rule-check report (APPROVED, or REVISE with the broken rules) - treat it like any other verdict and pass REVISE feedback to the message writer
 - Ensure each agent has the information they need to perform their role
 - Don't move to the next step until the current one is complete
 - Make decisions about whether additional iterations are needed
@@ -125,4 +130,113 @@ FINAL STEPS:
 Once you have that DM, it is important that you MUST complete the following two final steps:
 1) Use the Instagram MCP tool you have that lets you SEND the actual DM to the username specified
 2) RETURN the final DM in your final output, after the DM is sent
-"""
\ No newline at end of file
+"""
+
+### FAST MODE (BATCHED) PROMPT
+batch_writer_prompt = shared_prompt + """
+BATCH MESSAGE WRITER ROLE:
+You are the batch message writer. You receive ONE product and a list of compact profile digests, one per Instagram user. Write one personalized DM for EVERY user in the list, in a single response.
+
+FOR EACH USER:
+- Keep the message concise but personal (2-4 sentences)
+- Reference a specific detail from THAT user's digest - never mix users up
+- Explain why this product might interest them specifically, in a friendly, non-salesy tone
+- End with the riddle listed for THAT user (RIDDLE line), word for word, using exactly this format:
+  "Quick fun question: [riddle]? Answer correctly and I'll send you a special promocode! 🎁"
+- If a user has no RIDDLE line, write a short, easy riddle yourself
+- Also return the riddle on its own and its canonical one/two-word answer
+
+RULES:
+- Return exactly one entry per username given, using the username exactly as written (no @)
+- No links, no hashtags
+- If a digest is empty, personalize from the hashtags/product category instead
+"""
+
+
+### SPECULATIVE DRAFTING PROMPTS
+draft_angles = [
+    "Lead with the most specific detail from their posts.",
+    "Lead with why the product fits their hobby or collection.",
+    "Lead with a light, playful compliment about their content style.",
+    "Lead with a shared-enthusiasm angle, as one fan to another.",
+    "Keep it extra short and casual.",
+]
+
+multi_draft_verifier_prompt = verifier_prompt + """
+MULTI-DRAFT MODE:
+You will receive SEVERAL candidate DMs for the same user, numbered from 0. Score EVERY candidate in one response.
+For each candidate return:
+- index: the candidate number
+- score: 1-10 overall quality against the evaluation criteria
+- approved: true only if it could be sent as-is (personalized, accurate, ends with the riddle and promocode offer)
+- feedback: one sentence on what to fix (empty if approved)
+"""
+
+
+### TEMPLATE MODE (ZERO-LLM) LIBRARY
+# Slot-filled DMs following the message writer guidelines: 2-4 sentences, a detail from their
+# latest post when we have one, a soft product hook, no links or hashtags, and the riddle last.
+# Slots: {name} display name, {detail} a short quote from their latest caption, {hook} the product.
+riddle_format = "Quick fun question: {riddle} Answer correctly and I'll send you a special promocode! 🎁"
+
+dm_templates = {
+    "collectibles": {
+        "detail": [
+            "Hey {name}! Loved your post \"{detail}\" - you clearly know your stuff as a collector. I think {hook} would look amazing on your shelf.",
+            "Hi {name}, your post \"{detail}\" caught my eye! As a fellow collector I had to tell you about {hook}.",
+        ],
+        "plain": [
+            "Hey {name}! Your collection posts are great - I think you'd really like {hook}.",
+            "Hi {name}, fellow collector here! Thought {hook} might be right up your street.",
+        ],
+    },
+    "fashion": {
+        "detail": [
+            "Hey {name}! Your post \"{detail}\" is such a vibe. I think {hook} would fit your style perfectly.",
+            "Hi {name}, loved \"{detail}\" - great eye! Thought you might like {hook}.",
+        ],
+        "plain": [
+            "Hey {name}! Love your style - I think {hook} would suit you really well.",
+        ],
+    },
+    "beauty": {
+        "detail": [
+            "Hi {name}! Your post \"{detail}\" was lovely. I think {hook} could be a great fit for your routine.",
+        ],
+        "plain": [
+            "Hi {name}! Your beauty content is great - thought you might like to try {hook}.",
+        ],
+    },
+    "tech": {
+        "detail": [
+            "Hey {name}! Enjoyed your post \"{detail}\". Given your setup, I think you'd get a lot out of {hook}.",
+        ],
+        "plain": [
+            "Hey {name}! Your tech posts are great - I think {hook} might interest you.",
+        ],
+    },
+    "general": {
+        "detail": [
+            "Hey {name}! Really enjoyed your post \"{detail}\". I think you might love {hook}.",
+            "Hi {name}, your post \"{detail}\" made my day! Thought you'd like to hear about {hook}.",
+        ],
+        "plain": [
+            "Hey {name}! Love your content - thought you might like {hook}.",
+        ],
+    },
+}
+
+
+### RIDDLE BANK PROMPT
+riddle_writer_prompt = """
+You write riddles for a riddle bank. Each riddle ends a friendly Instagram DM that offers a promocode for the right answer.
+
+For the CATEGORY and DIFFICULTY given, write the requested number of riddles. Each one:
+- Is a single short sentence ending with "?" (under 120 characters)
+- Has one clear canonical answer of one to three words, which must not appear in the riddle
+- Fits the category loosely if natural (use "general" riddles for anything else); never needs specialist knowledge
+- easy: guessable in seconds; medium: needs a moment's thought; hard: a real head-scratcher, still fair
+- Contains no links, hashtags, mentions or brand names
+
+Every riddle must be different from the others and from the ones already in the bank.
+"""
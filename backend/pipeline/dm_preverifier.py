@@ -0,0 +1,151 @@
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import Counter
+
+# Deterministic checks that run on every draft before any LLM verifier sees it. A draft that
+# breaks a hard rule is rejected instantly with structured feedback for the writer; a draft
+# that passes every rule with high confidence is approved without the LLM verifier at all.
+# Each rule returns (problem or None, confidence in its pass); the draft's confidence is the
+# lowest of them, so one uncertain rule (e.g. nothing known about the user) keeps the LLM check.
+MAX_DM_CHARS = 600
+MIN_DM_CHARS = 80
+PROMO_PATTERN = re.compile(r"promo\s?code", re.IGNORECASE)
+LINK_PATTERN = re.compile(r"https?://|www\.", re.IGNORECASE)
+HASHTAG_PATTERN = re.compile(r"(?<![\w&])#[A-Za-z]\w*")
+SENTENCE_END = re.compile(r"[.!?]+(?:\s|$)")
+PROFILE_WORD = re.compile(r"[a-z][a-z0-9']{3,}")
+# Too common to show the DM was written for this user
+GENERIC_WORDS = frozenset(
+    "this that with your have just love like really great post posts about what when from they them their "
+    "there here been will would could should more some make made very much also into only over than then "
+    "these those every something thing things time today amazing awesome beautiful nice cool best good".split()
+)
+
+# outcome: rejected, approved (LLM verifier skipped) or llm (passed on to the LLM verifier)
+PREVERIFY_OUTCOMES = Counter("dm_preverify_total", "Drafts checked by the rule-based pre-verifier", ["outcome"])
+
+
+@dataclass
+class DraftContext:
+    """What a draft is checked against; empty fields make their rules less certain, never stricter"""
+    riddle: str = ""  # the riddle the DM must end with, when it came from the riddle bank
+    profile: str = ""  # what we know about the user: posts from discovery, the profile analysis
+    product_info: str = ""
+
+
+@dataclass
+class RuleFailure:
+    rule: str
+    problem: str
+
+
+@dataclass
+class Verdict:
+    failures: List[RuleFailure] = field(default_factory=list)
+    confidence: float = 1.0
+
+    @property
+    def passed(self) -> bool:
+        return not self.failures
+
+    @property
+    def skips_llm(self) -> bool:
+        """Clearly compliant: no LLM verifier needed"""
+        return self.passed and self.confidence >= settings.DM_PREVERIFY_SKIP_CONFIDENCE
+
+    def problems(self) -> List[str]:
+        return [f.problem for f in self.failures]
+
+    def feedback(self) -> str:
+        """Verifier-style report (verdict word first, one line per broken rule)"""
+        if self.passed:
+            return (f"APPROVED - passed every pre-verification rule (confidence {self.confidence:.2f}), "
+                    "LLM verification skipped.")
+        lines = [f"- [{f.rule}] {f.problem}" for f in self.failures]
+        return "REVISE - the draft breaks these rules, fix every one:\n" + "\n".join(lines)
+
+
+def profile_words(text: str) -> set:
+    return {w for w in PROFILE_WORD.findall(text.lower()) if w not in GENERIC_WORDS}
+
+
+def check_length(text: str, context: DraftContext) -> Tuple[Optional[str], float]:
+    if not text:
+        return "empty DM", 0.0
+    if len(text) > MAX_DM_CHARS:
+        return f"DM too long ({len(text)} chars, max {MAX_DM_CHARS})", 0.0
+    if len(text) < MIN_DM_CHARS:
+        return f"DM too short ({len(text)} chars, min {MIN_DM_CHARS})", 0.0
+    sentences = len(SENTENCE_END.findall(text))
+    return None, 1.0 if 2 <= sentences <= 6 else 0.7
+
+
+def check_riddle(text: str, context: DraftContext) -> Tuple[Optional[str], float]:
+    if context.riddle:
+        if context.riddle.strip().rstrip("?").lower() not in text.lower():
+            return "riddle missing from DM", 0.0
+        return None, 1.0
+    # A riddle the writer made up: we can only see that a question is asked
+    return (None, 0.8) if "?" in text else ("riddle missing from DM", 0.0)
+
+
+def check_promo(text: str, context: DraftContext) -> Tuple[Optional[str], float]:
+    return (None, 1.0) if PROMO_PATTERN.search(text) else ("promocode offer missing", 0.0)
+
+
+def check_links(text: str, context: DraftContext) -> Tuple[Optional[str], float]:
+    if LINK_PATTERN.search(text):
+        return "contains a link", 0.0
+    if HASHTAG_PATTERN.search(text):
+        return "contains a hashtag", 0.0
+    return None, 1.0
+
+
+def check_banned(text: str, context: DraftContext) -> Tuple[Optional[str], float]:
+    lowered = text.lower()
+    banned = [p for p in settings.DM_BANNED_PHRASES if p.lower() in lowered]
+    return (f"contains banned phrase(s): {', '.join(repr(p) for p in banned)}", 0.0) if banned else (None, 1.0)
+
+
+def check_profile(text: str, context: DraftContext) -> Tuple[Optional[str], float]:
+    """Something the DM says must come from what we know about the user, not from the product"""
+    known = profile_words(context.profile) - profile_words(context.product_info) - profile_words(context.riddle)
+    if not known:
+        return None, 0.5  # nothing to compare against - leave it to the LLM verifier
+    shared = len(known & profile_words(text))
+    if not shared:
+        return "doesn't mention anything from their profile or posts", 0.0
+    return None, {1: 0.7, 2: 0.9}.get(shared, 1.0)
+
+
+RULES: Dict[str, Callable[[str, DraftContext], Tuple[Optional[str], float]]] = {
+    "length": check_length,
+    "riddle": check_riddle,
+    "promo": check_promo,
+    "links": check_links,
+    "banned": check_banned,
+    "profile": check_profile,
+}
+
+
+def preverify(text: str, context: Optional[DraftContext] = None, rules: Optional[List[str]] = None) -> Verdict:
+    """Run the configured rules (DM_PREVERIFY_RULES unless given) on one draft"""
+    context = context or DraftContext()
+    text = text.strip()
+    verdict = Verdict()
+    for name in rules if rules is not None else settings.DM_PREVERIFY_RULES:
+        problem, confidence = RULES[name](text, context)
+        if problem:
+            verdict.failures.append(RuleFailure(name, problem))
+        verdict.confidence = min(verdict.confidence, confidence)
+    return verdict
+
+
+def record_outcome(verdict: Verdict) -> str:
+    """Count what happened to a draft: rejected, approved without the LLM, or sent on to the LLM"""
+    outcome = "rejected" if not verdict.passed else "approved" if verdict.skips_llm else "llm"
+    PREVERIFY_OUTCOMES.inc(outcome=outcome)
+    return outcome
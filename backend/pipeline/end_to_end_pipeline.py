@@ -1,25 +1,39 @@
+import asyncio
+import collections
 import operator
-from typing import Annotated, List, Dict
+import time
+import uuid
+from typing import Annotated, List, Dict, Optional
 from typing_extensions import TypedDict
 from pydantic import BaseModel, Field
 
-from langchain_openai import ChatOpenAI
 from langgraph.types import Send
 from langgraph.graph import StateGraph, START, END
-from langchain_community.document_loaders import WebBaseLoader
 #from langchain_core.runnables.graph import CurveStyle, MermaidDrawMethod, NodeStyles
 
 
-from pipeline.dm_creation_pipeline import create_dm_supervisor, pretty_print_messages
-from pipeline.user_finding_pipeline import create_user_finder_agent
-
-
-MODEL = "o4-mini"
-PROVIDER = "openai"
-
-llm = ChatOpenAI(model=MODEL)
+from pipeline.dm_creation_pipeline import create_dm_supervisor, has_enough_posts, known_posts_note, pretty_print_messages
+from pipeline.user_finding_pipeline import create_user_finder_agent, find_instagram_users
+from pipeline.candidate_ranking import CandidatePool, DiscoveryFeed, current_feed, current_pool
+from pipeline.product_index import get_product_index
+from pipeline.batch_dm_pipeline import batch_dm_creation
+from pipeline.speculative_dm_pipeline import speculative_dm_creation
+from pipeline.template_dm_pipeline import template_dm_creation
+from pipeline.riddle_bank import assign_riddles, riddle_instruction
+from pipeline.dm_preverifier import DraftContext
+from app.core.config import settings
+from app.core.accounts import check_send_quota, get_registry
+from app.core.budget import BudgetExceeded, branch_budget
+from app.core.model_router import get_chat_model
+from app.core.metrics import Histogram, metrics_config
+from app.core.tracing import span, traced_config
+from app.services.throttle import ThrottledError, get_throttle, park_job
 
 
+TIME_TO_FIRST_DM = Histogram(
+    "campaign_time_to_first_dm_seconds", "Pipelined campaigns: discovery start until the first DM branch starts",
+    buckets=(5, 10, 30, 60, 120, 300, 600),
+)
 
 
 # Pydantic model for user finder structured output 
@@ -37,13 +51,27 @@ class CampaignState(TypedDict):
     product_payload: ProductPayload
     product_info: str
     discovered_users: List[str]  # From user finder
+    media_digests: Dict[str, List[str]]  # Posts the user finder already fetched, per discovered user
+    full_names: Dict[str, str]  # Profile names seen during discovery, per discovered user
     dm_results: Annotated[List[str], operator.add]  # Collected DM results (reduce step)
     campaign_summary: str
+    dm_mode: str  # "supervisor" (one supervisor per user), "speculative" (parallel drafts), "fast" (batched) or "template" (no LLM)
+    branch_deadline: float  # seconds per DM branch
+    branch_token_budget: int  # LLM tokens per DM branch
 
 # Individual DM creation state (sent to each dm_creation_node)
-class DMState(TypedDict):
+class DMState(TypedDict, total=False):
     username: str
+    usernames: List[str]  # batched modes (fast, template): the whole batch handled by this branch
     product_info: str
+    product_title: str
+    product_category: str
+    dm_mode: str
+    media_digest: List[str]  # posts already fetched for this user during discovery
+    media_digests: Dict[str, List[str]]  # batched modes: per user of the batch
+    full_names: Dict[str, str]  # batched modes: profile names, per user of the batch
+    branch_deadline: float
+    branch_token_budget: int
 
 
 
@@ -55,7 +83,9 @@ async def product_info_scraper(state: CampaignState):
     payload = state["product_payload"]
     
     try:
-        # Load the webpage content
+        # Load the webpage content (langchain_community is slow to import, so only on first scrape)
+        from langchain_community.document_loaders import WebBaseLoader
+
         loader = WebBaseLoader(
             web_path=payload["link"],
             bs_get_text_kwargs={"separator": " ", "strip": True},
@@ -87,7 +117,7 @@ async def product_info_scraper(state: CampaignState):
             Include a title and price above the description too, but output all as one string.
             """
             
-            response = await llm.ainvoke(formatting_prompt)
+            response = await get_chat_model("product_formatter").ainvoke(formatting_prompt)
             product_info = response.content.strip()
 
     
@@ -103,31 +133,123 @@ async def product_info_scraper(state: CampaignState):
 
 async def user_finder_node(state: CampaignState):
     """User finder agent - assume it returns structured output"""
-    user_finder = create_user_finder_agent()  # REMOVED await
-    input = {"messages": [{"role": "user", "content": f"Find users for {state['product_info']}"}]}
-    
-    result = await user_finder.ainvoke(input)
+    product_info = state["product_info"]
+    index = get_product_index()
+    proven, similarity = await asyncio.to_thread(
+        index.suggest_hashtags, product_info, settings.USER_FINDER_SEED_SIMILARITY
+    )
+
+    # The agent's find_instagram_users calls collect candidates into this pool
+    pool = CandidatePool()
+    token = current_pool.set(pool)
+    result = None
+    try:
+        if proven and similarity >= settings.USER_FINDER_REUSE_SIMILARITY:
+            # Near-identical product seen before: search its best hashtags directly, no LLM round trips
+            print(f"♻️ Reusing hashtags from a past campaign (similarity {similarity:.2f}): {', '.join(proven)}")
+            await find_instagram_users.ainvoke({"hashtags": ",".join(proven)})
+        if not len(pool):
+            content = f"Find users for {product_info}"
+            if proven:
+                content += (
+                    f"\n\nProven hashtags from similar past campaigns: {', '.join(proven)}. "
+                    "Start by calling find_instagram_users with these and skip extract_hashtags unless they don't fit."
+                )
+            user_finder = create_user_finder_agent()  # REMOVED await
+            result = await user_finder.ainvoke({"messages": [{"role": "user", "content": content}]})
+    finally:
+        current_pool.reset(token)
     # async for chunk in user_finder.astream(input, stream_mode="updates", subgraphs=True):
     #     # pretty_print_messages(chunk)
-    
+
+    if len(pool):
+        await asyncio.to_thread(index.record, product_info, pool.hashtag_yields())
+        # Deterministic top-K from the ranking instead of whichever names the agent echoed back
+        top = pool.top_k(settings.USER_FINDER_TOP_K)
+        return {
+            "discovered_users": top,
+            "media_digests": pool.media_digests(top),
+            "full_names": {u: pool.full_names[u] for u in top if u in pool.full_names},
+        }
     return {"discovered_users": result["structured_response"].usernames}
 
 
 async def dm_creation_node(state: DMState):
-    """Wrapper node that creates fresh DM supervisor for each user"""
-    
-    # Create fresh supervisor instance for isolation
-    dm_supervisor = await create_dm_supervisor()  # REMOVED await
+    """
+    One DM branch under its campaign's wall-clock deadline and token budget. A branch that runs out
+    is cancelled (subagents, LLM and MCP calls included) and recorded as timed out, so one slow
+    user can't hold up the campaign summary.
+    """
+    deadline = state.get("branch_deadline") or settings.DM_BRANCH_DEADLINE_SECONDS
+    token_budget = state.get("branch_token_budget", settings.DM_BRANCH_TOKEN_BUDGET)
+    try:
+        async with branch_budget(deadline, token_budget):
+            return await create_dms(state)
+    except BudgetExceeded as e:
+        usernames = state.get("usernames") or [state["username"]]
+        # Users whose DM was already sent (or failed) keep that result; only the rest timed out
+        pending = [u for u in usernames if u not in e.budget.results]
+        print(f"⌛ DM branch cancelled with {', '.join('@' + u for u in pending)} pending: {e}")
+        return {"dm_results": [e.budget.results.get(u) or f"TIMEOUT: @{u}: {e}" for u in usernames]}
+
+
+async def create_dms(state: DMState):
+    """Creates fresh DM supervisor for each user (or one batched call in fast mode, or templates)"""
+
+    if state.get("dm_mode") == "template":
+        return {"dm_results": await template_dm_creation(
+            state["usernames"], state.get("product_title", ""), state.get("product_category", ""),
+            state["product_info"], state.get("media_digests"), state.get("full_names"),
+        )}
+
+    if state.get("dm_mode") == "fast":
+        try:
+            return {"dm_results": await batch_dm_creation(
+                state["usernames"], state["product_info"], state.get("media_digests"), state.get("product_category", "")
+            )}
+        except Exception as e:
+            return {"dm_results": [f"FAIL: @{u}: Failed - {str(e)}" for u in state["usernames"]]}
+
+    if state.get("dm_mode") == "speculative":
+        try:
+            result = await speculative_dm_creation(state["username"], state["product_info"],
+                                                   media_digest=state.get("media_digest"),
+                                                   product_category=state.get("product_category", ""))
+            if result.verification_status == "parked":
+                return {"dm_results": [f"PARKED: @{result.target_user}: send deferred until the account is unthrottled"]}
+            return {"dm_results": [f"SUCCESS: @{result.target_user}: {result.final_dm[:100]}..."]}
+        except ThrottledError as e:
+            return {"dm_results": [await park_job("dm", dict(state), state["username"], e)]}
+        except Exception as e:
+            return {"dm_results": [f"FAIL: @{state['username']}: Failed - {str(e)}"]}
     
     username = state["username"]
     product_info = state["product_info"]
+    media_digest = state.get("media_digest")
     
     try:
+        # The target's account (consistent hashing) sends this DM and will own the follow-up thread
+        account = get_registry().account_for(username)
+        await asyncio.to_thread(get_throttle(account.username).raise_if_paused)
+        # Fail fast on a spent quota; the send itself reserves (and on failure refunds) the quota
+        await check_send_quota(account)
+
+        # Create fresh supervisor instance for isolation. With enough posts from discovery the
+        # analyzer doesn't get get_user_posts at all, saving the MCP round trip and a tool-call turn
+        riddles = await assign_riddles([username], product_info, state.get("product_category", ""))
+        riddle = riddles.get(username)
+        draft_context = DraftContext(riddle.riddle if riddle else "", "\n".join(media_digest or []), product_info)
+        dm_supervisor = await create_dm_supervisor(
+            account, ("get_user_posts",) if has_enough_posts(media_digest) else (), draft_context, riddles
+        )
+
         # Create input for DM supervisor
         dm_input = {
             "messages": [{
                 "role": "user", 
                 "content": f"Research @{username} and create a personalized sales DM about {product_info}. Customise it to their profile."
+                           + known_posts_note(username, media_digest)
+                           + riddle_instruction(riddle)
             }]
         }
         
@@ -142,6 +264,10 @@ async def dm_creation_node(state: DMState):
         
         # Return success result
         return {"dm_results": [f"SUCCESS: @{username}: {dm_content[:100]}..."]}
+
+    except ThrottledError as e:
+        # The account hit Instagram's rate limits: park this branch instead of failing it
+        return {"dm_results": [await park_job("dm", dict(state), username, e)]}
         
     except Exception as e:
         # Return failure result
@@ -149,12 +275,104 @@ async def dm_creation_node(state: DMState):
 
 
 
+def branch_batch_size(dm_mode: str) -> int:
+    """Users per DM branch: the batched modes handle many users in one branch"""
+    return {"fast": settings.FAST_MODE_BATCH_SIZE, "template": settings.TEMPLATE_BATCH_SIZE}.get(dm_mode, 1)
+
+
+async def send_paced_deadline(state: CampaignState, usernames: List[str]) -> float:
+    """
+    Deadline for a template branch, whose time goes to send pacing rather than LLM calls: the
+    usual branch deadline plus what the busiest sender account needs to send `usernames` (every
+    concurrently sending user of the campaign) at its current throttle rate
+    """
+    registry = get_registry()
+    per_account = collections.Counter(registry.account_for(u).username for u in usernames)
+    rates = await asyncio.to_thread(lambda: {a: get_throttle(a).rate for a in per_account})
+    pacing = max((n / rates[a] for a, n in per_account.items()), default=0.0)
+    return (state.get("branch_deadline") or settings.DM_BRANCH_DEADLINE_SECONDS) + pacing
+
+
+def batch_branch(state: CampaignState, usernames: List[str], media_digests: Dict[str, List[str]],
+                 full_names: Dict[str, str], deadline: Optional[float] = None) -> DMState:
+    """DMState for a batched-mode branch (deadline overrides the campaign's branch_deadline)"""
+    payload = state.get("product_payload") or {}
+    limits = {k: state[k] for k in ("branch_deadline", "branch_token_budget") if k in state}
+    if deadline is not None:
+        limits["branch_deadline"] = deadline
+    return {
+        "usernames": usernames,
+        "product_info": state["product_info"],
+        "product_title": payload.get("title", ""),
+        "product_category": payload.get("category", ""),
+        "dm_mode": state.get("dm_mode"),
+        "media_digests": {u: media_digests.get(u, []) for u in usernames},
+        "full_names": {u: full_names[u] for u in usernames if u in full_names},
+        **limits,
+    }
+
+
+async def pipelined_discovery_node(state: CampaignState):
+    """
+    Pipelined mode: the user finder and a pool of DM workers run concurrently. Users are handed to
+    the workers as soon as discovery confirms them (see DiscoveryFeed), so the first DMs start
+    after the first good search instead of after the whole user-finder loop.
+    """
+    dm_mode = state.get("dm_mode", "supervisor")
+    feed = DiscoveryFeed(settings.USER_FINDER_TOP_K, settings.PIPELINE_CONFIRM_SCORE, settings.PIPELINE_DM_WORKERS)
+    started = time.monotonic()
+    first_dm_at: Optional[float] = None
+    dm_results: List[str] = []
+    branch_limits = {k: state[k] for k in ("branch_deadline", "branch_token_budget") if k in state}
+
+    async def worker():
+        nonlocal first_dm_at
+        while (item := await feed.queue.get()) is not None:
+            batch = [item]
+            while len(batch) < branch_batch_size(dm_mode) and not feed.queue.empty():
+                if (queued := feed.queue.get_nowait()) is None:
+                    feed.queue.put_nowait(None)  # leave the end marker for the next get
+                    break
+                batch.append(queued)
+            if first_dm_at is None:
+                first_dm_at = time.monotonic() - started
+                TIME_TO_FIRST_DM.observe(first_dm_at)
+                print(f"⏱️ First DM branch started {first_dm_at:.1f}s after discovery began")
+            if branch_batch_size(dm_mode) > 1:
+                usernames = [u for u, _ in batch]
+                deadline = await send_paced_deadline(state, usernames) if dm_mode == "template" else None
+                branch = batch_branch(state, usernames, dict(batch), feed.full_names, deadline)
+            else:
+                branch = {"username": item[0], "product_info": state["product_info"],
+                          "product_category": (state.get("product_payload") or {}).get("category", ""),
+                          "dm_mode": dm_mode, "media_digest": item[1], **branch_limits}
+            dm_results.extend((await dm_creation_node(branch))["dm_results"])
+
+    workers = [asyncio.create_task(worker()) for _ in range(settings.PIPELINE_DM_WORKERS)]
+    token = current_feed.set(feed)
+    try:
+        found = await user_finder_node(state)
+    except BaseException:
+        for w in workers:
+            w.cancel()
+        raise
+    finally:
+        current_feed.reset(token)
+    print(f"🔎 Discovery finished after {time.monotonic() - started:.1f}s ({len(feed.dispatched)} users already dispatched)")
+    feed.finish(found["discovered_users"], found.get("media_digests") or {}, found.get("full_names") or {})
+    await asyncio.gather(*workers)
+
+    return {"discovered_users": feed.dispatched, "media_digests": feed.media_digests, "full_names": feed.full_names,
+            "dm_results": dm_results}
+
+
 async def create_campaign_summary(state: CampaignState):
     """Reduce step - summarize all DM creation results"""
     dm_results = state["dm_results"]
     total_users = len(state["discovered_users"])
     successful_dms = len([r for r in dm_results if r.startswith("✅")])
     failed_dms = len([r for r in dm_results if r.startswith("❌")])
+    timed_out_dms = len([r for r in dm_results if r.startswith("TIMEOUT")])
     
     summary = f"""
 Instagram Campaign Complete!
@@ -163,6 +381,7 @@ Results Summary:
 • Total Users Discovered: {total_users}
 • Successful DMs Created: {successful_dms}
 • Failed DM Attempts: {failed_dms}
+• Timed-out DM Branches: {timed_out_dms}
 • Success Rate: {(successful_dms/total_users)*100:.1f}%
 
 Individual Results:
@@ -180,22 +399,52 @@ async def continue_to_dm_creation(state: CampaignState):
     """Map discovered users to parallel DM creation tasks"""
     discovered_users = state["discovered_users"]
     product_info = state["product_info"]
+    digests = state.get("media_digests") or {}
+    branch_limits = {k: state[k] for k in ("branch_deadline", "branch_token_budget") if k in state}
+
+    batch_size = branch_batch_size(state.get("dm_mode"))
+    if batch_size > 1:
+        # Template branches all run at once and share the accounts' throttles, so each one's
+        # deadline covers sending the whole campaign
+        deadline = await send_paced_deadline(state, discovered_users) if state.get("dm_mode") == "template" else None
+        # One Send per batch of users instead of one per user
+        return [
+            Send("dm_creation", batch_branch(
+                state, discovered_users[i:i + batch_size], digests, state.get("full_names") or {}, deadline
+            ))
+            for i in range(0, len(discovered_users), batch_size)
+        ]
     
     # Create Send object for each user (mapping out)
     return [Send("dm_creation", {
         "username": username,
-        "product_info": product_info
+        "product_info": product_info,
+        "product_category": (state.get("product_payload") or {}).get("category", ""),
+        "dm_mode": state.get("dm_mode", "supervisor"),
+        "media_digest": digests.get(username, []),
+        **branch_limits,
     }) for username in discovered_users]
 
 
 
 
 # Build the complete campaign graph
-async def create_campaign_graph():
-    """Create the Instagram campaign graph with map-reduce pattern"""
+async def create_campaign_graph(pipelined: bool = False):
+    """Create the Instagram campaign graph with map-reduce pattern (or the pipelined variant)"""
     
     # Initialize graph
     graph = StateGraph(CampaignState)
+
+    if pipelined:
+        # Discovery and DM creation overlap inside one node instead of meeting at a barrier
+        graph.add_node("product_info_scraper", product_info_scraper)
+        graph.add_node("discover_and_dm", pipelined_discovery_node)
+        graph.add_node("campaign_summary", create_campaign_summary)
+        graph.add_edge(START, "product_info_scraper")
+        graph.add_edge("product_info_scraper", "discover_and_dm")
+        graph.add_edge("discover_and_dm", "campaign_summary")
+        graph.add_edge("campaign_summary", END)
+        return graph.compile()
     
     # Add nodes
     graph.add_node("product_info_scraper", product_info_scraper)
@@ -224,11 +473,18 @@ async def create_campaign_graph():
 
 
 # Main execution function
-async def run_instagram_campaign(product_payload: ProductPayload):
-    """Run the complete Instagram campaign with map-reduce"""
+async def run_instagram_campaign(product_payload: ProductPayload, dm_mode: Optional[str] = None,
+                                 pipelined: Optional[bool] = None, branch_deadline: Optional[float] = None,
+                                 branch_token_budget: Optional[int] = None):
+    """
+    Run the complete Instagram campaign with map-reduce. dm_mode defaults to settings.DM_MODE,
+    pipelined to settings.CAMPAIGN_PIPELINED and the per-branch limits to DM_BRANCH_DEADLINE_SECONDS
+    / DM_BRANCH_TOKEN_BUDGET
+    """
+    pipelined = settings.CAMPAIGN_PIPELINED if pipelined is None else pipelined
     
     # Create graph
-    campaign_graph = await create_campaign_graph()
+    campaign_graph = await create_campaign_graph(pipelined)
 
     campaign_graph.get_graph(xray=True).draw_mermaid_png(
         output_file_path="campaign_graph.png"
@@ -239,17 +495,30 @@ async def run_instagram_campaign(product_payload: ProductPayload):
         "product_payload": product_payload,
         "product_info": "",
         "discovered_users": [],
+        "media_digests": {},
+        "full_names": {},
         "dm_results": [],
-        "campaign_summary": ""
+        "campaign_summary": "",
+        "dm_mode": dm_mode or settings.DM_MODE,
+        "branch_deadline": branch_deadline or settings.DM_BRANCH_DEADLINE_SECONDS,
+        "branch_token_budget": settings.DM_BRANCH_TOKEN_BUDGET if branch_token_budget is None else branch_token_budget,
     }
     
+    campaign_id = uuid.uuid4().hex
+
     print("Starting Instagram Campaign...")
     print(f"Product: {product_payload['title']}")
+    print(f"Campaign ID: {campaign_id}")
+    print(f"DM mode: {initial_state['dm_mode']}")
+    print(f"Pipelined: {pipelined}")
+    print(f"DM branch budget: {initial_state['branch_deadline']:.0f}s, {initial_state['branch_token_budget']} tokens")
     print("\n" + "="*60 + "\n")
     
-    # Execute campaign
-    async for chunk in campaign_graph.astream(initial_state, stream_mode="updates", subgraphs=True):
-        pretty_print_messages(chunk)
+    # Execute campaign (metrics/tracing handlers are inherited by every subgraph and subagent run)
+    config = traced_config(metrics_config("campaign", metadata={"campaign_id": campaign_id}))
+    with span("campaign", {"campaign.id": campaign_id, "product.title": product_payload["title"]}):
+        async for chunk in campaign_graph.astream(initial_state, config=config, stream_mode="updates", subgraphs=True):
+            pretty_print_messages(chunk)
     
 
 
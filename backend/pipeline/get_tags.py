@@ -1,6 +1,12 @@
+import asyncio
 import os
+from typing import AsyncIterator, Iterator
+
 from instagrapi import Client
 
+from app.services.throttle import ThrottledError, get_throttle
+from pipeline.candidate_ranking import MediaRecord
+
 SESSION_FILE_TEMPLATE = "session_{username}.json"
 
 
@@ -23,14 +29,61 @@ def init_client(username: str, password: str = None) -> Client:
     return cl
 
 
-def fetch_hashtag_usernames(
+def _throttled_call(throttle, fn, *args, **kwargs):
+    """Run an instagrapi call paced by the account's throttle; rate-limit errors raise ThrottledError"""
+    throttle.acquire_sync()
+    try:
+        result = fn(*args, **kwargs)
+    except Exception as e:
+        throttle.check(e)  # raises ThrottledError for instagrapi rate-limit errors
+        raise
+    throttle.check(result)
+    return result
+
+
+def _media_record(m, tag: str) -> MediaRecord:
+    return MediaRecord(
+        username=m.user.username,
+        user_pk=str(m.user.pk),
+        hashtag=tag,
+        taken_at=m.taken_at.timestamp() if m.taken_at else 0.0,
+        like_count=m.like_count or 0,
+        comment_count=m.comment_count or 0,
+        media_pk=str(m.pk),
+        caption=m.caption_text or "",
+        full_name=m.user.full_name or "",
+    )
+
+
+def _hashtag_pages(cl: Client, throttle, tag: str, max_posts: int) -> Iterator[list]:
+    """
+    Recent medias for one hashtag, one API page at a time, up to max_posts in total.
+    hashtag_medias_paginated uses the private API when the session has it and falls back to
+    public GraphQL when the private call fails (and the other way round). Public pages may
+    carry only the author's pk, so medias without a username are skipped.
+    """
+    fetched, cursor = 0, None
+    while fetched < max_posts:
+        medias, cursor = _throttled_call(
+            throttle, cl.hashtag_medias_paginated, tag, amount=max_posts - fetched, tab_key="recent", end_cursor=cursor
+        )
+        if not medias:
+            return
+        fetched += len(medias)
+        yield [m for m in medias if m.user and m.user.username]
+        if not cursor:
+            return
+
+
+def fetch_hashtag_medias(
     hashtags: list[str],
     max_posts: int,
     username: str,
     password: str = None
-) -> set[str]:
+) -> list[MediaRecord]:
     """
-    Fetch unique Instagram usernames that have posted the given hashtags.
+    Fetch recent posts for the given hashtags, keeping the per-post features used to rank
+    candidates (author, hashtag, time, likes, comments) and the caption.
 
     Parameters:
     - hashtags: list of hashtag strings without '#'.
@@ -39,15 +92,84 @@ def fetch_hashtag_usernames(
     - password: Instagram password (needed only on first run).
 
     Returns:
-    - A set of unique usernames.
+    - One MediaRecord per fetched post.
     """
     cl = init_client(username, password)
-    all_users: set[str] = set()
+    throttle = get_throttle(username)
+    records: list[MediaRecord] = []
+    for tag in hashtags:
+        try:
+            for page in _hashtag_pages(cl, throttle, tag, max_posts):
+                records.extend(_media_record(m, tag) for m in page)
+        except ThrottledError as e:
+            # Keep what we already have rather than pushing a rate-limited account harder
+            print(f"🐢 Stopping hashtag fetch at #{tag}: {e}")
+            break
+    return records
+
+
+async def stream_hashtag_medias(
+    hashtags: list[str],
+    max_posts: int,
+    username: str,
+    password: str = None
+) -> AsyncIterator[MediaRecord]:
+    """
+    Streaming fetch_hashtag_medias: yields each post as soon as its page arrives, hashtags in the
+    given order, skipping posts already yielded for the same hashtag. Pages are only requested
+    while the consumer keeps iterating, so breaking out (or closing the generator) stops discovery
+    without any further API calls. Tags are fetched one page at a time rather than concurrently:
+    the account's throttle paces every call anyway.
+    """
+    cl = await asyncio.to_thread(init_client, username, password)
+    throttle = get_throttle(username)
+    seen: set[tuple[str, str]] = set()
     for tag in hashtags:
-        medias = cl.hashtag_medias_recent(tag, amount=max_posts)
-        users = {m.user.username for m in medias}
-        all_users |= users
-    return all_users
+        pages = _hashtag_pages(cl, throttle, tag, max_posts)
+        while True:
+            try:
+                page = await asyncio.to_thread(next, pages, None)
+            except ThrottledError as e:
+                print(f"🐢 Stopping hashtag stream at #{tag}: {e}")
+                return
+            if page is None:
+                break
+            for m in page:
+                if (str(m.pk), tag) in seen:
+                    continue
+                seen.add((str(m.pk), tag))
+                yield _media_record(m, tag)
+
+
+def fetch_hashtag_usernames(
+    hashtags: list[str],
+    max_posts: int,
+    username: str,
+    password: str = None
+) -> set[str]:
+    """
+    Fetch unique Instagram usernames that have posted the given hashtags.
+
+    Returns:
+    - A set of unique usernames.
+    """
+    return {r.username for r in fetch_hashtag_medias(hashtags, max_posts, username, password)}
+
+
+def fetch_follower_counts(user_pks: dict[str, str], username: str, password: str = None) -> dict[str, int]:
+    """Follower counts for {username: pk}; stops early (returning what it has) if the account is throttled"""
+    cl = init_client(username, password)
+    throttle = get_throttle(username)
+    counts: dict[str, int] = {}
+    for name, pk in user_pks.items():
+        try:
+            counts[name] = _throttled_call(throttle, cl.user_info, pk).follower_count
+        except ThrottledError as e:
+            print(f"🐢 Stopping follower lookups at @{name}: {e}")
+            break
+        except Exception as e:
+            print(f"⚠️ Could not fetch followers for @{name}: {e}")
+    return counts
 
 
 # Example usage:
@@ -0,0 +1,142 @@
+import math
+import re
+import sqlite3
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import permutations
+from typing import Dict, Iterable, List, Optional
+
+from app.core.config import settings
+
+HASHTAG_PATTERN = re.compile(r"#(\w{2,40})", re.UNICODE)
+MAX_TAGS_PER_POST = 30
+MIN_PAIR_COUNT = 2  # ignore pairs seen only once - too noisy for PMI
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (media_pk TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS tags (tag TEXT PRIMARY KEY, posts INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS pairs (
+    tag TEXT NOT NULL,
+    other TEXT NOT NULL,
+    posts INTEGER NOT NULL,
+    PRIMARY KEY (tag, other)
+) WITHOUT ROWID;
+"""
+
+
+def extract_caption_hashtags(caption: str) -> List[str]:
+    """Distinct lowercase hashtags in a caption, in order of appearance"""
+    seen = dict.fromkeys(t.lower() for t in HASHTAG_PATTERN.findall(caption or ""))
+    return list(seen)[:MAX_TAGS_PER_POST]
+
+
+@dataclass
+class RelatedTag:
+    tag: str
+    npmi: float
+    posts: int
+    together: int
+
+
+class HashtagIndex:
+    """
+    Persistent sparse co-occurrence counts of hashtags seen together in fetched captions.
+    Pairs are stored in both directions so a lookup is a single primary-key range scan.
+    Relatedness is normalised PMI: log(p(a,b) / p(a)p(b)) / -log p(a,b), in [-1, 1].
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or settings.HASHTAG_INDEX_PATH
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def add_posts(self, posts: Iterable[tuple]) -> int:
+        """Index (media_pk, caption) pairs; posts already indexed are skipped. Returns posts added"""
+        added = 0
+        with self._connect() as conn:
+            conn.execute("BEGIN")
+            for media_pk, caption in posts:
+                tags = extract_caption_hashtags(caption)
+                if not tags:
+                    continue
+                if media_pk and conn.execute("INSERT OR IGNORE INTO posts VALUES (?)", (media_pk,)).rowcount == 0:
+                    continue
+                conn.executemany(
+                    "INSERT INTO tags VALUES (?, 1) ON CONFLICT (tag) DO UPDATE SET posts = posts + 1",
+                    [(t,) for t in tags],
+                )
+                conn.executemany(
+                    "INSERT INTO pairs VALUES (?, ?, 1) ON CONFLICT (tag, other) DO UPDATE SET posts = posts + 1",
+                    permutations(tags, 2),
+                )
+                added += 1
+            conn.execute("COMMIT")
+        return added
+
+    @staticmethod
+    def _total_posts(conn) -> int:
+        return conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+
+    def related(self, seeds: List[str], k: int = 10, direction: str = "related") -> List[RelatedTag]:
+        """
+        Tags that co-occur with the seeds, best first. direction="broader" keeps only tags used on
+        more posts than the seeds, "narrower" only tags used on fewer.
+        """
+        seeds = [s.strip().lstrip("#").lower() for s in seeds if s.strip()]
+        if not seeds:
+            return []
+        marks = ",".join("?" * len(seeds))
+        with self._connect() as conn:
+            n = max(self._total_posts(conn), 1)
+            seed_counts: Dict[str, int] = dict(conn.execute(f"SELECT tag, posts FROM tags WHERE tag IN ({marks})", seeds))
+            rows = conn.execute(
+                f"""
+                SELECT p.tag, p.other, p.posts, t.posts FROM pairs p JOIN tags t ON t.tag = p.other
+                WHERE p.tag IN ({marks}) AND p.posts >= ?
+                """,
+                (*seeds, MIN_PAIR_COUNT),
+            ).fetchall()
+
+        if not seed_counts:
+            return []
+        seed_level = sum(seed_counts.values()) / len(seed_counts)
+        scores: Dict[str, List[float]] = {}
+        meta: Dict[str, tuple] = {}
+        for seed, other, together, other_posts in rows:
+            if other in seed_counts:
+                continue
+            if direction == "broader" and other_posts <= seed_level:
+                continue
+            if direction == "narrower" and other_posts >= seed_level:
+                continue
+            p_ab = together / n
+            pmi = math.log(p_ab / ((seed_counts[seed] / n) * (other_posts / n)))
+            npmi = pmi / -math.log(p_ab) if p_ab < 1 else 1.0
+            scores.setdefault(other, []).append(npmi)
+            prev = meta.get(other, (other_posts, 0))
+            meta[other] = (other_posts, prev[1] + together)
+
+        # Average over all seeds (a seed it never co-occurred with counts as 0), so tags related
+        # to several seeds beat tags that happen to co-occur strongly with just one; tags no more
+        # likely than chance to appear with the seeds (NPMI <= 0) are dropped
+        ranked = sorted(
+            (RelatedTag(tag, sum(v) / len(seeds), *meta[tag]) for tag, v in scores.items() if sum(v) > 0),
+            key=lambda r: (-r.npmi, -r.together, r.tag),
+        )
+        return ranked[:k]
+
+
+@lru_cache(maxsize=None)
+def get_hashtag_index() -> HashtagIndex:
+    return HashtagIndex()
@@ -0,0 +1,136 @@
+import json
+import math
+import re
+import sqlite3
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+
+# Feature-hashed TF-IDF over unigrams + bigrams: no vocabulary to persist and no network.
+# crc32 rather than hash(), which is salted per process.
+VECTOR_DIM = 2 ** 12
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or our the this to with you your "
+    "we will all available now just more get".split()
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS campaigns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_info TEXT NOT NULL,
+    features TEXT NOT NULL,
+    hashtag_yields TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+def tokenize(text: str) -> List[str]:
+    words = [w for w in TOKEN_PATTERN.findall(text.lower()) if w not in STOPWORDS and len(w) > 1]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def hash_features(text: str) -> Dict[int, int]:
+    """Term counts keyed by hashed feature index"""
+    return dict(Counter(zlib.crc32(t.encode("utf-8")) % VECTOR_DIM for t in tokenize(text)))
+
+
+@dataclass
+class SimilarCampaign:
+    similarity: float
+    product_info: str
+    hashtag_yields: Dict[str, int]
+
+
+class ProductHashtagIndex:
+    """
+    Past campaigns' product descriptions, each mapped to the hashtags searched and how many
+    candidates every hashtag yielded. Queries embed the new product with the same hashed
+    TF-IDF and return the nearest past products by cosine similarity (one NumPy mat-vec).
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or settings.PRODUCT_INDEX_PATH
+        self._matrix: Optional[np.ndarray] = None  # cached raw term-frequency rows, one per campaign
+        self._rows: List[tuple] = []
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def record(self, product_info: str, hashtag_yields: Dict[str, int]):
+        """Remember which hashtags found how many candidates for this product"""
+        if not hashtag_yields:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO campaigns (product_info, features, hashtag_yields, created_at) VALUES (?, ?, ?, ?)",
+                (product_info, json.dumps(hash_features(product_info)), json.dumps(hashtag_yields), time.time()),
+            )
+
+    def _load(self):
+        """(Re)build the in-memory matrix when campaigns were recorded since the last load, by any process"""
+        with self._connect() as conn:
+            if self._matrix is not None and conn.execute("SELECT COUNT(*) FROM campaigns").fetchone()[0] == len(self._rows):
+                return
+            self._rows = conn.execute("SELECT product_info, features, hashtag_yields FROM campaigns ORDER BY id").fetchall()
+        matrix = np.zeros((len(self._rows), VECTOR_DIM), dtype=np.float32)
+        for i, (_, features, _) in enumerate(self._rows):
+            for index, count in json.loads(features).items():
+                matrix[i, int(index)] = count
+        self._matrix = matrix
+
+    def _tfidf(self, tf: np.ndarray, df: np.ndarray, n_docs: int) -> np.ndarray:
+        weighted = np.where(tf > 0, 1 + np.log(np.maximum(tf, 1)), 0) * (np.log((1 + n_docs) / (1 + df)) + 1)
+        norms = np.linalg.norm(weighted, axis=-1, keepdims=True)
+        return np.divide(weighted, norms, out=np.zeros_like(weighted), where=norms > 0)
+
+    def similar(self, product_info: str, k: int = 3) -> List[SimilarCampaign]:
+        self._load()
+        if not self._rows:
+            return []
+        query = np.zeros(VECTOR_DIM, dtype=np.float32)
+        for index, count in hash_features(product_info).items():
+            query[index] = count
+        df = np.count_nonzero(self._matrix, axis=0)
+        n_docs = len(self._rows)
+        sims = self._tfidf(self._matrix, df, n_docs) @ self._tfidf(query, df, n_docs)
+        top = np.argsort(-sims, kind="stable")[:k]
+        return [
+            SimilarCampaign(float(sims[i]), self._rows[i][0], json.loads(self._rows[i][2]))
+            for i in top if sims[i] > 0
+        ]
+
+    def suggest_hashtags(self, product_info: str, min_similarity: float, limit: int = 8) -> tuple:
+        """Proven hashtags from similar past products as (tags, best similarity); ([], 0) if none are close enough"""
+        neighbours = [c for c in self.similar(product_info, k=5) if c.similarity >= min_similarity]
+        if not neighbours:
+            return [], 0.0
+        scores: Dict[str, float] = {}
+        for campaign in neighbours:
+            for tag, found in campaign.hashtag_yields.items():
+                if found > 0:
+                    scores[tag] = scores.get(tag, 0.0) + campaign.similarity * math.log1p(found)
+        tags = sorted(scores, key=lambda t: (-scores[t], t))[:limit]
+        return tags, neighbours[0].similarity
+
+
+@lru_cache(maxsize=None)
+def get_product_index() -> ProductHashtagIndex:
+    return ProductHashtagIndex()
@@ -0,0 +1,330 @@
+import argparse
+import asyncio
+import re
+import sqlite3
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+from app.core.config import settings
+from pipeline.dm_creation_prompts import riddle_writer_prompt
+
+# Riddles are written offline in large batches per category (see __main__), validated and
+# deduplicated here, and handed to DMs round-robin so no user is ever asked the same riddle
+# twice. Writers receive the riddle instead of inventing one, and since its canonical answer
+# is stored, replies can be checked locally. An assignment only counts as asked once the DM
+# carrying it was sent (mark_sent), so replies are checked against the riddle the user got.
+CATEGORY_KEYWORDS = [
+    ("collectibles", ("collectible", "figur", "anime", "toy", "model kit", "trading card")),
+    ("fashion", ("fashion", "cloth", "apparel", "shoe", "sneaker", "jewel", "accessor")),
+    ("beauty", ("beauty", "skincare", "skin care", "cosmetic", "makeup", "fragrance")),
+    ("tech", ("tech", "electronic", "gadget", "computer", "phone", "gaming", "audio")),
+]
+CATEGORIES = [c for c, _ in CATEGORY_KEYWORDS] + ["general"]
+DIFFICULTIES = ("easy", "medium", "hard")
+
+RIDDLE_MAX_CHARS = 120
+ANSWER_MAX_WORDS = 3
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+ARTICLES = {"a", "an", "the"}
+LINK_OR_TAG = re.compile(r"https?://|www\.|[#@]\w", re.IGNORECASE)
+
+# Always in the bank, so template mode works before the first offline generation run
+SEED_RIDDLES = {
+    "collectibles": [
+        ("What do you call a collection that never gets old?", "collectibles"),
+        ("What has a head and a tail but no body?", "a coin"),
+        ("What stands on a shelf all day and never gets tired?", "a figure"),
+    ],
+    "general": [
+        ("What gets bigger the more you take away from it?", "a hole"),
+        ("What has hands but cannot clap?", "a clock"),
+        ("What has keys but can't open locks?", "a piano"),
+        ("What can you catch but not throw?", "a cold"),
+        ("What has to be broken before you can use it?", "an egg"),
+    ],
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS riddles (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    category TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    riddle TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    norm TEXT NOT NULL UNIQUE,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS riddles_by_category ON riddles (category, difficulty, id);
+CREATE TABLE IF NOT EXISTS riddle_assignments (
+    username TEXT NOT NULL,
+    riddle_id INTEGER NOT NULL,
+    context TEXT NOT NULL,
+    assigned_at REAL NOT NULL,
+    sent_at REAL,
+    PRIMARY KEY (username, riddle_id)
+);
+CREATE INDEX IF NOT EXISTS riddle_assignments_by_context ON riddle_assignments (username, context);
+CREATE TABLE IF NOT EXISTS riddle_cursors (
+    category TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    last_id INTEGER NOT NULL,
+    PRIMARY KEY (category, difficulty)
+);
+"""
+
+
+@dataclass
+class Riddle:
+    id: int
+    category: str
+    difficulty: str
+    riddle: str
+    answer: str
+
+
+class GeneratedRiddle(BaseModel):
+    riddle: str = Field(description="One short sentence ending with '?'")
+    answer: str = Field(description="Canonical answer, one to three words")
+
+
+class GeneratedRiddles(BaseModel):
+    riddles: List[GeneratedRiddle]
+
+
+def riddle_category(product_category: str, product_info: str = "") -> str:
+    text = f"{product_category} {product_info[:300]}".lower()
+    for category, keywords in CATEGORY_KEYWORDS:
+        if any(k in text for k in keywords):
+            return category
+    return "general"
+
+
+def _words(text: str) -> List[str]:
+    """Lowercase words without articles or a plural s, for comparing riddles and answers"""
+    words = [w for w in WORD_PATTERN.findall(text.lower()) if w not in ARTICLES]
+    return [w[:-1] if len(w) > 3 and w.endswith("s") else w for w in words]
+
+
+def validate_riddle(riddle: str, answer: str) -> List[str]:
+    """Deterministic checks on one generated riddle - returns a list of problems (empty if valid)"""
+    problems = []
+    riddle, answer = riddle.strip(), answer.strip()
+    if not riddle.endswith("?"):
+        problems.append("not a question")
+    if len(riddle) > RIDDLE_MAX_CHARS:
+        problems.append(f"too long ({len(riddle)} chars)")
+    if re.search(r"[.!?]\s", riddle):
+        problems.append("more than one sentence")
+    if LINK_OR_TAG.search(riddle) or LINK_OR_TAG.search(answer):
+        problems.append("contains a link, hashtag or mention")
+    answer_words = _words(answer)
+    if not answer_words or len(answer.split()) > ANSWER_MAX_WORDS:
+        problems.append("answer must be one to three words")
+    elif set(answer_words) <= set(_words(riddle)):
+        problems.append("answer given away in the riddle")
+    return problems
+
+
+def answer_matches(answer: str, reply: str) -> bool:
+    """Whether a reply contains the canonical answer (case, articles and plurals ignored)"""
+    wanted, said = _words(answer), _words(reply)
+    return bool(wanted) and any(said[i:i + len(wanted)] == wanted for i in range(len(said) - len(wanted) + 1))
+
+
+def riddle_instruction(riddle: Optional[Riddle]) -> str:
+    """Prompt section handing the writer its riddle (empty if the bank had none)"""
+    if riddle is None:
+        return ""
+    return f"\n\nRIDDLE (from the riddle bank - use exactly this riddle, do not invent another): {riddle.riddle}"
+
+
+class RiddleBank:
+    """Riddles with canonical answers by category and difficulty, plus which user was asked which"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or settings.RIDDLE_BANK_PATH
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(riddle_assignments)")}
+            if "sent_at" not in columns:
+                # Banks from before sent_at recorded assignments at send time
+                conn.execute("ALTER TABLE riddle_assignments ADD COLUMN sent_at REAL")
+                conn.execute("UPDATE riddle_assignments SET sent_at = assigned_at")
+        for category, riddles in SEED_RIDDLES.items():
+            self.add(category, "easy", riddles)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def add(self, category: str, difficulty: str, riddles: List[Tuple[str, str]]) -> int:
+        """Store valid riddles, skipping duplicates of each other or of stored ones; returns how many were new"""
+        rows, seen = [], set()
+        for riddle, answer in riddles:
+            norm = " ".join(_words(riddle))
+            if validate_riddle(riddle, answer) or norm in seen:
+                continue
+            seen.add(norm)
+            rows.append((category, difficulty, riddle.strip(), answer.strip(), norm, time.time()))
+        with self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO riddles (category, difficulty, riddle, answer, norm, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows,
+            )
+            return conn.total_changes - before
+
+    def riddles(self, category: str, difficulty: Optional[str] = None) -> List[Riddle]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, category, difficulty, riddle, answer FROM riddles "
+                "WHERE category = ? AND (? IS NULL OR difficulty = ?) ORDER BY id",
+                (category, difficulty, difficulty),
+            ).fetchall()
+        return [Riddle(*row) for row in rows]
+
+    def counts(self) -> Dict[Tuple[str, str], int]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT category, difficulty, COUNT(*) FROM riddles GROUP BY category, difficulty").fetchall()
+        return {(c, d): n for c, d, n in rows}
+
+    def _next_unused(self, conn, username: str, category: str, difficulty: Optional[str]) -> Optional[int]:
+        """Round-robin: the first riddle after this pool's cursor that the user hasn't had, wrapping around"""
+        key = difficulty or ""
+        row = conn.execute("SELECT last_id FROM riddle_cursors WHERE category = ? AND difficulty = ?", (category, key)).fetchone()
+        last_id = row[0] if row else 0
+        query = (
+            "SELECT id FROM riddles WHERE category = ? AND (? IS NULL OR difficulty = ?) AND id > ? "
+            "AND id NOT IN (SELECT riddle_id FROM riddle_assignments WHERE username = ?) ORDER BY id LIMIT 1"
+        )
+        found = conn.execute(query, (category, difficulty, difficulty, last_id, username)).fetchone() \
+            or conn.execute(query, (category, difficulty, difficulty, 0, username)).fetchone()
+        if found:
+            conn.execute("INSERT OR REPLACE INTO riddle_cursors VALUES (?, ?, ?)", (category, key, found[0]))
+        return found[0] if found else None
+
+    def assign_many(self, usernames: List[str], category: str, difficulty: str, context: str = "") -> Dict[str, Riddle]:
+        """
+        A riddle per user that they have never been asked. The same (user, context) - e.g. a retried
+        branch of the same campaign - gets its earlier riddle back. Users with nothing left are omitted.
+        """
+        context = format(zlib.crc32(context.encode("utf-8")), "08x")
+        pools = [(category, difficulty), ("general", difficulty), (category, None), ("general", None)]
+        assigned: Dict[str, int] = {}
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")  # cursor moves and assignments are atomic across processes
+            for username in usernames:
+                row = conn.execute(
+                    "SELECT riddle_id FROM riddle_assignments WHERE username = ? AND context = ?", (username, context)
+                ).fetchone()
+                riddle_id = row[0] if row else None
+                for pool_category, pool_difficulty in pools:
+                    if riddle_id is not None:
+                        break
+                    riddle_id = self._next_unused(conn, username, pool_category, pool_difficulty)
+                    if riddle_id is not None:
+                        conn.execute(
+                            "INSERT INTO riddle_assignments (username, riddle_id, context, assigned_at) VALUES (?, ?, ?, ?)",
+                            (username, riddle_id, context, time.time()),
+                        )
+                if riddle_id is not None:
+                    assigned[username] = riddle_id
+            conn.execute("COMMIT")
+            if not assigned:
+                return {}
+            rows = conn.execute(
+                f"SELECT id, category, difficulty, riddle, answer FROM riddles WHERE id IN ({','.join('?' * len(assigned))})",
+                list(assigned.values()),
+            ).fetchall()
+        by_id = {row[0]: Riddle(*row) for row in rows}
+        return {u: by_id[i] for u, i in assigned.items()}
+
+    def mark_sent(self, username: str, riddle_id: int):
+        """Record that the DM carrying this assigned riddle reached the user"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE riddle_assignments SET sent_at = ? WHERE username = ? AND riddle_id = ?",
+                (time.time(), username, riddle_id),
+            )
+
+    def last_sent(self, username: str) -> Optional[Riddle]:
+        """The riddle most recently sent to a user, if any (assigned but unsent riddles don't count)"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT r.id, r.category, r.difficulty, r.riddle, r.answer FROM riddle_assignments a "
+                "JOIN riddles r ON r.id = a.riddle_id WHERE a.username = ? AND a.sent_at IS NOT NULL "
+                "ORDER BY a.sent_at DESC LIMIT 1",
+                (username,),
+            ).fetchone()
+        return Riddle(*row) if row else None
+
+
+@lru_cache(maxsize=None)
+def get_riddle_bank() -> RiddleBank:
+    return RiddleBank()
+
+
+async def assign_riddles(usernames: List[str], product_info: str, product_category: str = "") -> Dict[str, Riddle]:
+    """Riddles for a DM branch, at the configured difficulty and the product's category"""
+    category = riddle_category(product_category, product_info)
+    return await asyncio.to_thread(
+        get_riddle_bank().assign_many, usernames, category, settings.RIDDLE_DIFFICULTY, product_info
+    )
+
+
+async def record_riddle_sent(username: str, riddle: Optional[Riddle]):
+    """Call after a DM carrying `riddle` was sent to the user"""
+    if riddle is not None:
+        await asyncio.to_thread(get_riddle_bank().mark_sent, username, riddle.id)
+
+
+async def generate_riddles(category: str, difficulty: str, count: int) -> int:
+    """Offline: fill the bank with up to `count` new riddles for a category, a batch per LLM call"""
+    from app.core.model_router import get_chat_model
+
+    bank = get_riddle_bank()
+    llm = get_chat_model("riddle_writer").with_structured_output(GeneratedRiddles)
+    added, attempts = 0, 0
+    max_attempts = 2 * -(-count // settings.RIDDLE_GENERATION_BATCH) + 1  # duplicates and rejects cost extra calls
+    while added < count and attempts < max_attempts:
+        attempts += 1
+        existing = [r.riddle for r in bank.riddles(category, difficulty)][-100:]
+        wanted = min(settings.RIDDLE_GENERATION_BATCH, count - added)
+        batch = await llm.ainvoke([
+            {"role": "system", "content": riddle_writer_prompt},
+            {"role": "user", "content": (
+                f"CATEGORY: {category}\nDIFFICULTY: {difficulty}\nWrite {wanted} new riddles."
+                + ("\n\nALREADY IN THE BANK (do not repeat or paraphrase):\n" + "\n".join(existing) if existing else "")
+            )},
+        ])
+        new = bank.add(category, difficulty, [(r.riddle, r.answer) for r in batch.riddles])
+        added += new
+        print(f"🧩 {category}/{difficulty}: {new} of {len(batch.riddles)} generated riddles kept ({added}/{count})")
+    return added
+
+
+async def generate_bank(categories: List[str], difficulty: str, count: int):
+    for category in categories:
+        await generate_riddles(category, difficulty, count)
+    for (category, level), n in sorted(get_riddle_bank().counts().items()):
+        print(f"{category}/{level}: {n} riddles")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate riddles for the riddle bank")
+    parser.add_argument("--category", action="append", choices=CATEGORIES, help="Repeatable; default: every category")
+    parser.add_argument("--difficulty", choices=DIFFICULTIES, default=settings.RIDDLE_DIFFICULTY)
+    parser.add_argument("--count", type=int, default=100, help="New riddles per category")
+    args = parser.parse_args()
+    asyncio.run(generate_bank(args.category or CATEGORIES, args.difficulty, args.count))
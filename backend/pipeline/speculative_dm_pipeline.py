@@ -0,0 +1,158 @@
+import asyncio
+from typing import List, Optional
+
+from langgraph.prebuilt import create_react_agent, ToolNode
+from pydantic import BaseModel, Field
+
+from app.core.config import settings
+from app.core.budget import record_result
+from app.core.model_router import get_chat_model
+from app.core.accounts import get_registry
+from app.services.instagram_client import client_for_target
+from app.services.throttle import ThrottledError, park_job, throttle_aware_tool_errors
+from pipeline.dm_creation_pipeline import has_enough_posts, known_posts_note, setup_instagram_tools
+from pipeline.dm_creation_prompts import (
+    draft_angles,
+    message_writer_prompt,
+    multi_draft_verifier_prompt,
+    profile_analyzer_prompt,
+)
+from pipeline.dm_preverifier import DraftContext, preverify, record_outcome
+from pipeline.riddle_bank import Riddle, assign_riddles, record_riddle_sent, riddle_instruction
+
+
+class DraftScore(BaseModel):
+    index: int = Field(description="Candidate number, starting from 0")
+    score: int = Field(description="Overall quality 1-10")
+    approved: bool
+    feedback: str = ""
+
+
+class DraftScores(BaseModel):
+    scores: List[DraftScore]
+
+
+class SpeculativeDMResult(BaseModel):
+    final_dm: str
+    target_user: str
+    verification_status: str
+    rounds: int
+
+
+async def analyze_profile(username: str, product_info: str, media_digest: Optional[List[str]] = None) -> str:
+    """Run the profile analyzer once; every draft in every round reuses its output"""
+    account = get_registry().account_for(username)
+    research = ["get_user_info"] if has_enough_posts(media_digest) else ["get_user_info", "get_user_posts"]
+    tools = await setup_instagram_tools(research, account)
+    analyzer = create_react_agent(
+        model=get_chat_model("profile_analyzer"),
+        tools=ToolNode(tools, handle_tool_errors=throttle_aware_tool_errors),
+        name="profile_analyzer",
+        prompt=profile_analyzer_prompt,
+    )
+    result = await analyzer.ainvoke({"messages": [{
+        "role": "user",
+        "content": f"Research @{username} for a personalized DM about this product:\n{product_info}"
+                   + known_posts_note(username, media_digest),
+    }]})
+    return result["messages"][-1].content
+
+
+async def write_drafts(username: str, product_info: str, analysis: str, k: int,
+                       feedback: Optional[str] = None, riddle: Optional[Riddle] = None) -> List[str]:
+    """Write k candidate DMs concurrently, each from a different opening angle"""
+    writer = get_chat_model("message_writer")
+    revision = f"\n\nPREVIOUS ROUND FEEDBACK (fix these issues):\n{feedback}" if feedback else ""
+
+    async def write(i: int) -> str:
+        angle = draft_angles[i % len(draft_angles)]
+        response = await writer.ainvoke([
+            {"role": "system", "content": message_writer_prompt},
+            {"role": "user", "content": (
+                f"TARGET USER: @{username}\n\nPRODUCT:\n{product_info}\n\nPROFILE ANALYSIS:\n{analysis}"
+                f"{riddle_instruction(riddle)}{revision}\n\nANGLE: {angle}\n\nReturn ONLY the DM text."
+            )},
+        ])
+        return response.content.strip()
+
+    return list(await asyncio.gather(*(write(i) for i in range(k))))
+
+
+async def score_drafts(username: str, analysis: str, drafts: List[str],
+                       context: Optional[DraftContext] = None) -> List[DraftScore]:
+    """
+    Score every candidate: the rule-based pre-verifier first, then one verifier call for the drafts
+    it couldn't settle. Rule breakers score 0 with the rules as feedback; if a draft clearly passes,
+    the LLM verifier isn't called at all.
+    """
+    verdicts = [preverify(d, context) for d in drafts]
+    outcomes = [record_outcome(v) for v in verdicts]
+    rejected = [
+        DraftScore(index=i, score=0, approved=False, feedback="; ".join(v.problems()))
+        for i, v in enumerate(verdicts) if not v.passed
+    ]
+    if "approved" in outcomes:
+        best = max((i for i, o in enumerate(outcomes) if o == "approved"), key=lambda i: verdicts[i].confidence)
+        return rejected + [DraftScore(index=best, score=10, approved=True)]
+    uncertain = [i for i, o in enumerate(outcomes) if o == "llm"]
+    if not uncertain:
+        return rejected
+
+    verifier = get_chat_model("verifier").with_structured_output(DraftScores)
+    candidates = "\n\n".join(f"CANDIDATE {n}:\n{drafts[i]}" for n, i in enumerate(uncertain))
+    result = await verifier.ainvoke([
+        {"role": "system", "content": multi_draft_verifier_prompt},
+        {"role": "user", "content": f"TARGET USER: @{username}\n\nPROFILE ANALYSIS:\n{analysis}\n\n{candidates}"},
+    ])
+    # Back from positions in the verifier's list to indices into drafts
+    return rejected + [
+        s.model_copy(update={"index": uncertain[s.index]}) for s in result.scores if 0 <= s.index < len(uncertain)
+    ]
+
+
+async def speculative_dm_creation(username: str, product_info: str, k: Optional[int] = None,
+                                  max_rounds: Optional[int] = None,
+                                  media_digest: Optional[List[str]] = None, product_category: str = "") -> SpeculativeDMResult:
+    """
+    Speculative drafting: analyze once, write k drafts in parallel, verify all k in one call and
+    send the best approved draft. Only if none pass is another round written, using the feedback.
+    """
+    k = k or settings.SPECULATIVE_DRAFTS
+    max_rounds = max_rounds or settings.SPECULATIVE_MAX_ROUNDS
+
+    analysis, riddles = await asyncio.gather(
+        analyze_profile(username, product_info, media_digest), assign_riddles([username], product_info, product_category)
+    )
+    riddle = riddles.get(username)
+    context = DraftContext(riddle.riddle if riddle else "", "\n".join(media_digest or []) + f"\n{analysis}", product_info)
+
+    feedback = None
+    best: Optional[DraftScore] = None
+    for round_number in range(1, max_rounds + 1):
+        drafts = await write_drafts(username, product_info, analysis, k, feedback, riddle)
+        scores = await score_drafts(username, analysis, drafts, context)
+        if not scores:
+            continue
+
+        best = max(scores, key=lambda s: (s.approved, s.score))
+        if best.approved:
+            try:
+                await client_for_target(username).send_message(username, drafts[best.index])
+            except ThrottledError as e:
+                # Keep the approved draft; a worker sends it once the account's pause is over
+                payload = {"username": username, "message": drafts[best.index], "riddle_id": riddle.id if riddle else None}
+                record_result(username, await park_job("send_dm", payload, username, e))
+                return SpeculativeDMResult(
+                    final_dm=drafts[best.index], target_user=username, verification_status="parked", rounds=round_number
+                )
+            await record_riddle_sent(username, riddle)
+            record_result(username, f"SUCCESS: @{username}: {drafts[best.index][:100]}...")
+            print(f"📩 Sent speculative draft to @{username} after {round_number} round(s)")
+            return SpeculativeDMResult(
+                final_dm=drafts[best.index], target_user=username, verification_status="approved", rounds=round_number
+            )
+        feedback = "\n".join(f"- {s.feedback}" for s in sorted(scores, key=lambda s: -s.score) if s.feedback)
+
+    # Never send a draft the verifier didn't approve
+    best_score = best.score if best else "n/a"
+    raise RuntimeError(f"No approved draft after {max_rounds} rounds (best score {best_score})")
@@ -0,0 +1,99 @@
+import asyncio
+import re
+import zlib
+from typing import Dict, List, Optional
+
+from app.core.budget import record_result
+from app.services.instagram_client import client_for_target
+from app.services.throttle import ThrottledError, park_job
+from pipeline.batch_dm_pipeline import BatchDM, validate_batch_dm
+from pipeline.dm_creation_prompts import dm_templates, riddle_format
+from pipeline.riddle_bank import Riddle, assign_riddles, record_riddle_sent, riddle_category
+
+
+# Template mode: no LLM at all. Every DM is a template from dm_templates with its slots filled
+# from what discovery already knows about the user, so thousands of DMs are built in
+# milliseconds; the same deterministic checks as fast mode run before anything is sent.
+# Riddles come from the riddle bank, in the same categories as the templates.
+
+DIGEST_LINE = re.compile(r"^- (?:\d{4}-\d{2}-\d{2}: )?")
+TAG_OR_MENTION = re.compile(r"[#@]\w+")
+LINKISH = re.compile(r"https?://\S+|www\.\S+", re.IGNORECASE)
+DETAIL_SPLIT = re.compile(r"[.!?\n|•]")
+DETAIL_MAX_WORDS = 8
+HOOK_MAX_CHARS = 70
+
+
+def caption_detail(media_digest: Optional[List[str]]) -> Optional[str]:
+    """A short, quotable snippet from their latest caption (no hashtags, mentions or links), or None"""
+    for line in media_digest or []:
+        text = LINKISH.sub("", TAG_OR_MENTION.sub("", DIGEST_LINE.sub("", line)))
+        clause = DETAIL_SPLIT.split(text.strip())[0]
+        words = [w for w in clause.split() if any(c.isalnum() for c in w)]
+        if len(words) >= 2:
+            return " ".join(words[:DETAIL_MAX_WORDS]).replace('"', "'")
+    return None
+
+
+def display_name(username: str, full_name: Optional[str]) -> str:
+    first = (full_name or "").split()[0] if (full_name or "").strip() else ""
+    return first if first.isalpha() else username
+
+
+def product_hook(product_title: str) -> str:
+    """'the <product>' cut down to its main name: the part before any ' -- ' / ' | ' suffix, at most ~70 chars"""
+    title = re.split(r"\s+(?:--|–|—|\||-)\s+", product_title.strip())[0]
+    if len(title) > HOOK_MAX_CHARS:
+        title = title[:HOOK_MAX_CHARS].rsplit(" ", 1)[0]
+    return f"the {title.strip(' ,;:')}"
+
+
+def _pick(options: list, username: str, salt: str):
+    """Deterministic per user, so a retried branch renders the same DM"""
+    return options[zlib.crc32(f"{salt}:{username}".encode("utf-8")) % len(options)]
+
+
+def render_template_dm(username: str, category: str, hook: str, riddle: Riddle,
+                       media_digest: Optional[List[str]] = None, full_name: Optional[str] = None) -> BatchDM:
+    templates = dm_templates.get(category, dm_templates["general"])
+    detail = caption_detail(media_digest)
+    body = _pick(templates["detail"] if detail else templates["plain"], username, "template")
+    text = body.format(name=display_name(username, full_name), detail=detail or "", hook=hook)
+    return BatchDM(
+        username=username, dm=f"{text} {riddle_format.format(riddle=riddle.riddle)}",
+        riddle=riddle.riddle, riddle_answer=riddle.answer,
+    )
+
+
+async def template_dm_creation(usernames: List[str], product_title: str, product_category: str = "",
+                               product_info: str = "", media_digests: Optional[Dict[str, List[str]]] = None,
+                               full_names: Optional[Dict[str, str]] = None) -> List[str]:
+    """Template mode: render, check and send one DM per user. Returns dm_results entries"""
+    media_digests = media_digests or {}
+    full_names = full_names or {}
+    category = riddle_category(product_category, product_info)
+    hook = product_hook(product_title)
+    riddles = await assign_riddles(usernames, product_info, product_category)
+
+    async def send(username: str) -> str:
+        return record_result(username, await render_and_send(username))
+
+    async def render_and_send(username: str) -> str:
+        if username not in riddles:
+            return f"FAIL: @{username}: Failed - no unused riddle left in the riddle bank"
+        dm = render_template_dm(username, category, hook, riddles[username], media_digests.get(username), full_names.get(username))
+        problems = validate_batch_dm(dm)
+        if problems:
+            return f"FAIL: @{username}: Failed - {'; '.join(problems)}"
+        try:
+            await client_for_target(username).send_message(username, dm.dm)
+            await record_riddle_sent(username, riddles[username])
+            return f"SUCCESS: @{username}: {dm.dm[:100]}..."
+        except ThrottledError as e:
+            payload = {"username": username, "message": dm.dm, "riddle_id": riddles[username].id}
+            return await park_job("send_dm", payload, username, e)
+        except Exception as e:
+            return f"FAIL: @{username}: Failed - {str(e)}"
+
+    # Sends to different sender accounts run concurrently; each account's throttle paces its own
+    return list(await asyncio.gather(*(send(u) for u in usernames)))
@@ -1,19 +1,20 @@
 import asyncio
 import os
+from contextlib import aclosing
 from typing import Dict, Any, List
 from langgraph.prebuilt import create_react_agent
 from langgraph.graph import MessagesState
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import convert_to_messages
 from langchain_core.tools import tool
 from pydantic import BaseModel
 
-from get_tags import fetch_hashtag_usernames
+from get_tags import fetch_follower_counts, stream_hashtag_medias
+from app.core.config import settings
+from app.core.model_router import get_chat_model
+from app.core.accounts import get_registry
+from pipeline.candidate_ranking import CandidatePool, current_feed, current_pool
+from pipeline.hashtag_index import get_hashtag_index
 
-MODEL = "o4-mini"
-PROVIDER = "openai"
-
-hashtag_llm = ChatOpenAI(model=MODEL)
 
 
 class FoundUsers(BaseModel):
@@ -42,39 +43,93 @@ def extract_hashtags(product_info: str, context: str = "") -> str:
     Return only hashtags separated by commas, WITHOUT # (hashtag) symbols REMOVE ANY HASHTAGS THAT CONTAIN SYMBOLS OR EMOJIS ETC., especially '/'.
     """
     
-    response = hashtag_llm.invoke(prompt)
+    response = get_chat_model("hashtag_extractor").invoke(prompt)
     return response.content.strip()
 
 @tool 
-def find_instagram_users(hashtags: str) -> str:
+async def find_instagram_users(hashtags: str) -> str:
     """Find Instagram usernames who posted with given hashtags.
     
     Args:
         hashtags: Comma separated string of hashtags (WITHOUT # symbol)
     """
-    hashtag_list = [tag.strip() for tag in hashtags.split(",")]
-    users = fetch_hashtag_usernames(
+    hashtag_list = [tag.strip() for tag in hashtags.split(",") if tag.strip()]
+    discovery_account = get_registry().default
+    target = settings.USER_FINDER_TARGET_CANDIDATES
+
+    # Stream posts tag by tag and stop fetching as soon as this search found enough users
+    records, users = [], set()
+    stream = stream_hashtag_medias(
         hashtags=hashtag_list,
         max_posts=10,
-        username="instamcp2", 
-        password="Password1."
+        username=discovery_account.username, 
+        password=discovery_account.password
     )
-    
+    async with aclosing(stream):
+        async for record in stream:
+            records.append(record)
+            users.add(record.username)
+            if len(users) >= target:
+                break
+    searched = hashtag_list.index(records[-1].hashtag) + 1 if len(users) >= target else len(hashtag_list)
+
+    # Captions carry real co-occurring hashtags - index them for suggest_related_hashtags
+    await asyncio.to_thread(get_hashtag_index().add_posts, [(r.media_pk, r.caption) for r in records])
+
+    # Candidates from every call of this campaign are ranked together
+    pool = current_pool.get()
+    if pool is None:
+        pool = CandidatePool()
+    pool.add(records, hashtag_list[:searched])
+    await asyncio.to_thread(enrich_followers, pool, discovery_account)
+    ranked = pool.rank(settings.USER_FINDER_TOP_K)
+    feed = current_feed.get()
+    if feed is not None:
+        feed.offer(pool)
+
     # Provide rich feedback for the agent to reason about
-    user_count = len(users)
-    # if user_count < 10:
-    #     return f"Found only {user_count} users with hashtags '{hashtags}'. These hashtags might be too specific or niche. \nUsers found: {users}"
-    # elif user_count > 100:
-    #     return f"Found {user_count} users with hashtags '{hashtags}'. These hashtags might be too broad - consider more specific ones. \nUsers found: {users}"
+    top = ", ".join(f"{c.username} ({c.score:.2f})" for c in ranked)
+    if searched < len(hashtag_list):
+        found = f"Found {len(users)} users from the first {searched} of {len(hashtag_list)} hashtags (stopped early - that is enough)"
+    else:
+        found = f"Found {len(users)} users with hashtags '{hashtags}'"
+    return f"{found} ({len(pool)} candidates so far). Top ranked: {top}. "
 
-    return f"Found {user_count} users with hashtags '{hashtags}': {', '.join(list(users)[:15])}{'...' if user_count > 15 else ''}. "
+
+@tool
+def suggest_related_hashtags(seed_hashtags: str, direction: str = "related") -> str:
+    """Suggest real hashtags that co-occur with the seeds in posts we've already fetched. Instant, no LLM call.
+
+    Args:
+        seed_hashtags: Comma separated hashtags (WITHOUT # symbol) to start from
+        direction: "broader" (more popular tags, for when too few users were found),
+            "narrower" (less popular tags, for when results were too broad) or "related"
+    """
+    seeds = [tag.strip() for tag in seed_hashtags.split(",") if tag.strip()]
+    related = get_hashtag_index().related(seeds, k=10, direction=direction)
+    if not related:
+        return f"No co-occurrence data for '{seed_hashtags}' yet - use extract_hashtags instead."
+    return f"{direction.capitalize()} hashtags for '{seed_hashtags}': " + ", ".join(
+        f"{r.tag} (score {r.npmi:.2f}, {r.posts} posts)" for r in related
+    )
+
+
+def enrich_followers(pool: CandidatePool, account):
+    """Look up follower counts for the current top candidates we don't have yet (they feed the follower band)"""
+    lookups = settings.USER_FINDER_FOLLOWER_LOOKUPS
+    if lookups <= 0:
+        return
+    missing = {c.username: pool.user_pks[c.username] for c in pool.rank(lookups) if c.username not in pool.followers}
+    if missing:
+        for name, count in fetch_follower_counts(missing, account.username, account.password).items():
+            pool.set_followers(name, count)
 
 
 def create_user_finder_agent():
     # Enhanced agent prompt
     user_finder_agent = create_react_agent(
-        model=f"{PROVIDER}:{MODEL}",
-        tools=[extract_hashtags, find_instagram_users],
+        model=get_chat_model("user_finder"),
+        tools=[extract_hashtags, find_instagram_users, suggest_related_hashtags],
         name="user_finder",
         response_format=FoundUsers,
         prompt="""You find Instagram users for marketing campaigns. 
@@ -86,9 +141,11 @@ Your process:
 But you need to make this analysis IN THE CONTEXT of the product in question. For example, a more niche product demands more niche hashtags, even if not many users are found.
 Whereas a very wide-appeal product can afford to have more broad hashtags.
 
-Keep track of what you've tried and learn from the feedback. When calling extract_hashtags again, pass plenty of context about what happened before so it can adjust strategy.
+Keep track of what you've tried and learn from the feedback. To refine hashtags that were too broad or too specific, first try suggest_related_hashtags with direction "narrower" or "broader" - it is an instant lookup over hashtags real posts use together. Only call extract_hashtags again (passing plenty of context about what happened before) if it has no suggestions.
+
+Candidates are ranked automatically (hashtag coverage, recency, engagement, follower band), so you don't need to judge individual users - only whether the hashtags fit the product.
 
-Goal: Find 5 relevant potential customers. DO NOT go back and forth between your tools more than 3 times; if you still believe you have too many or too little after third, just stop anyway and return 5 usernames (or less, if you have <5)"""
+Goal: Find 5 relevant potential customers. DO NOT go back and forth between your tools more than 3 times; if you still believe you have too many or too little after third, just stop anyway and return the 5 top ranked usernames (or less, if you have <5)"""
     )
 
     return user_finder_agent
\ No newline at end of file